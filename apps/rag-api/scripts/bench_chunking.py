@@ -0,0 +1,62 @@
+"""
+Benchmark: streaming chunker (app.chunking.iter_chunks) vs the original whole-document
+chunk_text. Reports wall time and peak traced Python/NumPy memory.
+
+    cd apps/rag-api && PYTHONPATH=src python scripts/bench_chunking.py [MB ...]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+
+from app.chunking import _chunk_text_reference, iter_chunks
+
+CHUNK_TOKENS = 400
+OVERLAP = 60
+
+
+def _corpus(mb: float, rng: random.Random) -> str:
+    words = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10)))
+        for _ in range(5000)
+    ]
+    paras, size = [], 0
+    while size < mb * 1e6:
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(6, 25))).capitalize() + "."
+            for _ in range(rng.randint(2, 8))
+        ]
+        paras.append(" ".join(sentences))
+        size += len(paras[-1]) + 2
+    return "\n\n".join(paras)
+
+
+def _measure(fn):
+    # timed untraced; tracemalloc slows allocation-heavy code, so memory is a second run
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+if __name__ == "__main__":
+    sizes = [float(a) for a in sys.argv[1:]] or [1, 10, 50]
+    rng = random.Random(0)
+    print(f"{'MB':>5} {'impl':>10} {'chunks':>8} {'seconds':>9} {'peak MB':>9}")
+    for mb in sizes:
+        text = _corpus(mb, rng)
+        runs = {
+            "original": lambda: len(_chunk_text_reference(text, CHUNK_TOKENS, OVERLAP)),
+            "streaming": lambda: sum(1 for _ in iter_chunks(text, CHUNK_TOKENS, OVERLAP)),
+            "+sentence": lambda: sum(
+                1 for _ in iter_chunks(text, CHUNK_TOKENS, OVERLAP, snap="sentence")
+            ),
+        }
+        for name, fn in runs.items():
+            n, secs, peak = _measure(fn)
+            print(f"{mb:>5g} {name:>10} {n:>8} {secs:>9.2f} {peak / 1e6:>9.1f}")
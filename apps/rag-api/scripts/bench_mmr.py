@@ -0,0 +1,42 @@
+"""
+Micro-benchmark: NumPy MMR (app.rerank.mmr) vs the original pure-Python loop.
+
+    cd apps/rag-api && PYTHONPATH=src python scripts/bench_mmr.py
+"""
+
+import random
+import time
+
+from app.rerank import _mmr_reference, mmr
+
+DIM = 1536
+K = 6
+
+
+def _rand_vecs(n: int, rng: random.Random) -> list[list[float]]:
+    return [[rng.gauss(0.0, 1.0) for _ in range(DIM)] for _ in range(n)]
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    print(f"{'n':>6} {'python ms':>12} {'numpy ms':>12} {'speedup':>9}  same order")
+    for n in (18, 100, 1000):
+        q = _rand_vecs(1, rng)[0]
+        cands = _rand_vecs(n, rng)
+        ref = _mmr_reference(q, cands, K)
+        new = mmr(q, cands, K)
+        t_ref = _best_of(lambda: _mmr_reference(q, cands, K), 3 if n < 1000 else 1)
+        t_new = _best_of(lambda: mmr(q, cands, K), 20)
+        print(
+            f"{n:>6} {t_ref * 1e3:>12.2f} {t_new * 1e3:>12.2f} "
+            f"{t_ref / t_new:>8.1f}x  {ref == new}"
+        )
@@ -0,0 +1,522 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .manifest import get_manifest
+
+log = logging.getLogger(__name__)
+
+
+def _embed_key(model: str, dim: int, text: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"{model}\x00{dim}\x00".encode("utf-8"))
+    h.update(text.encode("utf-8", errors="surrogatepass"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: key = sha256(model, dim, text).
+    Tier 1 is an in-process LRU of float32 blobs, tier 2 a SQLite table on disk.
+    The disk tier is evicted least-recently-used first once it grows past `disk_bytes`.
+    """
+
+    def __init__(self, path: Path, mem_items: int = 10000, disk_bytes: int = 1024 * 1024 * 1024):
+        self.path = Path(path)
+        self.mem_items = max(0, int(mem_items))
+        self.disk_bytes = max(0, int(disk_bytes))
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_mem = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evicted = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vec BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used)")
+        self._con.commit()
+        row = self._con.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()
+        self._disk_used = int(row[0])
+
+    # --- memory tier -------------------------------------------------------
+    def _mem_get(self, key: str) -> Optional[bytes]:
+        blob = self._mem.get(key)
+        if blob is not None:
+            self._mem.move_to_end(key)
+        return blob
+
+    def _mem_put(self, key: str, blob: bytes) -> None:
+        if self.mem_items == 0:
+            return
+        self._mem[key] = blob
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+
+    # --- public API --------------------------------------------------------
+    def get_many(self, model: str, dim: int, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [_embed_key(model, dim, t) for t in texts]
+        blobs: List[Optional[bytes]] = [None] * len(keys)
+        with self._lock:
+            pending: Dict[str, List[int]] = {}
+            for i, k in enumerate(keys):
+                blob = self._mem_get(k)
+                if blob is not None:
+                    blobs[i] = blob
+                    self.hits_mem += 1
+                else:
+                    pending.setdefault(k, []).append(i)
+
+            if pending:
+                found = self._disk_get(list(pending))
+                for k, blob in found.items():
+                    self._mem_put(k, blob)
+                    for i in pending.pop(k):
+                        blobs[i] = blob
+                        self.hits_disk += 1
+                self.misses += sum(len(v) for v in pending.values())
+
+        return [None if b is None else np.frombuffer(b, dtype=np.float32).tolist() for b in blobs]
+
+    def put_many(self, model: str, dim: int, texts: List[str], vecs: List[List[float]]) -> None:
+        if not texts:
+            return
+        now = time.time()
+        rows = []
+        with self._lock:
+            for t, v in zip(texts, vecs):
+                k = _embed_key(model, dim, t)
+                blob = np.asarray(v, dtype=np.float32).tobytes()
+                self._mem_put(k, blob)
+                rows.append((k, blob, len(blob), now))
+            if self.disk_bytes == 0:
+                return
+            added = self._con.execute(
+                "SELECT COALESCE(SUM(nbytes), 0) FROM embeddings WHERE key IN (%s)"
+                % ",".join("?" * len(rows)),
+                [r[0] for r in rows],
+            ).fetchone()[0]
+            self._con.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, vec, nbytes, last_used) VALUES (?,?,?,?)",
+                rows,
+            )
+            self._disk_used += sum(r[2] for r in rows) - int(added)
+            self._con.commit()
+            if self._disk_used > self.disk_bytes:
+                self._evict(target=int(self.disk_bytes * 0.9))
+
+    def stats(self) -> Dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits_mem + self.hits_disk + self.misses
+            return {
+                "hits_mem": self.hits_mem,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_mem + self.hits_disk) / lookups if lookups else 0.0,
+                "mem_items": len(self._mem),
+                "disk_bytes": self._disk_used,
+                "evicted": self.evicted,
+            }
+
+    # --- disk tier ---------------------------------------------------------
+    def _disk_get(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        # stay well under SQLITE_MAX_VARIABLE_NUMBER
+        for s in range(0, len(keys), 500):
+            part = keys[s : s + 500]
+            cur = self._con.execute(
+                "SELECT key, vec FROM embeddings WHERE key IN (%s)" % ",".join("?" * len(part)),
+                part,
+            )
+            found.update({k: bytes(v) for k, v in cur.fetchall()})
+        if found:
+            now = time.time()
+            self._con.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+            )
+            self._con.commit()
+        return found
+
+    def _evict(self, target: int) -> None:
+        while self._disk_used > target:
+            victims = self._con.execute(
+                "SELECT key, nbytes FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not victims:
+                self._disk_used = 0
+                break
+            freed = 0
+            drop = []
+            for k, n in victims:
+                drop.append((k,))
+                freed += int(n)
+                if self._disk_used - freed <= target:
+                    break
+            self._con.executemany("DELETE FROM embeddings WHERE key = ?", drop)
+            self._con.commit()
+            self._disk_used -= freed
+            self.evicted += len(drop)
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _embedding_cache
+    if not settings.EMBED_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                Path(settings.DATA_DIR) / "embed_cache.db",
+                mem_items=settings.EMBED_CACHE_MEM_ITEMS,
+                disk_bytes=settings.EMBED_CACHE_DISK_MB * 1024 * 1024,
+            )
+        return _embedding_cache
+
+
+class OcrCache:
+    """
+    OCR text keyed by the SHA-256 of the page image bytes. Shared on disk by the extraction
+    worker processes (each opens its own connection), so a re-ingest skips tesseract.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS ocr ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._con.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._con.execute("SELECT text FROM ocr WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, text: str) -> None:
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO ocr(key, text, created_at) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+
+
+_ocr_cache: Optional[OcrCache] = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OcrCache]:
+    # one per process: extraction workers are spawned, so each builds its own
+    global _ocr_cache
+    if not settings.OCR_CACHE_ENABLED:
+        return None
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OcrCache(Path(settings.DATA_DIR) / "ocr_cache.db")
+        return _ocr_cache
+
+
+_GEN_KEY = "rag:corpus_gen"
+
+
+class RetrievalCache:
+    """
+    Ranked retrieval results keyed by sha256(corpus generation, normalized query, top_k,
+    retrieval/rerank params). Tier 1 is an in-process LRU, tier 2 an optional Redis shared
+    by all workers. The generation is bumped on every index write, so results computed
+    against an older corpus are never served again; they just age out of the LRU and
+    expire in Redis. Without Redis the generation lives in the manifest, which every
+    process on the same DATA_DIR shares.
+    """
+
+    def __init__(self, mem_items: int = 2048, redis_url: Optional[str] = None, ttl_s: int = 3600):
+        self.mem_items = max(0, int(mem_items))
+        self.ttl_s = int(ttl_s)
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._redis: Any = None
+        if redis_url:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(redis_url, decode_responses=True)
+        self.hits_mem = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    # --- corpus generation -------------------------------------------------
+    async def _redis_generation(self, incr: bool = False) -> int:
+        # a missing counter (fresh or flushed Redis) starts from the clock, so it can never
+        # fall back onto generations still held in some worker's memory tier
+        await self._redis.set(_GEN_KEY, int(time.time() * 1000), nx=True)
+        if incr:
+            return int(await self._redis.incr(_GEN_KEY))
+        return int(await self._redis.get(_GEN_KEY))
+
+    async def generation(self) -> Optional[int]:
+        """Current corpus generation, or None when it cannot be read (then: do not cache)."""
+        try:
+            if self._redis is not None:
+                return await self._redis_generation()
+            return await asyncio.to_thread(get_manifest().generation)
+        except Exception as e:
+            log.warning("corpus generation unavailable: %s", e)
+            return None
+
+    async def bump(self) -> None:
+        await asyncio.to_thread(get_manifest().bump_generation)
+        if self._redis is not None:
+            await self._redis_generation(incr=True)
+
+    @staticmethod
+    def key(generation: int, query: str, top_k: int, params: Dict[str, Any]) -> str:
+        raw = json.dumps([generation, query, top_k, params], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- lookups -----------------------------------------------------------
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # values are kept as JSON so a caller mutating its result cannot poison the cache
+        raw = self._mem.get(key)
+        if raw is not None:
+            self._mem.move_to_end(key)
+            self.hits_mem += 1
+            return json.loads(raw)
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(f"rag:retrieval:{key}")
+            except Exception as e:
+                log.warning("retrieval cache redis get failed: %s", e)
+            if raw is not None:
+                self._mem_put(key, raw)
+                self.hits_redis += 1
+                return json.loads(raw)
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        raw = json.dumps(value)
+        self._mem_put(key, raw)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"rag:retrieval:{key}", raw, ex=self.ttl_s)
+            except Exception as e:
+                log.warning("retrieval cache redis set failed: %s", e)
+
+    def _mem_put(self, key: str, raw: str) -> None:
+        if self.mem_items == 0:
+            return
+        self._mem[key] = raw
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.hits_mem + self.hits_redis + self.misses
+        return {
+            "hits_mem": self.hits_mem,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "hit_rate": (self.hits_mem + self.hits_redis) / lookups if lookups else 0.0,
+            "mem_items": len(self._mem),
+        }
+
+
+_retrieval_cache: Optional[RetrievalCache] = None
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    global _retrieval_cache
+    if not settings.RETRIEVAL_CACHE_ENABLED:
+        return None
+    if _retrieval_cache is None:
+        _retrieval_cache = RetrievalCache(
+            mem_items=settings.RETRIEVAL_CACHE_MEM_ITEMS,
+            redis_url=settings.REDIS_URL if settings.RETRIEVAL_CACHE_REDIS else None,
+            ttl_s=settings.RETRIEVAL_CACHE_TTL_S,
+        )
+    return _retrieval_cache
+
+
+async def corpus_generation() -> Optional[int]:
+    cache = get_retrieval_cache()
+    if cache is not None:
+        return await cache.generation()
+    try:
+        return await asyncio.to_thread(get_manifest().generation)
+    except Exception as e:
+        log.warning("corpus generation unavailable: %s", e)
+        return None
+
+
+async def close_retrieval_cache() -> None:
+    global _retrieval_cache
+    if _retrieval_cache is not None and _retrieval_cache._redis is not None:
+        await _retrieval_cache._redis.aclose()
+    _retrieval_cache = None
+
+
+async def bump_corpus_generation() -> None:
+    """Invalidate every cached retrieval result; called after each index write or delete."""
+    cache = get_retrieval_cache()
+    try:
+        if cache is not None:
+            await cache.bump()
+        else:
+            await asyncio.to_thread(get_manifest().bump_generation)
+    except Exception as e:
+        log.warning("could not bump corpus generation: %s", e)
+
+
+class SemanticAnswerCache:
+    """
+    Generated answers, served again for a question whose embedding is within `threshold`
+    cosine similarity of a cached one and that was answered from the same chunk ids in the
+    same order (one bucket per list, since the answer's [n] markers follow that order).
+    Entries live for `ttl_s` and only for the corpus generation they were made under.
+    In-process: a miss in another worker costs one completion.
+    """
+
+    _BUCKET_ITEMS = 32
+
+    def __init__(self, threshold: float = 0.95, ttl_s: int = 900, max_items: int = 1024):
+        self.threshold = float(threshold)
+        self.ttl_s = float(ttl_s)
+        self.max_items = max(0, int(max_items))
+        # bucket key -> [(unit query vector, created_at, answer)], least recently used first
+        self._buckets: "OrderedDict[str, List[Tuple[np.ndarray, float, Dict[str, Any]]]]" = (
+            OrderedDict()
+        )
+        self._size = 0
+        self._generation = -1
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def context_key(model: str, chunk_ids: List[Any]) -> str:
+        # ordered: an answer's [n] markers number the chunks in the order they were given
+        raw = json.dumps([model, [str(c) for c in chunk_ids]])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _sync_generation(self, generation: int) -> bool:
+        # a newer corpus drops everything; a request that read an older one is not served
+        if generation > self._generation:
+            self._buckets.clear()
+            self._size = 0
+            self._generation = generation
+        return generation == self._generation
+
+    def _prune(self, context_key: str, now: float) -> None:
+        # drop the bucket's expired entries, and the bucket itself once it is empty
+        bucket = self._buckets.get(context_key)
+        if bucket is None:
+            return
+        live = [e for e in bucket if now - e[1] < self.ttl_s]
+        self.expired += len(bucket) - len(live)
+        self._size -= len(bucket) - len(live)
+        if live:
+            bucket[:] = live
+        else:
+            del self._buckets[context_key]
+
+    def get(
+        self, generation: int, context_key: str, qvec: List[float]
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(answer, similarity) of the closest live entry above the threshold, else None."""
+        bucket = None
+        if self._sync_generation(generation):
+            self._prune(context_key, time.time())
+            bucket = self._buckets.get(context_key)
+        if not bucket:
+            self.misses += 1
+            return None
+        q = _unit(qvec)
+        sims = np.stack([e[0] for e in bucket]) @ q
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            self.misses += 1
+            return None
+        self._buckets.move_to_end(context_key)
+        self.hits += 1
+        return json.loads(json.dumps(bucket[best][2])), float(sims[best])
+
+    def put(
+        self, generation: int, context_key: str, qvec: List[float], answer: Dict[str, Any]
+    ) -> None:
+        if self.max_items == 0 or not self._sync_generation(generation):
+            return
+        now = time.time()
+        self._prune(context_key, now)
+        # least recently used buckets are the likeliest to have expired: sweep from the front
+        # until a bucket with a live entry (entries are appended, so the last is the newest)
+        while self._buckets:
+            oldest, entries = next(iter(self._buckets.items()))
+            if now - entries[-1][1] < self.ttl_s:
+                break
+            self._prune(oldest, now)
+        bucket = self._buckets.setdefault(context_key, [])
+        bucket.append((_unit(qvec), now, answer))
+        self._size += 1
+        if len(bucket) > self._BUCKET_ITEMS:
+            bucket.pop(0)
+            self._size -= 1
+        self._buckets.move_to_end(context_key)
+        while self._size > self.max_items:
+            _, dropped = self._buckets.popitem(last=False)
+            self._size -= len(dropped)
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "items": self._size,
+            "context_sets": len(self._buckets),
+            "generation": self._generation,
+        }
+
+
+def _unit(vec: List[float]) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        _answer_cache = SemanticAnswerCache(
+            threshold=settings.ANSWER_CACHE_SIMILARITY,
+            ttl_s=settings.ANSWER_CACHE_TTL_S,
+            max_items=settings.ANSWER_CACHE_ITEMS,
+        )
+    return _answer_cache
@@ -1,8 +1,32 @@
+import functools
+import re
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
 import tiktoken
-from typing import List
+
+from .config import settings
 
 _enc = tiktoken.get_encoding("cl100k_base")
 
+# Where a chunk may end when snapping: the match end is the first char of the next unit
+_SNAP = {
+    "paragraph": re.compile(r"\n[ \t]*\n\s*"),
+    "sentence": re.compile(r"[.!?][\"')\]]*(?=\s)|\n[ \t]*\n\s*"),
+}
+# Segment cut points, best first; only the back half of a segment is searched
+_SEGMENT_BREAKS = ("\f", "\n\n", "\n", " ")
+
+
+class Chunk(NamedTuple):
+    index: int
+    text: str
+    n_tokens: int
+    char_start: int = 0
+    char_end: int = 0
+
 
 def tokenize(s: str) -> List[int]:
     return _enc.encode(s)
@@ -12,15 +36,182 @@ def detokenize(ids: List[int]) -> str:
     return _enc.decode(ids)
 
 
+def tokenize_batch(texts: List[str]) -> List[List[int]]:
+    # special-token text is encoded as plain text, never rejected
+    if not texts:
+        return []
+    return _enc.encode_ordinary_batch(texts, num_threads=max(1, settings.CHUNK_TOKENIZE_THREADS))
+
+
+@functools.lru_cache(maxsize=1)
+def _token_nbytes() -> np.ndarray:
+    # byte length of every token id, so token -> text offsets are a lookup + cumsum
+    out = np.zeros(_enc.max_token_value + 1, dtype=np.int64)
+    for t in range(len(out)):
+        try:
+            out[t] = len(_enc.decode_single_token_bytes(t))
+        except KeyError:
+            pass
+    return out
+
+
+def _cut(text: str, start: int, size: int) -> int:
+    for sep in _SEGMENT_BREAKS:
+        j = text.rfind(sep, start + size // 2, start + size)
+        if j != -1:
+            return j + len(sep)
+    return start + size
+
+
+def _segments(text: Union[str, Iterable[str]], size: int) -> Iterator[str]:
+    """
+    Cut `text` into pieces of about `size` chars, preferring page, paragraph, line and
+    word breaks. An iterable (e.g. iter_file) is consumed piece by piece, so the whole
+    document never has to be in memory.
+    """
+    carry = ""
+    for piece in (text,) if isinstance(text, str) else text:
+        carry += piece
+        start = 0
+        while len(carry) - start > size:
+            cut = _cut(carry, start, size)
+            yield carry[start:cut]
+            start = cut
+        carry = carry[start:]
+    if carry:
+        yield carry
+
+
+def iter_file(path: Path, piece_chars: int = 1 << 20) -> Iterator[str]:
+    # A normalized text file as a stream of pieces, for iter_chunks
+    with path.open(encoding="utf-8", errors="replace") as f:
+        while piece := f.read(piece_chars):
+            yield piece
+
+
+def _char_offsets(seg: str, ids: List[int]) -> Tuple[str, np.ndarray]:
+    """
+    Char offset of each token of `seg`, plus len(seg) as a final entry. Tokens that start
+    inside a multi-byte char map to that char (same rule as tiktoken's decode_with_offsets).
+    """
+    offs = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(_token_nbytes()[np.asarray(ids, dtype=np.int64)], out=offs[1:])
+    if seg.isascii():
+        return seg, offs
+    try:
+        raw = seg.encode("utf-8")
+    except UnicodeEncodeError:
+        # lone surrogates: tiktoken encoded the U+FFFD-replaced text, so buffer that instead
+        seg = seg.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        raw = seg.encode("utf-8")
+    char_of_byte = np.cumsum((np.frombuffer(raw, dtype=np.uint8) & 0xC0) != 0x80) - 1
+    offs[:-1] = char_of_byte[offs[:-1]]
+    offs[-1] = len(seg)
+    return seg, offs
+
+
+def iter_chunks(
+    text: Union[str, Iterable[str]],
+    chunk_tokens: int = 400,
+    overlap: int = 60,
+    snap: Optional[str] = None,
+) -> Iterator[Chunk]:
+    """
+    Lazily yield overlapping windows of `chunk_tokens` tokens, each with its token count
+    and [char_start, char_end) offsets into the text.
+
+    The text is tokenized in segments of about CHUNK_SEGMENT_CHARS, CHUNK_TOKENIZE_THREADS
+    at a time on tiktoken's batch encoder; only the current segment group and the
+    unfinished window are held, and chunk text is sliced from the input rather than
+    decoded again. Segments are cut at paragraph/line breaks, so tokens can differ from
+    whole-text encoding only at those seams.
+
+    `snap="sentence"` or `"paragraph"` ends each window at the last such boundary in its
+    back half (when there is one) and starts the next at the first boundary inside the
+    overlap; boundaries are found per segment as it is tokenized.
+    """
+    if snap is not None and snap not in _SNAP:
+        raise ValueError(f"snap must be one of {sorted(_SNAP)} or None")
+    pattern = _SNAP.get(snap) if snap else None
+    threads = max(1, settings.CHUNK_TOKENIZE_THREADS)
+    min_cut = max(1, chunk_tokens // 2)
+
+    toks = np.zeros(0, dtype=np.int64)  # buffered tokens
+    offs = np.zeros(1, dtype=np.int64)  # absolute char offset per buffered token, + end
+    brk = np.zeros(0, dtype=bool)  # token starts a sentence/paragraph
+    buf, base = "", 0  # buffered text; buf[0] is at absolute char `base`
+    i = 0  # next window start, index into the buffer
+    idx = 0
+
+    def window(final: bool) -> Chunk:
+        end = min(i + chunk_tokens, len(toks))
+        if pattern is not None and not (final and end == len(toks)):
+            cand = np.flatnonzero(brk[i + min_cut : end + 1])
+            if cand.size:
+                end = i + min_cut + int(cand[-1])
+        s, e = int(offs[i]), int(offs[end])
+        return Chunk(idx, buf[s - base : e - base], end - i, s, e)
+
+    def next_start(n: int) -> int:
+        start = max(i + 1, i + n - overlap)
+        if pattern is not None:
+            # begin the overlap on a boundary too (at worst the previous window's end)
+            hits = np.flatnonzero(brk[start : i + n + 1])
+            if hits.size:
+                start += int(hits[0])
+        return start
+
+    segs = _segments(text, max(1, settings.CHUNK_SEGMENT_CHARS))
+    while True:
+        group = list(islice(segs, threads))
+        if not group:
+            break
+        for seg, ids in zip(group, _enc.encode_ordinary_batch(group, num_threads=threads)):
+            if not ids:
+                continue
+            seg, seg_offs = _char_offsets(seg, ids)
+            if pattern is not None:
+                cuts = [m.end() for m in pattern.finditer(seg)]
+                at = np.searchsorted(seg_offs[:-1], cuts)
+                seg_brk = np.zeros(len(ids), dtype=bool)
+                seg_brk[at[at < len(ids)]] = True
+                brk = np.concatenate([brk, seg_brk])
+            toks = np.concatenate([toks, ids])
+            offs = np.concatenate([offs[:-1], seg_offs + offs[-1]])
+            buf += seg
+
+            # emit every window that is known not to be the last one
+            while len(toks) - i > chunk_tokens:
+                c = window(final=False)
+                yield c
+                idx += 1
+                i = next_start(c.n_tokens)
+            # drop what no future window can reach
+            keep = int(offs[i])
+            buf, base = buf[keep - base :], keep
+            toks, offs, brk = toks[i:], offs[i:], brk[i:]
+            i = 0
+
+    while i < len(toks):
+        c = window(final=True)
+        yield c
+        idx += 1
+        if i + c.n_tokens >= len(toks):
+            break
+        i = next_start(c.n_tokens)
+
+
 def chunk_text(text: str, chunk_tokens: int = 400, overlap: int = 60) -> List[str]:
+    return [c.text for c in iter_chunks(text, chunk_tokens=chunk_tokens, overlap=overlap)]
+
+
+def _chunk_text_reference(text: str, chunk_tokens: int = 400, overlap: int = 60) -> List[str]:
+    # Original whole-document version, kept for the benchmark
     ids = tokenize(text)
-    if not ids:
-        return []
     chunks = []
     i = 0
     step = max(1, chunk_tokens - overlap)
     while i < len(ids):
-        piece = ids[i : i + chunk_tokens]
-        chunks.append(detokenize(piece))
+        chunks.append(detokenize(ids[i : i + chunk_tokens]))
         i += step
     return chunks
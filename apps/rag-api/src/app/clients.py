@@ -0,0 +1,56 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+# Process-wide OpenAI clients. Each owns an HTTP connection pool, so build them once
+# instead of per request.
+_sync_client: Optional["OpenAI"] = None
+_async_client: Optional["AsyncOpenAI"] = None
+_lock = threading.Lock()
+
+
+def _client_kwargs() -> dict:
+    kw: dict = {"api_key": settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")}
+    if settings.OPENAI_BASE_URL:
+        kw["base_url"] = settings.OPENAI_BASE_URL
+    return kw
+
+
+def openai_client() -> "OpenAI":
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            from openai import OpenAI
+
+            _sync_client = OpenAI(**_client_kwargs())
+        return _sync_client
+
+
+def async_openai_client() -> "AsyncOpenAI":
+    """
+    Shared AsyncOpenAI client. Retries are left to the callers (max_retries=0) so they can
+    apply their own backoff and concurrency limits.
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            from openai import AsyncOpenAI
+
+            _async_client = AsyncOpenAI(max_retries=0, **_client_kwargs())
+        return _async_client
+
+
+async def close_clients() -> None:
+    global _sync_client, _async_client
+    with _lock:
+        sync_c, async_c = _sync_client, _async_client
+        _sync_client = _async_client = None
+    if sync_c is not None:
+        sync_c.close()
+    if async_c is not None:
+        await async_c.close()
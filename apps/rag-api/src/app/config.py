@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 from pathlib import Path
+from typing import Dict, Optional
 import os
 import sys
 
@@ -10,17 +11,96 @@ class Settings(BaseSettings):
     DATA_DIR: Path = Field(default=Path(os.getenv("DATA_DIR", "./data")))
     MAX_UPLOAD_MB: int = 25
 
+    # Extraction / OCR process pool (0 workers = run in a thread, e.g. for local dev)
+    EXTRACT_WORKERS: int = Field(default=2)
+    EXTRACT_PAGES_PER_JOB: int = Field(default=8)
+    EXTRACT_TIMEOUT_S: float = Field(default=120.0)
+    # Spreadsheets/CSV: streamed in batches of rows, written as header-prefixed row groups
+    TABLE_BATCH_ROWS: int = Field(default=10000)
+    TABLE_GROUP_CHARS: int = Field(default=800)  # ~300 tokens: one group per chunk
+    TABLE_EXTRACT_TIMEOUT_S: float = Field(default=900.0)
+    # PDF pages with less extractable text than this are OCR'd from their embedded images
+    PDF_OCR_FALLBACK: bool = Field(default=True)
+    PDF_OCR_MIN_CHARS: int = Field(default=16)
+    OCR_CACHE_ENABLED: bool = Field(default=True)
+
     # OpenAI
     OPENAI_API_KEY: str = Field(default="")
+    OPENAI_BASE_URL: str = Field(default="")  # empty = api.openai.com
     CHAT_MODEL: str = Field(default="gpt-4o-mini")
     EMBEDDING_MODEL: str = Field(default="text-embedding-3-small")
+    EMBEDDING_DIM: int = Field(default=1536)
+
+    # Answer streaming: heartbeat after this much upstream silence; buffered deltas per stream
+    STREAM_HEARTBEAT_S: float = Field(default=15.0)
+    STREAM_QUEUE_MAX: int = Field(default=64)
+
+    # Async embedding client: query embeddings arriving within the window share one request
+    EMBED_BATCH_WINDOW_MS: float = Field(default=5.0)
+    EMBED_BATCH_MAX_ITEMS: int = Field(default=256)
+    EMBED_MAX_CONCURRENCY: int = Field(default=8)
+    EMBED_MAX_RETRIES: int = Field(default=4)
+
+    # Indexing (/embed): batches sized by token budget, several in flight at once
+    EMBED_BATCH_TOKENS: int = Field(default=32000)
+    EMBED_BATCH_ITEMS: int = Field(default=2048)  # API cap on inputs per request
+    EMBED_INDEX_CONCURRENCY: int = Field(default=4)
+
+    # Embedding cache (in-process LRU in front of a SQLite store under DATA_DIR)
+    EMBED_CACHE_ENABLED: bool = Field(default=True)
+    EMBED_CACHE_MEM_ITEMS: int = Field(default=10000)
+    EMBED_CACHE_DISK_MB: int = Field(default=1024)
+
+    # Retrieval result cache (in-process LRU, plus Redis at REDIS_URL when enabled); entries
+    # are keyed by the corpus generation, which every index write bumps
+    RETRIEVAL_CACHE_ENABLED: bool = Field(default=True)
+    RETRIEVAL_CACHE_MEM_ITEMS: int = Field(default=2048)
+    RETRIEVAL_CACHE_REDIS: bool = Field(default=False)
+    RETRIEVAL_CACHE_TTL_S: int = Field(default=3600)
+
+    # Semantic answer cache (in-process): reuse an answer for a question embedding within
+    # ANSWER_CACHE_SIMILARITY (cosine) of a cached one, answered from the same chunk ids
+    ANSWER_CACHE_ENABLED: bool = Field(default=True)
+    ANSWER_CACHE_SIMILARITY: float = Field(default=0.95)
+    ANSWER_CACHE_TTL_S: int = Field(default=900)
+    ANSWER_CACHE_ITEMS: int = Field(default=1024)
 
     # Qdrant
     QDRANT_URL: str = Field(default="http://localhost:6333")
+    QDRANT_PREFER_GRPC: bool = Field(default=True)
+    QDRANT_GRPC_PORT: int = Field(default=6334)
+    QDRANT_UPSERT_BATCH: int = Field(default=256)  # points per upsert request
+    QDRANT_UPSERT_CONCURRENCY: int = Field(default=4)
+    # Collection profile, applied on startup (created, or migrated in place with
+    # update_collection): "float" (plain float32), "int8" (scalar quantization, 4x less RAM
+    # per vector with originals on disk) or "binary" (32x; needs more oversampling).
+    # Recall of a quantized profile depends on the embeddings: measure it on the real
+    # collection with scripts/check_qdrant_profile.py before switching production over.
+    QDRANT_PROFILE: str = Field(default="float")
+    # original vectors memory-mapped from disk; unset = on disk for quantized profiles
+    # (only the quantized copy stays in RAM), in RAM for "float"
+    QDRANT_ON_DISK: Optional[bool] = Field(default=None)
+    QDRANT_ON_DISK_PAYLOAD: bool = Field(default=True)  # Qdrant's own default
+    QDRANT_QUANT_ALWAYS_RAM: bool = Field(default=True)  # keep the quantized vectors in RAM
+    QDRANT_QUANT_OVERSAMPLING: float = Field(default=2.0)
+    QDRANT_QUANT_RESCORE: bool = Field(default=True)  # rescore candidates at full precision
+    QDRANT_HNSW_M: int = Field(default=16)
+    QDRANT_HNSW_EF_CONSTRUCT: int = Field(default=100)
+    QDRANT_HNSW_EF: int = Field(default=0)  # search-time ef, 0 = server default
 
     # Redis
     REDIS_URL: str = Field(default="redis://localhost:6379/0")
 
+    # Background ingestion jobs ("sqlite" = in-process queue in DATA_DIR, "redis" = shared)
+    JOB_QUEUE: str = Field(default="sqlite")
+    INGEST_WORKERS: int = Field(default=2)
+    INGEST_EXTRACT_CONCURRENCY: int = Field(default=2)
+    INGEST_INDEX_CONCURRENCY: int = Field(default=2)
+    INGEST_MAX_ATTEMPTS: int = Field(default=3)
+    # a running job's lease is renewed while its worker is alive; once it lapses the job is
+    # re-queued (worker died), by the periodic recovery or by a resubmission
+    INGEST_LEASE_S: float = Field(default=60.0)
+
     # MinIO
     MINIO_ENDPOINT: str = Field(default="http://localhost:9000")
     MINIO_ACCESS_KEY: str = Field(default="minioadmin")
@@ -32,10 +112,28 @@ class Settings(BaseSettings):
     # Python Debug
     PYTHONASYNCIODEBUG: str = Field(default="0")
 
+    # SQLite FTS (hybrid.db under DATA_DIR)
+    FTS_MMAP_MB: int = Field(default=256)
+    FTS_CACHE_MB: int = Field(default=64)
+    FTS_MERGE_EVERY_ROWS: int = Field(default=20000)  # incremental merge cadence, 0 = off
+
+    # Chunking: text is tokenized in segments of about this many chars, N at a time
+    CHUNK_SEGMENT_CHARS: int = Field(default=65536)
+    CHUNK_TOKENIZE_THREADS: int = Field(default=4)
+
     # Retrieval Settings
     TOPK_VEC: int = Field(default=20)
     TOPK_BM25: int = Field(default=50)
     FUSION_TOPK: int = Field(default=6)
+    # Per-retriever RRF weight and k (JSON in env, e.g. FUSION_WEIGHTS='{"dense": 1.2}')
+    FUSION_WEIGHTS: Dict[str, float] = Field(default={"dense": 1.0, "keyword": 1.0})
+    FUSION_RRF_K: Dict[str, int] = Field(default={"dense": 60, "keyword": 60})
+    QUERY_BATCH_MAX: int = Field(default=1000)  # queries per /query_batch, /query_hybrid_batch
+
+    # Prompt context packing (app.context): token budget for snippet text, near-dup cutoff
+    CONTEXT_TOKEN_BUDGET: int = Field(default=3000)
+    CONTEXT_DEDUP_JACCARD: float = Field(default=0.85)
+    CONTEXT_MIN_SNIPPET_TOKENS: int = Field(default=64)
 
     # Reranking Settings
     RERANK_METHOD: str = Field(default="mmr")
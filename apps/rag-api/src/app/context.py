@@ -0,0 +1,145 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from .chunking import detokenize, tokenize_batch
+from .config import settings
+
+# Longest chunk overlap looked for when a hit carries no char offsets
+_MAX_OVERLAP_CHARS = 4000
+_WORD = re.compile(r"\w+")
+
+
+def _overlap(a: str, b: str) -> int:
+    # length of the longest suffix of `a` that is also a prefix of `b`
+    probe = b[:16]
+    if not probe:
+        return 0
+    lo = max(0, len(a) - _MAX_OVERLAP_CHARS)
+    p = a.find(probe, lo)
+    while p != -1:
+        if b.startswith(a[p:]):
+            return len(a) - p
+        p = a.find(probe, p + 1)
+    return 0
+
+
+def _tail(prev: Dict[str, Any], cur: Dict[str, Any]) -> str:
+    # the part of `cur` (the chunk right after `prev`) that `prev` does not already contain
+    text = cur.get("text") or ""
+    end, start = prev.get("char_end"), cur.get("char_start")
+    if isinstance(end, int) and isinstance(start, int):
+        return text[max(0, end - start) :]
+    return text[_overlap(prev.get("text") or "", text) :]
+
+
+def _merge_runs(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge hits that are consecutive chunks of the same document into one snippet, placed
+    at the rank of its best-ranked member. Hits without doc_id/chunk_index stay as they are.
+    """
+    by_doc: Dict[Any, Dict[int, int]] = {}  # doc -> chunk_index -> rank
+    for rank, c in enumerate(contexts):
+        if c.get("doc_id") is not None and isinstance(c.get("chunk_index"), int):
+            by_doc.setdefault(c["doc_id"], {}).setdefault(c["chunk_index"], rank)
+
+    runs: Dict[int, List[int]] = {}  # best rank -> member ranks, in chunk order
+    for idx_rank in by_doc.values():
+        run: List[int] = []
+        for idx in sorted(idx_rank):
+            if run and idx != contexts[run[-1]]["chunk_index"] + 1:
+                runs[min(run)] = run
+                run = []
+            run.append(idx_rank[idx])
+        runs[min(run)] = run
+    merged_away = {r for members in runs.values() for r in members} - set(runs)
+
+    out = []
+    for rank, c in enumerate(contexts):
+        if rank in merged_away:
+            continue
+        members = [contexts[r] for r in runs.get(rank, ())]
+        if len(members) > 1:
+            text = (members[0].get("text") or "") + "".join(
+                _tail(prev, cur) for prev, cur in zip(members, members[1:])
+            )
+            c = dict(
+                c,
+                text=text,
+                chunk_index=members[0]["chunk_index"],
+                chunk_indices=[m["chunk_index"] for m in members],
+                char_start=members[0].get("char_start"),
+                char_end=members[-1].get("char_end"),
+            )
+        out.append(c)
+    return out
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {hash(tuple(words[i : i + n])) for i in range(len(words) - n + 1)}
+
+
+def pack_contexts(
+    contexts: List[Dict[str, Any]],
+    budget_tokens: Optional[int] = None,
+    dedup_jaccard: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Turn ranked retrieval hits into the snippets that go into a prompt:
+    - consecutive chunks of one document are merged and their overlap removed;
+    - a snippet whose word-trigram Jaccard similarity to a better-ranked one reaches
+      `dedup_jaccard` is dropped;
+    - snippets are kept in rank order while their text fits `budget_tokens` (tiktoken
+      counts); the first one that does not fit is cut to the remaining budget.
+    Each snippet gets its citation number `n` (1.., rank order) and `n_tokens`; the same
+    input always yields the same numbering, so prompt markers and citations agree.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    threshold = settings.CONTEXT_DEDUP_JACCARD if dedup_jaccard is None else dedup_jaccard
+
+    merged = _merge_runs(contexts)
+    kept: List[Dict[str, Any]] = []
+    seen: List[set] = []
+    for c in merged:
+        text = (c.get("text") or "").strip()
+        if not text:
+            continue
+        sh = _shingles(text)
+        if any(len(sh & s) / max(1, len(sh | s)) >= threshold for s in seen):
+            continue
+        seen.append(sh)
+        kept.append(dict(c, text=text))
+
+    token_ids = tokenize_batch([c["text"] for c in kept])
+    out: List[Dict[str, Any]] = []
+    left = budget
+    for c, ids in zip(kept, token_ids):
+        if left <= 0:
+            break
+        if len(ids) > left:
+            if out and left < settings.CONTEXT_MIN_SNIPPET_TOKENS:
+                break
+            ids = ids[:left]
+            c = dict(c, text=detokenize(ids), truncated=True)
+        left -= len(ids)
+        out.append(dict(c, n=len(out) + 1, n_tokens=len(ids)))
+    return out
+
+
+def render_snippets(packed: List[Dict[str, Any]]) -> List[str]:
+    return [f"[{c['n']}] {c['text']}\n(Source: {c.get('source_path')})" for c in packed]
+
+
+def citations(packed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "n": c["n"],
+            "source_path": c.get("source_path"),
+            "doc_id": c.get("doc_id"),
+            "chunk_index": c.get("chunk_index"),
+            "chunk_indices": c.get("chunk_indices") or [c.get("chunk_index")],
+        }
+        for c in packed
+    ]
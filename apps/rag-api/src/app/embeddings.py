@@ -1,14 +1,218 @@
-import os
-from typing import List
+import asyncio
+import random
+from typing import Any, Dict, List, Optional, Tuple
 
+from .caching import EmbeddingCache, get_embedding_cache
+from .clients import async_openai_client, openai_client
+from .config import settings
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    from openai import OpenAI
 
-    _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    _MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# output size of each model when no `dimensions` is requested
+NATIVE_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+def dimensions_kw(model: str, dim: int) -> Dict[str, int]:
+    # text-embedding-3 models return shortened vectors when asked; the parameter is only
+    # sent when EMBEDDING_DIM differs from the native size, as older models reject it
+    return {} if NATIVE_DIMS.get(model) == dim else {"dimensions": dim}
+
 
+def _embed_remote(texts: List[str]) -> List[List[float]]:
+    model, dim = settings.EMBEDDING_MODEL, settings.EMBEDDING_DIM
+    resp = openai_client().embeddings.create(model=model, input=texts, **dimensions_kw(model, dim))
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
     if not texts:
         return []
-    resp = _client.embeddings.create(model=_MODEL, input=texts)
-    return [d.embedding for d in resp.data]
+
+    cache = get_embedding_cache()
+    if cache is None:
+        return _embed_remote(texts)
+
+    model, dim = settings.EMBEDDING_MODEL, settings.EMBEDDING_DIM
+    out = cache.get_many(model, dim, texts)
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        # only send each distinct uncached string once
+        uniq = list(dict.fromkeys(texts[i] for i in missing))
+        vecs = _embed_remote(uniq)
+        cache.put_many(model, dim, uniq, vecs)
+        by_text = dict(zip(uniq, vecs))
+        for i in missing:
+            out[i] = by_text[texts[i]]
+    return out  # type: ignore[return-value]
+
+
+def _retryable(exc: BaseException) -> bool:
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(exc, APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+class AsyncEmbedder:
+    """
+    Long-lived embedding service on one pooled AsyncOpenAI client.
+
+    - `embed_query` coalesces single-string requests from concurrent callers: everything
+      that arrives within `window_ms` (or until `max_batch` strings are pending) goes out as
+      one embeddings call.
+    - `embed` sends a ready-made batch straight through (indexing path).
+    Both share a concurrency limit, the embedding cache, and retry with jittered
+    exponential backoff on 429 / 5xx / connection errors.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        model: Optional[str] = None,
+        dim: Optional[int] = None,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self._client = client
+        self.model = model or settings.EMBEDDING_MODEL
+        self.dim = dim or settings.EMBEDDING_DIM
+        self.window = (
+            settings.EMBED_BATCH_WINDOW_MS if window_ms is None else float(window_ms)
+        ) / 1000
+        self.max_batch = max_batch or settings.EMBED_BATCH_MAX_ITEMS
+        self.max_retries = settings.EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.cache = cache
+        self._sem = asyncio.Semaphore(max_concurrency or settings.EMBED_MAX_CONCURRENCY)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self.requests = 0
+        self.retries = 0
+        self.coalesced = 0
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = async_openai_client()
+        return self._client
+
+    # --- public API --------------------------------------------------------
+    async def embed_query(self, text: str) -> List[float]:
+        if self.cache is not None:
+            hit = (await asyncio.to_thread(self.cache.get_many, self.model, self.dim, [text]))[0]
+            if hit is not None:
+                return hit
+
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        if self.cache is not None:
+            out = await asyncio.to_thread(self.cache.get_many, self.model, self.dim, texts)
+        missing = [i for i, v in enumerate(out) if v is None]
+        if missing:
+            uniq = list(dict.fromkeys(texts[i] for i in missing))
+            vecs = await self._request(uniq)
+            by_text = dict(zip(uniq, vecs))
+            for i in missing:
+                out[i] = by_text[texts[i]]
+        return out  # type: ignore[return-value]
+
+    async def aclose(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "retries": self.retries, "coalesced": self.coalesced}
+
+    # --- internals ---------------------------------------------------------
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        uniq = list(dict.fromkeys(t for t, _ in batch))
+        self.coalesced += len(batch)
+        try:
+            vecs = await self._request(uniq)
+            by_text = dict(zip(uniq, vecs))
+            for t, fut in batch:
+                if not fut.done():
+                    fut.set_result(by_text[t])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.cancel()
+
+    async def _request(self, texts: List[str]) -> List[List[float]]:
+        delay = 0.2
+        attempt = 0
+        while True:
+            try:
+                async with self._sem:
+                    self.requests += 1
+                    resp = await self.client.embeddings.create(
+                        model=self.model, input=texts, **dimensions_kw(self.model, self.dim)
+                    )
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not _retryable(e):
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay * (1.0 + random.random()))
+                delay = min(delay * 2, 8.0)
+        vecs = [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_many, self.model, self.dim, texts, vecs)
+        return vecs
+
+
+_embedder: Optional[AsyncEmbedder] = None
+
+
+def get_embedder() -> AsyncEmbedder:
+    # created lazily inside the running loop (the semaphore and timers bind to it)
+    global _embedder
+    if _embedder is None:
+        _embedder = AsyncEmbedder(cache=get_embedding_cache())
+    return _embedder
+
+
+async def close_embedder() -> None:
+    global _embedder
+    if _embedder is not None:
+        await _embedder.aclose()
+        _embedder = None
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional
+
+from .config import settings
+from .extractors import (
+    TABLE_KINDS,
+    DocType,
+    extract_pdf_pages,
+    extract_pptx_slides,
+    extract_text,
+    needs_ocr,
+    ocr_pdf_page,
+    page_count,
+    write_table_text,
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+# one slot per worker, per event loop: jobs are only submitted once a worker is free
+_slots: Optional[asyncio.Semaphore] = None
+_slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Kinds that can be split into page/slide ranges and extracted by several workers at once
+_PAGED: dict[str, Callable[..., List[str]]] = {
+    # OCR of scanned pages is fanned out separately, one page per job
+    "pdf": functools.partial(extract_pdf_pages, ocr=False),
+    "pptx": extract_pptx_slides,
+}
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def start_pool() -> None:
+    global _pool
+    if _pool is None and settings.EXTRACT_WORKERS > 0:
+        # spawn, not fork: the API process has live threads (thread pool, SQLite, HTTP pools)
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _executor() -> Optional[Executor]:
+    # None = the loop's default thread pool (EXTRACT_WORKERS=0)
+    if _pool is None:
+        start_pool()
+    return _pool
+
+
+def _worker_slots() -> asyncio.Semaphore:
+    global _slots, _slots_loop
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots_loop is not loop:
+        n = settings.EXTRACT_WORKERS or min(32, (os.cpu_count() or 1) + 4)  # thread pool size
+        _slots, _slots_loop = asyncio.Semaphore(max(1, n)), loop
+    return _slots
+
+
+async def _run(fn: Callable, *args, timeout: Optional[float] = None):
+    """
+    Run `fn(*args)` on the extraction pool. The job is submitted only when a worker slot is
+    free, so the timeout measures the job itself rather than time spent queued behind
+    other pages. The slot is held until the worker is really done, even after a timeout.
+    """
+    loop = asyncio.get_running_loop()
+    timeout = settings.EXTRACT_TIMEOUT_S if timeout is None else timeout
+    slots = _worker_slots()
+    await slots.acquire()
+    try:
+        fut = loop.run_in_executor(_executor(), fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    fut.add_done_callback(lambda _: slots.release())
+    try:
+        return await asyncio.wait_for(asyncio.shield(fut), timeout)
+    except asyncio.TimeoutError:
+        # the worker keeps running to completion; we only stop waiting for it
+        raise ExtractionTimeout(f"{getattr(fn, '__name__', fn)} exceeded {timeout}s")
+
+
+async def _gather(jobs: List[Awaitable[Any]]) -> List[Any]:
+    # like gather, but the first failure or timeout cancels the jobs still waiting for a slot
+    tasks = [asyncio.ensure_future(j) for j in jobs]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def extract_async(path: Path, kind: DocType) -> str:
+    """
+    extract_text() off the event loop. PDFs and slide decks are split into ranges of
+    EXTRACT_PAGES_PER_JOB pages that run on separate workers and are reassembled in order;
+    PDF pages without a text layer are then OCR'd one page per job. Every job is bounded
+    by EXTRACT_TIMEOUT_S from when a worker picks it up; one failure cancels the rest.
+    """
+    paged = _PAGED.get(kind)
+    if paged is None:
+        return await _run(extract_text, path, kind)
+
+    n = await _run(page_count, path, kind)
+    per_job = max(1, settings.EXTRACT_PAGES_PER_JOB)
+    jobs = [_run(paged, path, s, min(s + per_job, n)) for s in range(0, n, per_job)]
+    pages = [t for part in await _gather(jobs) for t in part]
+    if kind == "pdf":
+        scanned = [i for i, t in enumerate(pages) if needs_ocr(t)]
+        ocr = await _gather([_run(ocr_pdf_page, path, i) for i in scanned])
+        for i, t in zip(scanned, ocr):
+            pages[i] = t or pages[i]
+    return "\n".join(pages).strip()
+
+
+async def extract_to_file(path: Path, kind: DocType, dest: Path) -> str:
+    """
+    Extract `path` into the text file `dest` (replaced atomically) and return the SHA-256
+    of the text. Tables are streamed to disk by the worker itself, so a large workbook is
+    never held as one string in either process.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".part")
+    try:
+        if kind in TABLE_KINDS:
+            sha = await _run(
+                write_table_text, path, kind, tmp, timeout=settings.TABLE_EXTRACT_TIMEOUT_S
+            )
+        else:
+            text = await extract_async(path, kind)
+            await asyncio.to_thread(tmp.write_text, text, encoding="utf-8")
+            sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return sha
@@ -1,13 +1,22 @@
+import hashlib
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Literal
+from typing import Iterator, List, Literal, Optional
 import pandas as pd
 from PIL import Image
 import cv2
 import numpy as np
 import pytesseract
 
+from .caching import get_ocr_cache
+from .config import settings
+
 DocType = Literal["pdf", "docx", "pptx", "txt", "csv", "xlsx", "image", "unknown"]
 
+# Kinds extracted row by row into header-repeating row groups (see iter_table_text)
+TABLE_KINDS = ("csv", "xlsx")
+
 _SUFFIX_MAP: dict[str, DocType] = {
     ".pdf": "pdf",
     ".docx": "docx",
@@ -27,15 +36,96 @@ def detect_type(path: Path) -> DocType:
     return _SUFFIX_MAP.get(path.suffix.lower(), "unknown")
 
 
-def extract_text(path: Path, kind: DocType) -> str:
+def page_count(path: Path, kind: DocType) -> int:
+    # Number of independently extractable units: PDF pages or PPTX slides
     if kind == "pdf":
         from pypdf import PdfReader
 
-        text = []
-        reader = PdfReader(str(path))
-        for page in reader.pages:
-            text.append(page.extract_text() or "")
-        return "\n".join(text).strip()
+        return len(PdfReader(str(path)).pages)
+    if kind == "pptx":
+        from pptx import Presentation
+
+        return len(Presentation(str(path)).slides)
+    return 1
+
+
+def needs_ocr(text: str) -> bool:
+    # a page whose text layer is (nearly) empty is most likely a scan
+    return settings.PDF_OCR_FALLBACK and len("".join(text.split())) < settings.PDF_OCR_MIN_CHARS
+
+
+def extract_pdf_pages(
+    path: Path, start: int = 0, stop: Optional[int] = None, ocr: bool = True
+) -> List[str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(path))
+    out = []
+    for page in reader.pages[start:stop]:
+        text = page.extract_text() or ""
+        if ocr and needs_ocr(text):
+            text = _ocr_pdf_page(page) or text
+        out.append(text)
+    return out
+
+
+def ocr_pdf_page(path: Path, index: int) -> str:
+    # One page per call, so the scanned pages of a PDF spread over the extraction pool
+    from pypdf import PdfReader
+
+    try:
+        return _ocr_pdf_page(PdfReader(str(path)).pages[index])
+    except Exception as e:
+        # re-raised as a plain error: some (e.g. pytesseract's) cannot be unpickled by the
+        # pool and would break it for every other job
+        raise RuntimeError(f"OCR of page {index} failed: {type(e).__name__}: {e}") from None
+
+
+def _ocr_pdf_page(page) -> str:
+    """
+    OCR a page without a text layer. pypdf cannot rasterize pages, so this reads the images
+    embedded in the page, which for a scanned document is the scan itself. Results are
+    cached by the hash of the image bytes.
+    """
+    images = list(page.images)
+    if not images:
+        return ""
+    h = hashlib.sha256()
+    for img in images:
+        h.update(img.data)
+    key = h.hexdigest()
+    cache = get_ocr_cache()
+    if cache is not None and (hit := cache.get(key)) is not None:
+        return hit
+
+    texts = []
+    for img in images:
+        arr = cv2.imdecode(np.frombuffer(img.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if arr is None:
+            # formats OpenCV cannot decode (e.g. JBIG2, CCITT) go through pypdf's PIL image
+            arr = cv2.cvtColor(np.array(img.image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        texts.append(_ocr_array(arr))
+    text = "\n".join(t for t in texts if t)
+    if cache is not None:
+        cache.put(key, text)
+    return text
+
+
+def extract_pptx_slides(path: Path, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    from pptx import Presentation
+
+    prs = Presentation(str(path))
+    out = []
+    for slide in list(prs.slides)[start:stop]:
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text:
+                out.append(shape.text)
+    return out
+
+
+def extract_text(path: Path, kind: DocType) -> str:
+    if kind == "pdf":
+        return "\n".join(extract_pdf_pages(path)).strip()
 
     if kind == "docx":
         import docx2txt
@@ -43,26 +133,13 @@ def extract_text(path: Path, kind: DocType) -> str:
         return (docx2txt.process(str(path)) or "").strip()
 
     if kind == "pptx":
-        from pptx import Presentation
-
-        prs = Presentation(str(path))
-        out = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text:
-                    out.append(shape.text)
-        return "\n".join(out).strip()
+        return "\n".join(extract_pptx_slides(path)).strip()
 
     if kind == "txt":
         return path.read_text(encoding="utf-8", errors="replace")
 
-    if kind == "csv":
-        df = pd.read_csv(path)
-        return _df_to_text(df)
-
-    if kind == "xlsx":
-        df = pd.read_excel(path, engine="openpyxl")
-        return _df_to_text(df)
+    if kind in TABLE_KINDS:
+        return "".join(iter_table_text(path, kind)).strip()
 
     if kind == "image":
         return _ocr_image(path)
@@ -70,12 +147,104 @@ def extract_text(path: Path, kind: DocType) -> str:
     return ""
 
 
-def _df_to_text(df: pd.DataFrame) -> str:
-    lines = []
-    lines.append(" | ".join(map(str, df.columns.tolist())))
-    for _, row in df.head(100).iterrows():
-        lines.append(" | ".join(map(lambda x: str(x), row.tolist())))
-    return "\n".join(lines)
+def _format_rows(df: pd.DataFrame) -> pd.Series:
+    # one "a | b | c" line per non-empty row, built column-wise rather than per row
+    blank = df.isna()
+    df = df.astype(str).mask(blank, "")
+    df = df[(df != "").any(axis=1)]
+    if df.empty:
+        return pd.Series([], dtype=str)
+    cols = [df[c] for c in df.columns]
+    lines = cols[0].str.cat(cols[1:], sep=" | ") if len(cols) > 1 else cols[0]
+    return lines.str.replace(r"\s+", " ", regex=True).str.rstrip(" |")
+
+
+def _row_groups(head: str, lines: pd.Series, budget: int) -> Iterator[str]:
+    """
+    Pack rows into blocks of about `budget` chars, each starting with `head` (sheet name and
+    column header) and ending in a blank line, so every block reads on its own and the
+    chunker can snap to block boundaries.
+    """
+    if lines.empty:
+        return
+    room = max(1, budget - len(head))
+    lens = lines.str.len().to_numpy() + 1
+    group = (np.cumsum(lens) - lens) // room
+    cuts = np.flatnonzero(np.diff(group)) + 1
+    for rows in np.split(lines.to_numpy(), cuts):
+        yield head + "\n".join(rows) + "\n\n"
+
+
+def _header_line(cells) -> str:
+    return " ".join(" | ".join("" if v is None else str(v) for v in cells).split()).rstrip(" |")
+
+
+def _iter_csv(path: Path, batch_rows: int, budget: int) -> Iterator[str]:
+    try:
+        reader = pd.read_csv(
+            path,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=batch_rows,
+            encoding_errors="replace",
+            on_bad_lines="skip",
+        )
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for df in reader:
+            yield from _row_groups(_header_line(df.columns) + "\n", _format_rows(df), budget)
+
+
+def _sheet_frame(batch: List[tuple]) -> pd.DataFrame:
+    # object columns keep openpyxl's ints as ints (a float64 column with a blank prints
+    # 1.0); date columns become datetime64 so midnight dates print as dates, as read_excel did
+    df = pd.DataFrame(batch, dtype=object)
+    for c in df.columns:
+        vals = df[c].dropna()
+        if len(vals) and all(isinstance(v, datetime) for v in vals):
+            df[c] = pd.to_datetime(df[c])
+    return df
+
+
+def _iter_xlsx(path: Path, batch_rows: int, budget: int) -> Iterator[str]:
+    from openpyxl import load_workbook
+
+    # read-only mode streams rows from the sheet XML instead of building the whole workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next((r for r in rows if any(v not in (None, "") for v in r)), None)
+            if header is None:
+                continue
+            head = f"Sheet: {ws.title}\n{_header_line(header)}\n"
+            while batch := list(islice(rows, batch_rows)):
+                yield from _row_groups(head, _format_rows(_sheet_frame(batch)), budget)
+    finally:
+        wb.close()
+
+
+def iter_table_text(path: Path, kind: DocType) -> Iterator[str]:
+    """
+    Stream a CSV (pandas, chunksize) or every sheet of an XLSX (openpyxl, read-only) as
+    row groups of about TABLE_GROUP_CHARS, TABLE_BATCH_ROWS rows in memory at a time.
+    """
+    batch_rows = max(1, settings.TABLE_BATCH_ROWS)
+    budget = max(1, settings.TABLE_GROUP_CHARS)
+    if kind == "csv":
+        return _iter_csv(path, batch_rows, budget)
+    return _iter_xlsx(path, batch_rows, budget)
+
+
+def write_table_text(path: Path, kind: DocType, dest: Path) -> str:
+    # Streams the table text to `dest` and returns its SHA-256, never holding it whole
+    h = hashlib.sha256()
+    with dest.open("w", encoding="utf-8") as out:
+        for block in iter_table_text(path, kind):
+            h.update(block.encode("utf-8"))
+            out.write(block)
+    return h.hexdigest()
 
 
 def _ocr_image(path: Path) -> str:
@@ -85,7 +254,10 @@ def _ocr_image(path: Path) -> str:
         # Fallback via PIL if cv2 fails
         pil = Image.open(path)
         return pytesseract.image_to_string(pil)
+    return _ocr_array(img)
+
 
+def _ocr_array(img: np.ndarray) -> str:
     # Preprocess: grayscale -> threshold -> slight dilation to connect text
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     # Adaptive threshold handles uneven lighting
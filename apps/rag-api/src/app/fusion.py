@@ -0,0 +1,89 @@
+from __future__ import annotations
+import heapq
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+DEFAULT_RRF_K = 60
+
+
+def chunk_key(doc_id: Any, chunk_index: Any) -> str:
+    # Canonical chunk identity shared by every retriever: the human "doc:idx" id
+    return f"{doc_id}:{int(chunk_index)}"
+
+
+def hit_key(hit: Any) -> Optional[str]:
+    """
+    Canonical key for a retriever hit: an FTS row dict or a Qdrant point
+    (anything with a `.payload`). Prefers the stored chunk_id, else doc_id:chunk_index.
+    """
+    pl: Mapping[str, Any] = (
+        hit if isinstance(hit, Mapping) else (getattr(hit, "payload", None) or {})
+    )
+    if pl.get("chunk_id"):
+        return str(pl["chunk_id"])
+    if pl.get("doc_id") is not None and pl.get("chunk_index") is not None:
+        return chunk_key(pl["doc_id"], pl["chunk_index"])
+    return None
+
+
+def weighted_rrf(
+    rankings: Mapping[str, Sequence[str]],
+    top_n: int,
+    weights: Optional[Mapping[str, float]] = None,
+    ks: Optional[Mapping[str, int]] = None,
+) -> List[Tuple[str, float]]:
+    """
+    Weighted reciprocal-rank fusion over any number of retrievers:
+    score(key) = sum_r weights[r] / (ks[r] + rank_r(key))
+
+    Rankings are consumed depth by depth. Once the best `top_n` keys lead the rest by more
+    than anything could still gain from deeper ranks, the membership of the top set is
+    final; only those keys' remaining contributions are then added up so their scores and
+    order are exact. Returns [(key, score)] best first, at most `top_n` items.
+    """
+    if top_n <= 0:
+        return []
+    weights = weights or {}
+    ks = ks or {}
+    w = {n: float(weights.get(n, 1.0)) for n in rankings}
+    k = {n: int(ks.get(n, DEFAULT_RRF_K)) for n in rankings}
+    names = [n for n, r in rankings.items() if r and w[n] > 0]
+    if not names:
+        return []
+
+    scores: Dict[str, float] = {}
+    seen: Dict[str, set[str]] = {n: set() for n in names}
+
+    def add(n: str, key: str, rank: int) -> None:
+        if key in seen[n]:
+            return  # a retriever only counts its best rank for a key
+        seen[n].add(key)
+        scores[key] = scores.get(key, 0.0) + w[n] / (k[n] + rank)
+
+    depth = max(len(rankings[n]) for n in names)
+    cut_at: Optional[int] = None
+    for d in range(depth):
+        for n in names:
+            if d < len(rankings[n]):
+                add(n, rankings[n][d], d + 1)
+        # most any key can still gain from ranks below the current depth
+        rest = sum(w[n] / (k[n] + d + 2) for n in names if d + 1 < len(rankings[n]))
+        if rest == 0.0:
+            break
+        if len(scores) > top_n:
+            top = heapq.nlargest(top_n + 1, scores.values())
+            if top[top_n - 1] > top[top_n] + rest:
+                cut_at = d + 1
+                break
+
+    if cut_at is None:
+        return sorted(scores.items(), key=lambda kv: -kv[1])[:top_n]
+
+    members = heapq.nlargest(top_n, scores.items(), key=lambda kv: kv[1])
+    final = {key: s for key, s in members}
+    for n in names:
+        for pos in range(cut_at, len(rankings[n])):
+            key = rankings[n][pos]
+            if key in final and key not in seen[n]:
+                seen[n].add(key)
+                final[key] += w[n] / (k[n] + pos + 1)
+    return sorted(final.items(), key=lambda kv: -kv[1])
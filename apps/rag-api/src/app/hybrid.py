@@ -1,36 +1,230 @@
+import json
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 
-DB_PATH = Path("/app/data/hybrid.db")
+from .config import settings
 
+DB_PATH = Path(settings.DATA_DIR) / "hybrid.db"
 
-def _conn():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("PRAGMA synchronous=NORMAL;")
-    return con
+_SQL_SEARCH = (
+    "SELECT chunk_id, text, doc_id, kind, source_path, chunk_index, bm25(chunks_fts) AS bscore "
+    "FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY bscore LIMIT ?"
+)
+_SQL_COUNT = "SELECT count(*) FROM chunks_fts"
+# doc_id is UNINDEXED in the FTS table, so filtering on it scans every row. chunk_rows
+# maps each chunk to its FTS rowid: writes allocate the rowid there first and deletes
+# find rows through its indexes.
+_SQL_INSERT_ROW = "INSERT INTO chunk_rows(doc_id, chunk_id) VALUES (?, ?)"
+_SQL_INSERT = (
+    "INSERT INTO chunks_fts(rowid, text, doc_id, kind, source_path, chunk_index, chunk_id) "
+    "VALUES ((SELECT max(id) FROM chunk_rows WHERE chunk_id = ?), ?, ?, ?, ?, ?, ?)"
+)
+_SQL_DELETE_DOC = (
+    "DELETE FROM chunks_fts WHERE rowid IN (SELECT id FROM chunk_rows WHERE doc_id = ?)"
+)
+_SQL_DELETE_DOC_ROWS = "DELETE FROM chunk_rows WHERE doc_id = ?"
+_CHUNK_IDS = "doc_id = ? AND chunk_id IN (SELECT value FROM json_each(?))"
+_SQL_DELETE_CHUNKS = (
+    f"DELETE FROM chunks_fts WHERE rowid IN (SELECT id FROM chunk_rows WHERE {_CHUNK_IDS})"
+)
+_SQL_DELETE_CHUNK_ROWS = f"DELETE FROM chunk_rows WHERE {_CHUNK_IDS}"
+_SQL_MERGE = "INSERT INTO chunks_fts(chunks_fts, rank) VALUES('merge', ?)"
+_SQL_OPTIMIZE = "INSERT INTO chunks_fts(chunks_fts) VALUES('optimize')"
+
+
+class _ConnPool:
+    """
+    One read-only connection per thread plus a single shared writer.
+    Connections are opened and tuned once, then reused; sqlite3 keeps each
+    connection's prepared statements in its statement cache, so the constant
+    SQL above is compiled once per connection rather than once per query.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._writer: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.rows_since_merge = 0
+
+    def _tune(self, con: sqlite3.Connection) -> None:
+        con.execute(f"PRAGMA mmap_size={int(settings.FTS_MMAP_MB) * 1024 * 1024};")
+        con.execute(f"PRAGMA cache_size={-int(settings.FTS_CACHE_MB) * 1024};")
+        con.execute("PRAGMA temp_store=MEMORY;")
+
+    def reader(self) -> Optional[sqlite3.Connection]:
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            return con
+        if not self.path.exists():
+            return None  # nothing indexed yet
+        con = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False, cached_statements=64
+        )
+        self._tune(con)
+        self._local.con = con
+        with self._lock:
+            self._readers.append(con)
+        return con
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            if self._writer is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                con = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+                con.execute("PRAGMA journal_mode=WAL;")
+                con.execute("PRAGMA synchronous=NORMAL;")
+                self._tune(con)
+                self._writer = con
+            yield self._writer
+
+    def close(self) -> None:
+        with self._lock:
+            for con in self._readers:
+                con.close()
+            self._readers.clear()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        self._local = threading.local()
+
+
+_pool = _ConnPool(DB_PATH)
 
 
 def ensure_fts():
-    con = _conn()
-    con.execute(
+    with _pool.writer() as con:
+        con.execute(
+            """
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+        USING fts5(
+          text,
+          doc_id UNINDEXED,
+          kind UNINDEXED,
+          source_path UNINDEXED,
+          chunk_index UNINDEXED,
+          chunk_id UNINDEXED,
+          tokenize = 'unicode61'
+        );
         """
-    CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
-    USING fts5(
-      text,
-      doc_id UNINDEXED,
-      kind UNINDEXED,
-      source_path UNINDEXED,
-      chunk_index UNINDEXED,
-      chunk_id UNINDEXED,
-      tokenize = 'unicode61'
-    );
-    """
+        )
+        new_map = not con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunk_rows'"
+        ).fetchone()
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_rows ("
+            " id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, chunk_id TEXT NOT NULL)"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS chunk_rows_doc ON chunk_rows(doc_id, chunk_id)")
+        con.execute("CREATE INDEX IF NOT EXISTS chunk_rows_chunk ON chunk_rows(chunk_id)")
+        if new_map:
+            # a table written before the map existed: one scan to build it
+            con.execute(
+                "INSERT INTO chunk_rows(id, doc_id, chunk_id) "
+                "SELECT rowid, doc_id, chunk_id FROM chunks_fts"
+            )
+        con.commit()
+
+
+def _insert(con: sqlite3.Connection, doc_id: str, rows: List[Dict[str, Any]]) -> None:
+    con.executemany(_SQL_INSERT_ROW, [(doc_id, r["chunk_id"]) for r in rows])
+    con.executemany(
+        _SQL_INSERT,
+        [
+            (
+                r["chunk_id"],
+                r["text"],
+                doc_id,
+                r.get("kind"),
+                r.get("source_path"),
+                r["chunk_index"],
+                r["chunk_id"],
+            )
+            for r in rows
+        ],
     )
-    con.commit()
-    con.close()
+
+
+def _delete(con: sqlite3.Connection, doc_id: str, chunk_ids: Optional[List[str]] = None) -> int:
+    # FTS rows first: the map is what finds them
+    if chunk_ids is None:
+        n = con.execute(_SQL_DELETE_DOC, (doc_id,)).rowcount
+        con.execute(_SQL_DELETE_DOC_ROWS, (doc_id,))
+    else:
+        ids = json.dumps(list(chunk_ids))
+        n = con.execute(_SQL_DELETE_CHUNKS, (doc_id, ids)).rowcount
+        con.execute(_SQL_DELETE_CHUNK_ROWS, (doc_id, ids))
+    return n
+
+
+def index_chunks(doc_id: str, rows: Iterable[Dict[str, Any]], replace: bool = True) -> int:
+    """
+    Bulk-write a document's chunks in a single transaction. With `replace`, existing rows
+    for `doc_id` are removed first so re-embedding a document is idempotent.
+    rows: {"chunk_id", "text", "kind", "source_path", "chunk_index"}
+    """
+    rows = list(rows)
+    with _pool.writer() as con:
+        with con:  # one commit for the whole document
+            if replace:
+                _delete(con, doc_id)
+            _insert(con, doc_id, rows)
+        _pool.rows_since_merge += len(rows)
+        every = int(settings.FTS_MERGE_EVERY_ROWS)
+        if every and _pool.rows_since_merge >= every:
+            # incremental segment merge; bounded work, unlike a full optimize
+            with con:
+                con.execute(_SQL_MERGE, (500,))
+            _pool.rows_since_merge = 0
+    return len(rows)
+
+
+def upsert_chunks(doc_id: str, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Replace just the given chunks of a document (matched by chunk_id) in one transaction;
+    the incremental re-index path, where most of the document is left untouched.
+    """
+    rows = list(rows)
+    with _pool.writer() as con:
+        with con:
+            _delete(con, doc_id, [r["chunk_id"] for r in rows])
+            _insert(con, doc_id, rows)
+        _pool.rows_since_merge += len(rows)
+    return len(rows)
+
+
+def delete_chunks(doc_id: str, chunk_ids: List[str]) -> int:
+    if not chunk_ids:
+        return 0
+    with _pool.writer() as con:
+        with con:
+            return _delete(con, doc_id, chunk_ids)
+
+
+def delete_doc(doc_id: str) -> int:
+    with _pool.writer() as con:
+        with con:
+            return _delete(con, doc_id)
+
+
+def optimize_fts() -> None:
+    """
+    Merge all FTS5 index segments into one. Expensive on large tables; meant for an
+    admin call or a maintenance window, the per-write path only does incremental merges.
+    """
+    with _pool.writer() as con:
+        with con:
+            con.execute(_SQL_OPTIMIZE)
+        _pool.rows_since_merge = 0
+
+
+def close_fts():
+    _pool.close()
 
 
 def _escape_fts(q: str) -> str:
@@ -38,35 +232,18 @@ def _escape_fts(q: str) -> str:
     return '"' + (q or "").replace('"', '""') + '"'
 
 
-def fts_search(query: str, limit: int = 50) -> List[Dict[str, Any]]:
-    """
-    Try parameterized MATCH first. If the build rejects it, fall back to a fully literal,
-    safely quoted query with an integer-inlined LIMIT (no placeholders).
-    """
-    con = _conn()
-    out: List[Dict[str, Any]] = []
+def _search(con: sqlite3.Connection, query: str, lim: int) -> List[Dict[str, Any]]:
     try:
-        cur = con.execute(
-            "SELECT chunk_id, text, doc_id, kind, source_path, chunk_index, bm25(chunks_fts) AS bscore "
-            "FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY bscore LIMIT ?",
-            (query, int(limit)),
-        )
+        rows = con.execute(_SQL_SEARCH, (query, lim)).fetchall()
     except sqlite3.OperationalError:
-        # Fallback: literal SQL — quoted MATCH, integer LIMIT (sanitized)
-        qlit = _escape_fts(query)
-        lim = max(1, min(int(limit or 50), 200))  # clamp 1..200
-        sql = (
-            "SELECT chunk_id, text, doc_id, kind, source_path, chunk_index, bm25(chunks_fts) AS bscore "
-            f"FROM chunks_fts WHERE chunks_fts MATCH {qlit} ORDER BY bscore LIMIT {lim}"
-        )
         try:
-            cur = con.execute(sql)
+            rows = con.execute(_SQL_SEARCH, (_escape_fts(query), lim)).fetchall()
         except sqlite3.OperationalError:
             # Final safety: if FTS still errors (weird tokens), return empty results
-            con.close()
-            return out
+            return []
 
-    for row in cur.fetchall():
+    out: List[Dict[str, Any]] = []
+    for row in rows:
         chunk_id, text, doc_id, kind, source_path, chunk_index, bscore = row
         out.append(
             {
@@ -79,5 +256,35 @@ def fts_search(query: str, limit: int = 50) -> List[Dict[str, Any]]:
                 "bm25_score": float(bscore),
             }
         )
-    con.close()
     return out
+
+
+def fts_search(query: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Run the query as an FTS5 expression first. If FTS rejects its syntax, retry it as a
+    single quoted phrase; both go through the same prepared statement.
+    """
+    con = _pool.reader()
+    if con is None:
+        return []
+    lim = max(1, min(int(limit or 50), 200))  # clamp 1..200
+    return _search(con, query, lim)
+
+
+def fts_search_batch(queries: List[str], limit: int = 50) -> List[List[Dict[str, Any]]]:
+    """fts_search for many queries on one pooled connection and its prepared statement."""
+    con = _pool.reader()
+    if con is None:
+        return [[] for _ in queries]
+    lim = max(1, min(int(limit or 50), 200))
+    return [_search(con, q, lim) for q in queries]
+
+
+def fts_count() -> int:
+    con = _pool.reader()
+    if con is None:
+        return 0
+    try:
+        return int(con.execute(_SQL_COUNT).fetchone()[0])
+    except sqlite3.OperationalError:
+        return 0
@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .caching import bump_corpus_generation
+from .chunking import Chunk, iter_chunks, iter_file
+from .config import settings
+from .embeddings import AsyncEmbedder, get_embedder
+from .hybrid import delete_chunks, index_chunks, upsert_chunks
+from .manifest import get_manifest
+from .vectorstore import (
+    async_delete_doc_points,
+    async_delete_points,
+    async_retrieve_points,
+    async_upsert_vectors,
+    point_id,
+)
+
+log = logging.getLogger(__name__)
+
+ProgressFn = Callable[[Dict[str, Any]], None]
+
+# Tables are extracted as blank-line separated row groups that each repeat the header;
+# snapping keeps a chunk from starting or ending mid-group
+_SNAP_BY_KIND = {"csv": "paragraph", "xlsx": "paragraph"}
+
+
+def token_batches(
+    chunks: Iterable[Chunk], max_tokens: int, max_items: int
+) -> Iterator[List[Chunk]]:
+    """
+    Group chunks into embedding requests of at most `max_tokens` tokens and `max_items`
+    inputs. A single chunk larger than the budget still goes out, alone.
+    """
+    batch: List[Chunk] = []
+    tokens = 0
+    for c in chunks:
+        if batch and (tokens + c.n_tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(c)
+        tokens += c.n_tokens
+    if batch:
+        yield batch
+
+
+async def index_document(
+    doc_id: str,
+    chunks: Iterable[Chunk],
+    kind: Optional[str] = None,
+    source_path: Optional[str] = None,
+    embedder: Optional[AsyncEmbedder] = None,
+    on_progress: Optional[ProgressFn] = None,
+    reuse: Optional[Dict[str, str]] = None,
+    fresh: bool = True,
+) -> Dict[str, Any]:
+    """
+    Pipelined indexer: up to EMBED_INDEX_CONCURRENCY token-budgeted embedding batches are
+    in flight, and each one is upserted into Qdrant as soon as its vectors arrive. Chunks
+    are pulled lazily, so memory holds the in-flight vectors plus the chunk text.
+
+    FTS rows are buffered and written in one transaction once every batch is in Qdrant, so
+    keyword search never sees a half-indexed document. With `fresh`, existing FTS rows for
+    `doc_id` are replaced wholesale; otherwise only the rows of the chunks passed in are.
+    `reuse` maps chunk text hashes to point ids that already hold that text's vector;
+    those are fetched from Qdrant instead of embedded.
+    """
+    embedder = embedder or get_embedder()
+    sem = asyncio.Semaphore(max(1, settings.EMBED_INDEX_CONCURRENCY))
+    tasks: set[asyncio.Task] = set()
+    errors: List[Exception] = []
+    fts_rows: List[Dict[str, Any]] = []
+    stats: Dict[str, Any] = {
+        "doc_id": doc_id,
+        "chunks": 0,
+        "batches": 0,
+        "tokens": 0,
+        "reused": 0,
+    }
+    t0 = time.perf_counter()
+
+    def report(final: bool = False) -> None:
+        stats["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if on_progress is not None:
+            on_progress(dict(stats, done=final))
+
+    async def vectors_for(batch: List[Chunk]) -> List[List[float]]:
+        vecs: List[Optional[List[float]]] = [None] * len(batch)
+        if reuse:
+            hashes = [text_sha(c.text) for c in batch]
+            wanted = {i: reuse[h] for i, h in enumerate(hashes) if h in reuse}
+            stored = await async_retrieve_points(list(set(wanted.values())))
+            for i, pid in wanted.items():
+                pt = stored.get(pid)
+                # the old point may already have been overwritten by this same re-index
+                if pt and text_sha(pt["payload"].get("text") or "") == hashes[i]:
+                    vecs[i] = pt["vector"]
+            stats["reused"] += sum(v is not None for v in vecs)
+        missing = [i for i, v in enumerate(vecs) if v is None]
+        if missing:
+            fresh_vecs = await embedder.embed([batch[i].text for i in missing])
+            for i, v in zip(missing, fresh_vecs):
+                vecs[i] = v
+        return vecs  # type: ignore[return-value]
+
+    async def run(batch: List[Chunk]) -> None:
+        try:
+            vecs = await vectors_for(batch)
+            points, rows = [], []
+            for c, v in zip(batch, vecs):
+                human_chunk_id = f"{doc_id}:{c.index}"
+                payload = {
+                    "doc_id": doc_id,
+                    "kind": kind,
+                    "chunk_index": c.index,
+                    "char_start": c.char_start,
+                    "char_end": c.char_end,
+                    "source_path": source_path,
+                    "text": c.text,
+                    "chunk_id": human_chunk_id,
+                }
+                points.append({"id": point_id(human_chunk_id), "vector": v, "payload": payload})
+                rows.append(
+                    {
+                        "chunk_id": human_chunk_id,
+                        "text": c.text,
+                        "kind": kind,
+                        "source_path": source_path,
+                        "chunk_index": c.index,
+                    }
+                )
+            await async_upsert_vectors(points)
+            fts_rows.extend(rows)
+            stats["chunks"] += len(batch)
+            stats["batches"] += 1
+            stats["tokens"] += sum(c.n_tokens for c in batch)
+            report()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            sem.release()
+
+    batches = token_batches(chunks, settings.EMBED_BATCH_TOKENS, settings.EMBED_BATCH_ITEMS)
+    try:
+        while not errors:
+            await sem.acquire()
+            # chunking may be CPU-heavy; pull the next batch off the event loop
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                sem.release()
+                break
+            task = asyncio.create_task(run(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*list(tasks))
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    if errors:
+        raise errors[0]
+    if fresh:
+        await asyncio.to_thread(index_chunks, doc_id, fts_rows, True)
+    elif fts_rows:
+        await asyncio.to_thread(upsert_chunks, doc_id, fts_rows)
+
+    report(final=True)
+    log.info(
+        "indexed %s: %d chunks in %d batches (%d tokens) in %.0f ms",
+        doc_id,
+        stats["chunks"],
+        stats["batches"],
+        stats["tokens"],
+        stats["elapsed_ms"],
+    )
+    return stats
+
+
+def text_sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def file_sha(path: Path) -> str:
+    # equals text_sha() of the file's text, for UTF-8 files
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+def doc_chunks(
+    text: Union[str, Path], chunk_tokens: int = 400, overlap: int = 60, kind: Optional[str] = None
+) -> Iterator[Chunk]:
+    # A path is streamed from disk instead of being read into one string
+    source = text if isinstance(text, str) else iter_file(text)
+    return iter_chunks(source, chunk_tokens, overlap, snap=_SNAP_BY_KIND.get(kind or ""))
+
+
+async def index_text(
+    doc_id: str,
+    text: Union[str, Path],
+    chunk_tokens: int = 400,
+    overlap: int = 60,
+    kind: Optional[str] = None,
+    source_path: Optional[str] = None,
+    force: bool = False,
+    on_progress: Optional[ProgressFn] = None,
+) -> Dict[str, Any]:
+    """
+    Index `text` (or the text file at that path) under `doc_id`, doing as little work as
+    the manifest allows:
+    - same text, same chunking parameters: nothing to do, the embedding API is skipped;
+    - revised text, same parameters: only chunks whose content hash changed at their index
+      are written; their vectors come from Qdrant when the same text was indexed at
+      another index before, and chunks past the new end are deleted in bulk;
+    - otherwise (new doc, new parameters, or `force`): full index.
+    A document indexed before but with no chunk rows in the manifest (indexed by an older
+    version) has its points deleted by doc_id first, since nothing says which exist.
+    """
+    manifest = get_manifest()
+    sha = text_sha(text) if isinstance(text, str) else await asyncio.to_thread(file_sha, text)
+    prev = await asyncio.to_thread(manifest.get_index, doc_id)
+    same_params = bool(
+        prev
+        and prev["state"] == "indexed"
+        and prev["chunk_tokens"] == chunk_tokens
+        and prev["overlap"] == overlap
+    )
+    if same_params and not force and prev["text_sha"] == sha:  # type: ignore[index]
+        return {
+            "doc_id": doc_id,
+            "chunks": prev["n_chunks"],  # type: ignore[index]
+            "batches": 0,
+            "tokens": 0,
+            "reused": 0,
+            "unchanged": prev["n_chunks"],  # type: ignore[index]
+            "deleted": 0,
+            "elapsed_ms": 0.0,
+            "skipped": True,
+        }
+
+    # (hash, char_start) of what is indexed now; also tells us which points to drop after
+    old: Dict[int, Tuple[str, int]] = await asyncio.to_thread(manifest.get_chunks, doc_id)
+    unknown = prev is not None and not old
+    incremental = same_params and not force and not unknown
+    new: Dict[int, Tuple[str, int]] = {}
+
+    def changed_chunks() -> Iterator[Chunk]:
+        # runs lazily inside the indexer's batch pulls; records every chunk's hash
+        for c in doc_chunks(text, chunk_tokens, overlap, kind):
+            # a moved chunk with unchanged text is rewritten for its offsets, but its
+            # vector is reused rather than embedded again
+            new[c.index] = (text_sha(c.text), c.char_start)
+            if not incremental or old.get(c.index) != new[c.index]:
+                yield c
+
+    params = dict(
+        text_sha=sha, chunk_tokens=chunk_tokens, overlap=overlap, kind=kind, source_path=source_path
+    )
+    await asyncio.to_thread(manifest.set_index, doc_id, state="indexing", **params)
+    try:
+        if unknown:
+            await async_delete_doc_points(doc_id)
+        stats = await index_document(
+            doc_id,
+            changed_chunks(),
+            kind=kind,
+            source_path=source_path,
+            on_progress=on_progress,
+            reuse=None if force else {h: point_id(f"{doc_id}:{i}") for i, (h, _) in old.items()},
+            fresh=not incremental,
+        )
+        stale = [f"{doc_id}:{i}" for i in old if i not in new]
+        if stale:
+            await async_delete_points([point_id(c) for c in stale])
+            await asyncio.to_thread(delete_chunks, doc_id, stale)
+        await asyncio.to_thread(manifest.set_chunks, doc_id, new)
+    except BaseException:
+        await asyncio.to_thread(manifest.set_index, doc_id, state="failed")
+        await bump_corpus_generation()  # some points may have been written already
+        raise
+    await asyncio.to_thread(
+        manifest.set_index, doc_id, state="indexed", n_chunks=len(new), **params
+    )
+    await bump_corpus_generation()
+    return dict(
+        stats,
+        chunks=len(new),
+        written=stats["chunks"],
+        unchanged=len(new) - stats["chunks"],
+        deleted=len(stale),
+        skipped=False,
+    )
@@ -0,0 +1,397 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+from .extraction import extract_to_file
+from .indexing import index_text
+from .manifest import get_manifest
+
+log = logging.getLogger(__name__)
+
+# Job lifecycle: queued -> running -> done | failed (a failed attempt goes back to queued
+# until INGEST_MAX_ATTEMPTS). `stage` (extract -> index -> done) records how far the
+# document got, so a retry resumes instead of starting over. A running job carries a
+# `lease_until` its worker keeps renewing; a job whose lease lapsed belongs to a dead
+# worker and is re-queued.
+
+
+def _lease() -> float:
+    return time.time() + settings.INGEST_LEASE_S
+
+
+def _lapsed(job: Dict[str, Any]) -> bool:
+    return job["state"] == "running" and job.get("lease_until", 0.0) < time.time()
+
+
+def new_job(doc_id: str, raw_path: str, kind: str, filename: str, **opts: Any) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "doc_id": doc_id,
+        "raw_path": raw_path,
+        "kind": kind,
+        "filename": filename,
+        "opts": opts,
+        "state": "queued",
+        "stage": "extract",
+        "attempts": 0,
+        "error": None,
+        "progress": {},
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class SQLiteJobQueue:
+    """Single-host queue for local runs; one table, claims are serialized by a lock."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, state TEXT NOT NULL,"
+            " created_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, created_at)")
+        self._con.execute("CREATE INDEX IF NOT EXISTS jobs_doc ON jobs(doc_id, state)")
+        self._con.commit()
+        self._lock = threading.Lock()
+
+    def _write(self, job: Dict[str, Any]) -> None:
+        self._con.execute(
+            "INSERT OR REPLACE INTO jobs(job_id, doc_id, state, created_at, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (job["job_id"], job["doc_id"], job["state"], job["created_at"], json.dumps(job)),
+        )
+
+    def enqueue(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock, self._con:
+            row = self._con.execute(
+                "SELECT data FROM jobs WHERE doc_id = ? AND state IN ('queued', 'running') "
+                "ORDER BY created_at LIMIT 1",
+                (job["doc_id"],),
+            ).fetchone()
+            if row:
+                existing = json.loads(row[0])  # same document already in flight
+                if not _lapsed(existing):
+                    return existing
+                existing.update(state="queued", updated_at=time.time())
+                self._write(existing)
+                return existing
+            self._write(job)
+        return job
+
+    def claim(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock, self._con:
+                row = self._con.execute(
+                    "SELECT data FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    job = json.loads(row[0])
+                    job.update(state="running", lease_until=_lease(), updated_at=time.time())
+                    self._write(job)
+                    return job
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.1)
+
+    def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        with self._lock, self._con:
+            row = self._con.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if not row:
+                return None
+            job = json.loads(row[0])
+            job.update(fields, updated_at=time.time())
+            self._write(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._con.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, state: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        sql = "SELECT data FROM jobs"
+        args: tuple = ()
+        if state:
+            sql += " WHERE state = ?"
+            args = (state,)
+        with self._lock:
+            rows = self._con.execute(
+                sql + " ORDER BY created_at DESC LIMIT ?", args + (int(limit),)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def recover(self) -> int:
+        # running jobs whose lease lapsed (their process died) go back on the queue
+        n = 0
+        with self._lock, self._con:
+            rows = self._con.execute("SELECT data FROM jobs WHERE state = 'running'").fetchall()
+            for (data,) in rows:
+                job = json.loads(data)
+                if _lapsed(job):
+                    job.update(state="queued", updated_at=time.time())
+                    self._write(job)
+                    n += 1
+        return n
+
+
+class RedisJobQueue:
+    """
+    Multi-worker queue on Redis: a list of queued job ids, one JSON string per job, and a
+    per-doc key that dedupes in-flight documents. Claiming moves the id atomically onto a
+    processing list, so a job whose worker dies is still known and re-queued by recover()
+    once its lease lapses. Needs the optional `redis` package.
+    """
+
+    PREFIX = "rag:jobs"
+
+    def __init__(self, url: str):
+        import redis
+
+        self._r = redis.Redis.from_url(url, decode_responses=True)
+        self._q = f"{self.PREFIX}:queue"
+        self._processing = f"{self.PREFIX}:processing"
+        self._index = f"{self.PREFIX}:index"
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.PREFIX}:job:{job_id}"
+
+    def _doc_key(self, doc_id: str) -> str:
+        return f"{self.PREFIX}:doc:{doc_id}"
+
+    def enqueue(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        # SET NX on the doc key makes "one in-flight job per document" atomic across workers
+        if not self._r.set(self._doc_key(job["doc_id"]), job["job_id"], nx=True):
+            existing = self.get(self._r.get(self._doc_key(job["doc_id"])) or "")
+            if existing and existing["state"] in ("queued", "running"):
+                if _lapsed(existing) and self._r.lrem(self._processing, 0, existing["job_id"]):
+                    return self.update(existing["job_id"], state="queued") or existing
+                return existing
+            self._r.set(self._doc_key(job["doc_id"]), job["job_id"])
+        pipe = self._r.pipeline()
+        pipe.set(self._key(job["job_id"]), json.dumps(job))
+        pipe.zadd(self._index, {job["job_id"]: job["created_at"]})
+        pipe.lpush(self._q, job["job_id"])
+        pipe.execute()
+        return job
+
+    def claim(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        job_id = self._r.brpoplpush(self._q, self._processing, timeout=max(1, int(timeout)))
+        if not job_id:
+            return None
+        return self.update(job_id, state="running", lease_until=_lease())
+
+    def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields, updated_at=time.time())
+        pipe = self._r.pipeline()
+        pipe.set(self._key(job_id), json.dumps(job))
+        if fields.get("state") in ("queued", "done", "failed"):
+            pipe.lrem(self._processing, 0, job_id)
+        if fields.get("state") == "queued":
+            pipe.lpush(self._q, job_id)
+        pipe.execute()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._r.get(self._key(job_id)) if job_id else None
+        return json.loads(raw) if raw else None
+
+    def list(self, state: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        ids = self._r.zrevrange(self._index, 0, max(0, int(limit) * 4 - 1))
+        jobs = [j for j in (self.get(i) for i in ids) if j]
+        return [j for j in jobs if not state or j["state"] == state][:limit]
+
+    def recover(self) -> int:
+        n = 0
+        for job_id in self._r.lrange(self._processing, 0, -1):
+            job = self.get(job_id)
+            if job is not None and job["state"] == "running" and not _lapsed(job):
+                continue
+            # LREM decides which of several recovering workers re-queues the job
+            if self._r.lrem(self._processing, 1, job_id) and job and job["state"] == "running":
+                self.update(job_id, state="queued")
+                n += 1
+        return n
+
+
+def make_queue():
+    if settings.JOB_QUEUE == "redis":
+        return RedisJobQueue(settings.REDIS_URL)
+    return SQLiteJobQueue(Path(settings.DATA_DIR) / "jobs.db")
+
+
+class JobRunner:
+    """
+    In-process ingestion workers: each carries a job through extract -> chunk -> embed ->
+    FTS/Qdrant index. Stages have their own concurrency limits, so slow OCR cannot starve
+    embedding and vice versa.
+    """
+
+    def __init__(self, queue: Any, workers: Optional[int] = None):
+        self.queue = queue
+        self.workers = settings.INGEST_WORKERS if workers is None else workers
+        self._extract_sem = asyncio.Semaphore(max(1, settings.INGEST_EXTRACT_CONCURRENCY))
+        self._index_sem = asyncio.Semaphore(max(1, settings.INGEST_INDEX_CONCURRENCY))
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        n = await asyncio.to_thread(self.queue.recover)
+        if n:
+            log.info("re-queued %d interrupted ingestion jobs", n)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job = await asyncio.to_thread(self.queue.claim, 1.0)
+            if job is None:
+                continue
+            await self._run(job)
+
+    async def _reaper(self) -> None:
+        # jobs of workers that died while this process is up (other hosts, other processes)
+        while not self._stopping:
+            await asyncio.sleep(max(1.0, settings.INGEST_LEASE_S / 2))
+            try:
+                n = await asyncio.to_thread(self.queue.recover)
+            except Exception as e:
+                log.warning("job recovery failed: %s", e)
+                continue
+            if n:
+                log.info("re-queued %d ingestion jobs with a lapsed lease", n)
+
+    async def _keepalive(
+        self, job_id: str, progress: Dict[str, Any], lock: asyncio.Lock, stop: asyncio.Event
+    ) -> None:
+        # renews the lease and publishes the latest progress, off the event loop; it is
+        # stopped rather than cancelled so no write is left running behind the final one
+        sent: Dict[str, Any] = {}
+        renewed = time.monotonic()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), 0.5)
+                return
+            except asyncio.TimeoutError:
+                pass
+            fields: Dict[str, Any] = {}
+            if progress and progress != sent:
+                sent = dict(progress)
+                fields["progress"] = sent
+            if time.monotonic() - renewed >= settings.INGEST_LEASE_S / 3:
+                renewed = time.monotonic()
+                fields["lease_until"] = _lease()
+            if fields:
+                try:
+                    async with lock:
+                        await asyncio.to_thread(self.queue.update, job_id, **fields)
+                except Exception as e:
+                    log.warning("job %s keepalive failed: %s", job_id, e)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["job_id"]
+        progress: Dict[str, Any] = {}
+        lock, stop = asyncio.Lock(), asyncio.Event()
+        keepalive = asyncio.create_task(self._keepalive(job_id, progress, lock, stop))
+        try:
+            try:
+                stats = await self.process(job, progress, lock)
+            finally:
+                stop.set()
+                await keepalive
+            await asyncio.to_thread(
+                self.queue.update, job_id, state="done", stage="done", progress=stats, error=None
+            )
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            retry = attempts < settings.INGEST_MAX_ATTEMPTS
+            log.warning("job %s attempt %d failed: %s", job_id, attempts, e)
+            await asyncio.to_thread(
+                self.queue.update,
+                job_id,
+                state="queued" if retry else "failed",
+                attempts=attempts,
+                error=f"{type(e).__name__}: {e}",
+            )
+
+    async def process(
+        self,
+        job: Dict[str, Any],
+        progress: Optional[Dict[str, Any]] = None,
+        lock: Optional[asyncio.Lock] = None,
+    ) -> Dict[str, Any]:
+        """Run one job's stages; returns the index stats. `progress` receives live updates."""
+        job_id, doc_id = job["job_id"], job["doc_id"]
+        progress = {} if progress is None else progress
+        lock = lock or asyncio.Lock()
+        opts = job.get("opts") or {}
+        manifest = get_manifest()
+        norm = Path(settings.DATA_DIR) / "normalized" / f"{doc_id}.txt"
+
+        # 1) extract, unless an earlier attempt (or an earlier upload of the same bytes; the
+        # doc_id is their hash) already produced the normalized text
+        known = await asyncio.to_thread(manifest.get_doc, doc_id)
+        if known and known["normalized_path"] and Path(known["normalized_path"]).exists():
+            norm = Path(known["normalized_path"])
+        elif job["stage"] == "extract" or not norm.exists():
+            async with self._extract_sem:
+                sha = await extract_to_file(Path(job["raw_path"]), job["kind"], norm)
+            await asyncio.to_thread(
+                manifest.put_doc,
+                doc_id,
+                filename=job["filename"],
+                kind=job["kind"],
+                bytes=opts.get("bytes"),
+                raw_path=job["raw_path"],
+                normalized_path=str(norm),
+                text_sha=sha,
+            )
+        if job["stage"] == "extract":
+            async with lock:
+                await asyncio.to_thread(
+                    self.queue.update, job_id, stage="index", normalized_path=str(norm)
+                )
+
+        # 2) chunk + embed + index; deterministic point ids and replace-by-doc FTS writes
+        # make a re-run after a partial failure safe, and an already-indexed text is a no-op
+        def on_progress(p: Dict[str, Any]) -> None:
+            # called on the event loop: only record it, the keepalive writes it out
+            progress.clear()
+            progress.update(p)
+
+        async with self._index_sem:
+            stats = await index_text(
+                opts.get("index_doc_id") or doc_id,
+                norm,
+                chunk_tokens=int(opts.get("chunk_tokens", 400)),
+                overlap=int(opts.get("overlap", 60)),
+                kind=job["kind"],
+                source_path=str(norm),
+                on_progress=on_progress,
+            )
+        # known only once chunked; the doc record was written before indexing
+        await asyncio.to_thread(manifest.put_doc, doc_id, n_chunks=stats["chunks"])
+        return stats
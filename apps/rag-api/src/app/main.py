@@ -3,33 +3,54 @@ from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import time
+import uuid
 
-from fastapi import UploadFile, File, HTTPException
+from fastapi import UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import JSONResponse
 from pathlib import Path
 import hashlib
-from .embeddings import embed_texts
-from .vectorstore import ensure_collection, upsert_vectors
-from .chunking import chunk_text
+from .embeddings import embed_texts, get_embedder, close_embedder
+from .clients import close_clients
+from .caching import (
+    SemanticAnswerCache,
+    close_retrieval_cache,
+    corpus_generation,
+    get_answer_cache,
+    get_embedding_cache,
+    get_retrieval_cache,
+)
+from .vectorstore import ensure_collection
+from .indexing import doc_chunks, index_text
+from .manifest import get_manifest
 from qdrant_client import QdrantClient
 
 from pydantic import BaseModel
 
 from .config import settings
-from .extractors import detect_type, extract_text
+from .extractors import detect_type
+from .extraction import extract_to_file, ExtractionTimeout, start_pool, shutdown_pool
+from .jobs import JobRunner, make_queue, new_job
 from .hybrid import ensure_fts
 
 import os
-from typing import Dict, Any
-from .hybrid import fts_search
+from typing import Any, AsyncGenerator, Dict
+from .hybrid import fts_search, fts_search_batch, fts_count as fts_rows, close_fts, optimize_fts
 from .generation import generate_answer
-from .vectorstore import safe_search_vector
-from .rerank import mmr
-from .streaming import stream_answer
+from .vectorstore import (
+    async_search_batch,
+    async_search_vector,
+    close_vectorstore,
+    safe_search_vector,
+    retrieve_vectors,
+    point_id,
+)
+from .rerank import mmr, mmr_batch
+from .fusion import hit_key, weighted_rrf
+from .context import citations, pack_contexts
+from .streaming import build_messages, replay_tokens, sse, stream_tokens
 
 from .vectorstore import QDRANT_URL, COLLECTION
 
-FUSION_K = 60
 TOPK_VEC = int(os.getenv("TOPK_VEC", "20"))
 TOPK_BM25 = int(os.getenv("TOPK_BM25", "50"))
 FUSION_TOPK = int(os.getenv("FUSION_TOPK", "6"))
@@ -39,7 +60,13 @@ RERANK_K = int(os.getenv("RERANK_K", "6"))
 RERANK_LAMBDA = float(os.getenv("RERANK_LAMBDA", "0.7"))
 
 
-def _apply_rerank(query: str, matches: list[dict[str, Any]], final_k: int | None = None):
+def _apply_rerank(
+    query: str,
+    matches: list[dict[str, Any]],
+    final_k: int | None = None,
+    q_vec: list[float] | None = None,
+    cand_vecs: list[list[float] | None] | None = None,
+):
     if not matches:
         return []
 
@@ -47,12 +74,18 @@ def _apply_rerank(query: str, matches: list[dict[str, Any]], final_k: int | None
     if RERANK_METHOD == "none":
         return matches[:k]
 
-    # Build vectors for query and candidates
-    q_vec = embed_texts([query])[0]
-    cand_texts = [m.get("text") or "" for m in matches]
-    cand_vecs = embed_texts(cand_texts)
-
-    order = mmr(q_vec, cand_vecs, k=k, lambd=RERANK_LAMBDA)
+    # Query vector is normally handed in by the caller; candidate vectors come from the
+    # vector store, so only text we could not find there is (re-)embedded here.
+    if q_vec is None:
+        q_vec = embed_texts([query])[0]
+    vecs: list[list[float] | None] = list(cand_vecs) if cand_vecs else [None] * len(matches)
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    if missing:
+        extra = embed_texts([matches[i].get("text") or "" for i in missing])
+        for i, v in zip(missing, extra):
+            vecs[i] = v
+
+    order = mmr(q_vec, vecs, k=k, lambd=RERANK_LAMBDA)  # type: ignore[arg-type]
     return [matches[i] for i in order]
 
 
@@ -65,6 +98,26 @@ DEV_ORIGINS = [
     "http://127.0.0.1:5174",
 ]
 
+UPLOAD_PATHS = ("/ingest", "/jobs")
+# multipart framing (boundary lines, part headers, small form fields) around the file
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+
+@app.middleware("http")
+async def upload_size_limit(request: Request, call_next):
+    # a declared oversize upload is refused before the form parser spools it to disk;
+    # _save_upload still enforces the cap on what actually arrives
+    if request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        declared = request.headers.get("content-length", "")
+        limit = settings.MAX_UPLOAD_MB * 1024 * 1024 + UPLOAD_OVERHEAD_BYTES
+        if declared.isdigit() and int(declared) > limit:
+            return JSONResponse(
+                {"detail": f"File too large (> {settings.MAX_UPLOAD_MB}MB)"}, status_code=413
+            )
+    return await call_next(request)
+
+
+# added after the size check so that CORS headers wrap its 413 as well
 app.add_middleware(
     CORSMiddleware,
     allow_origins=DEV_ORIGINS,
@@ -92,68 +145,163 @@ async def stream():
     return StreamingResponse(sse_event_gen(), media_type="text/event-stream")
 
 
-def sha256_of_file(path: Path) -> str:
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+async def _save_upload(file: UploadFile, raw_dir: Path) -> tuple[Path, str, int]:
+    """
+    Stream an upload to disk in fixed-size chunks, hashing as it goes, and store it
+    content-addressed as raw/<sha256><suffix>. Aborts with 413 as soon as the size
+    passes MAX_UPLOAD_MB.
+    """
+    limit = settings.MAX_UPLOAD_MB * 1024 * 1024
+    suffix = Path(file.filename or "").suffix.lower()
+    tmp = raw_dir / f".upload-{uuid.uuid4().hex}.part"
     h = hashlib.sha256()
-    with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    size = 0
+    try:
+        with tmp.open("wb") as out:
+
+            def write(chunk: bytes) -> None:
+                h.update(chunk)
+                out.write(chunk)
+
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(413, f"File too large (> {settings.MAX_UPLOAD_MB}MB)")
+                # hashing and disk writes stay off the event loop
+                await asyncio.to_thread(write, chunk)
+        doc_id = h.hexdigest()
+        dest = raw_dir / f"{doc_id}{suffix}"
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return dest, doc_id, size
 
 
 @app.post("/ingest")
 async def ingest(file: UploadFile = File(...)):
-    contents = await file.read()
-    mb = len(contents) / (1024 * 1024)
-    if mb > settings.MAX_UPLOAD_MB:
-        raise HTTPException(413, f"File too large ({mb:.1f}MB > {settings.MAX_UPLOAD_MB}MB)")
+    kind = detect_type(Path(file.filename or ""))
+    if kind == "unknown":
+        raise HTTPException(415, f"Unsupported file type: {Path(file.filename or '').suffix}")
 
-    ts = int(time.time())
     raw_dir = settings.DATA_DIR / "raw"
     raw_dir.mkdir(parents=True, exist_ok=True)
-    dest = raw_dir / f"{ts}_{file.filename}"
-    dest.write_bytes(contents)
-
-    kind = detect_type(dest)
-    if kind == "unknown":
-        raise HTTPException(415, f"Unsupported file type: {dest.suffix}")
+    dest, doc_id, size = await _save_upload(file, raw_dir)
 
-    text = extract_text(dest, kind)
-    norm_dir = settings.DATA_DIR / "normalized"
-    norm_dir.mkdir(parents=True, exist_ok=True)
-    norm = norm_dir / (dest.stem + ".txt")
-    norm.write_text(text, encoding="utf-8")
+    # identical bytes were ingested before: reuse the extraction instead of redoing it
+    manifest = get_manifest()
+    known = await asyncio.to_thread(manifest.get_doc, doc_id)
+    if known and known["normalized_path"] and Path(known["normalized_path"]).exists():
+        return JSONResponse(
+            {
+                "doc_id": doc_id,
+                "filename": file.filename,
+                "kind": known["kind"],
+                "bytes": size,
+                "chunks": known["n_chunks"],
+                "paths": {"raw": str(dest), "normalized": known["normalized_path"]},
+                "deduplicated": True,
+            }
+        )
 
-    doc_id = sha256_of_file(dest)
-    chunks = chunk_text(text) if text else []
+    # CPU-bound parsing/OCR runs in the extraction process pool, not on the event loop;
+    # the text goes straight to the normalized file and is chunk-counted from there
+    norm = settings.DATA_DIR / "normalized" / (dest.stem + ".txt")
+    try:
+        sha = await extract_to_file(dest, kind, norm)
+    except ExtractionTimeout as e:
+        raise HTTPException(504, f"Extraction timed out: {e}")
+
+    n_chunks = await asyncio.to_thread(lambda: sum(1 for _ in doc_chunks(norm, kind=kind)))
+    await asyncio.to_thread(
+        manifest.put_doc,
+        doc_id,
+        filename=file.filename,
+        kind=kind,
+        bytes=size,
+        raw_path=str(dest),
+        normalized_path=str(norm),
+        text_sha=sha,
+        n_chunks=n_chunks,
+    )
 
     return JSONResponse(
         {
             "doc_id": doc_id,
             "filename": file.filename,
             "kind": kind,
-            "bytes": len(contents),
-            "chunks": len(chunks),
+            "bytes": size,
+            "chunks": n_chunks,
             "paths": {"raw": str(dest), "normalized": str(norm)},
+            "deduplicated": False,
         }
     )
 
 
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    doc_id: str | None = Form(None),
+    chunk_tokens: int = Form(400),
+    overlap: int = Form(60),
+):
+    """
+    Queue a document for background ingestion (extract -> chunk -> embed -> index).
+    Re-submitting a document that is still queued or running returns the existing job.
+    """
+    if _jobs is None:
+        raise HTTPException(503, "job workers not running")
+    kind = detect_type(Path(file.filename or ""))
+    if kind == "unknown":
+        raise HTTPException(415, f"Unsupported file type: {Path(file.filename or '').suffix}")
+
+    raw_dir = settings.DATA_DIR / "raw"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    dest, sha, size = await _save_upload(file, raw_dir)
+    job = new_job(
+        sha,
+        str(dest),
+        kind,
+        file.filename or dest.name,
+        index_doc_id=doc_id,
+        chunk_tokens=chunk_tokens,
+        overlap=overlap,
+        bytes=size,
+    )
+    return await asyncio.to_thread(_jobs.queue.enqueue, job)
+
+
+@app.get("/jobs")
+async def list_jobs(state: str | None = None, limit: int = 50):
+    if _jobs is None:
+        raise HTTPException(503, "job workers not running")
+    return {"jobs": await asyncio.to_thread(_jobs.queue.list, state, limit)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    if _jobs is None:
+        raise HTTPException(503, "job workers not running")
+    job = await asyncio.to_thread(_jobs.queue.get, job_id)
+    if job is None:
+        raise HTTPException(404, f"job not found: {job_id}")
+    return job
+
+
 class EmbedReq(BaseModel):
     normalized_path: str
     doc_id: str | None = None
     kind: str | None = None
     chunk_tokens: int = 400
     overlap: int = 60
+    force: bool = False
 
 
 @app.post("/embed")
-def embed(req: EmbedReq):
-    # 1) read normalized text
-    from pathlib import Path
-    import uuid
-    from fastapi import HTTPException
-    from .config import settings
-
+async def embed(req: EmbedReq):
+    # 1) locate the normalized text
     p = Path(req.normalized_path)
     if not p.is_absolute():
         p = Path(settings.DATA_DIR) / "normalized" / p.name
@@ -163,46 +311,31 @@ def embed(req: EmbedReq):
         raise HTTPException(400, f"normalized path is a directory, expected a .txt file: {p}")
     if p.suffix.lower() != ".txt":
         raise HTTPException(400, f"normalized path must point to a .txt file: {p}")
-    text = p.read_text(encoding="utf-8", errors="replace")
-
-    # 2) chunk (already there)
-    chunks = chunk_text(text, chunk_tokens=req.chunk_tokens, overlap=req.overlap)
-
-    # 3) embed in small batches and prepare upserts
-    batch = 64
-    to_upsert = []
-    fts_rows = []
+    # 2) chunk lazily from disk, 3) embed token-budgeted batches concurrently and upsert as they land;
+    # skipped entirely when the manifest says this text is already indexed with these params
     base_doc_id = req.doc_id or Path(req.normalized_path).stem
-
-    for i in range(0, len(chunks), batch):
-        part = chunks[i : i + batch]
-        vecs = embed_texts(part)
-        for j, v in enumerate(vecs):
-            idx = i + j
-            human_chunk_id = f"{base_doc_id}:{idx}"  # keep this for FTS & payload
-            payload = {
-                "doc_id": base_doc_id,
-                "kind": req.kind,
-                "chunk_index": idx,
-                "source_path": str(p),
-                "text": part[j],
-                "chunk_id": human_chunk_id,  # <— add here
-            }
-            # Qdrant point id must be UUID (idempotent via uuid5 on our human id)
-            point_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, human_chunk_id))
-            to_upsert.append({"id": point_uuid, "vector": v, "payload": payload})
-            fts_rows.append(
-                {
-                    "chunk_id": human_chunk_id,
-                    "text": part[j],
-                    "kind": req.kind,
-                    "chunk_index": idx,
-                }
-            )
-
-    if to_upsert:
-        upsert_vectors(to_upsert)
-    return {"upserted": len(to_upsert)}
+    stats = await index_text(
+        base_doc_id,
+        p,
+        chunk_tokens=req.chunk_tokens,
+        overlap=req.overlap,
+        kind=req.kind,
+        source_path=str(p),
+        force=req.force,
+    )
+    written = stats.get("written", 0)
+    return {
+        "upserted": written,
+        "fts_indexed": written,
+        "chunks": stats["chunks"],
+        "unchanged": stats["unchanged"],
+        "reused": stats["reused"],
+        "deleted": stats["deleted"],
+        "skipped": stats["skipped"],
+        "batches": stats["batches"],
+        "tokens": stats["tokens"],
+        "elapsed_ms": stats["elapsed_ms"],
+    }
 
 
 class QueryReq(BaseModel):
@@ -214,26 +347,32 @@ class QueryReq(BaseModel):
 def query(req: QueryReq):
     vec = embed_texts([req.query])[0]
     hits = safe_search_vector(vec, top_k=req.top_k)
-    out = []
-    for h in hits:
-        pl = h.payload or {}
-        out.append(
-            {
-                "score": getattr(h, "score", None),
-                "doc_id": pl.get("doc_id"),
-                "kind": pl.get("kind"),
-                "chunk_index": pl.get("chunk_index"),
-                "source_path": pl.get("source_path"),
-                "text": pl.get("text"),
-            }
-        )
-    return {"matches": out}
+    return {"matches": [_point_match(h) for h in hits]}
+
+
+_jobs: JobRunner | None = None
 
 
 @app.on_event("startup")
-def _startup():
+async def _startup():
+    global _jobs
     ensure_collection()
     ensure_fts()
+    start_pool()
+    _jobs = JobRunner(make_queue())
+    await _jobs.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    if _jobs is not None:
+        await _jobs.stop()
+    await close_embedder()
+    await close_clients()
+    await close_retrieval_cache()
+    await close_vectorstore()
+    close_fts()
+    shutdown_pool()
 
 
 def _clean_fts_query(q: str) -> str:
@@ -249,80 +388,391 @@ class HybridQueryReq(BaseModel):
     top_k: int | None = None
 
 
+def _rerank_stage(
+    query: str,
+    ranked: list[str],
+    results: list[dict[str, Any]],
+    out_dense: Dict[str, Dict[str, Any]],
+    qvec: list[float],
+    top_k: int,
+):
+    # candidate vectors: dense hits carry theirs; FTS-only hits are fetched in one bulk retrieve
+    cand_vecs = [out_dense[cid]["vector"] if cid in out_dense else None for cid in ranked]
+    kw_only = {point_id(cid): i for i, cid in enumerate(ranked) if cid not in out_dense}
+    if kw_only and RERANK_METHOD != "none":
+        stored = retrieve_vectors(list(kw_only))
+        for pid, i in kw_only.items():
+            cand_vecs[i] = stored.get(pid)
+    return _apply_rerank(query, results, final_k=top_k, q_vec=qvec, cand_vecs=cand_vecs)
+
+
+async def _dense_branch(query: str, timings: Dict[str, float]):
+    t0 = time.perf_counter()
+    qvec = await get_embedder().embed_query(query)
+    t1 = time.perf_counter()
+    vhits = await async_search_vector(qvec, TOPK_VEC, True)
+    t2 = time.perf_counter()
+    timings["embed_ms"] = (t1 - t0) * 1000
+    timings["vector_search_ms"] = (t2 - t1) * 1000
+    timings["dense_ms"] = (t2 - t0) * 1000
+    return qvec, vhits
+
+
+async def _keyword_branch(query: str, timings: Dict[str, float]):
+    t0 = time.perf_counter()
+    khits = await asyncio.to_thread(fts_search, _clean_fts_query(query), TOPK_BM25)
+    timings["keyword_ms"] = (time.perf_counter() - t0) * 1000
+    return khits
+
+
+async def _retrieve(query: str, top_k: int, timings: Dict[str, float]):
+    """
+    Dense + keyword retrieval fused with weighted RRF. Returns the fused candidate pool
+    (top_k * 3, for rerank) as result dicts, their chunk keys, the dense hits by key and
+    the query vector.
+    """
+    t0 = time.perf_counter()
+    # dense (embed -> Qdrant) and keyword (FTS5) sides run concurrently
+    (qvec, vhits), khits = await asyncio.gather(
+        _dense_branch(query, timings), _keyword_branch(query, timings)
+    )
+    t_fuse = time.perf_counter()
+    results, ranked, out_dense = _fuse(vhits, khits, top_k)
+    t_end = time.perf_counter()
+    timings["fusion_ms"] = (t_end - t_fuse) * 1000
+    timings["retrieval_ms"] = (t_end - t0) * 1000
+    return results, ranked, out_dense, qvec
+
+
+def _fuse(vhits: list, khits: list[dict[str, Any]], top_k: int):
+    """
+    Weighted-RRF fusion of one query's dense and keyword hits into the rerank pool
+    (top_k * 3). Returns the result dicts, their chunk keys and the dense hits by key.
+    """
+    # normalize both sides to the canonical "doc:idx" chunk key so a chunk found by
+    # both retrievers is fused into one candidate
+    out_dense: Dict[str, Dict[str, Any]] = {}
+    for h in sorted(vhits, key=lambda x: -x.score):
+        key = hit_key(h)
+        if key is not None and key not in out_dense:
+            out_dense[key] = {
+                "score": h.score,
+                "payload": h.payload or {},
+                "vector": h.vector if isinstance(h.vector, list) else None,
+            }
+    out_kw: Dict[str, Dict[str, Any]] = {}
+    for h in khits:
+        key = hit_key(h)
+        if key is not None and key not in out_kw:
+            out_kw[key] = h
+
+    # weighted RRF; take a wider pool for rerank
+    fused = weighted_rrf(
+        {"dense": list(out_dense), "keyword": list(out_kw)},
+        top_n=top_k * 3,
+        weights=settings.FUSION_WEIGHTS,
+        ks=settings.FUSION_RRF_K,
+    )
+
+    # materialize payloads
+    def materialize(key: str, score: float) -> Dict[str, Any]:
+        src = out_dense[key]["payload"] if key in out_dense else out_kw.get(key, {})
+        return {
+            "chunk_id": key,
+            "doc_id": src.get("doc_id"),
+            "kind": src.get("kind"),
+            "chunk_index": src.get("chunk_index"),
+            "char_start": src.get("char_start"),
+            "char_end": src.get("char_end"),
+            "source_path": src.get("source_path"),
+            "text": src.get("text"),
+            "fusion_score": score,
+        }
+
+    ranked = [key for key, _ in fused]
+    results = [materialize(key, score) for key, score in fused]
+    return results, ranked, out_dense
+
+
+async def _retrieval_cache_key(query: str, top_k: int) -> str | None:
+    return (await _retrieval_cache_keys([query], top_k))[0]
+
+
+async def _retrieval_cache_keys(queries: list[str], top_k: int) -> list[str | None]:
+    # everything that changes the ranked output is in the key, the corpus generation included
+    cache = get_retrieval_cache()
+    generation = await cache.generation() if cache is not None else None
+    if cache is None or generation is None:
+        return [None] * len(queries)
+    params = {
+        "collection": COLLECTION,
+        "model": settings.EMBEDDING_MODEL,
+        "topk_vec": TOPK_VEC,
+        "topk_bm25": TOPK_BM25,
+        "fusion_weights": settings.FUSION_WEIGHTS,
+        "fusion_k": settings.FUSION_RRF_K,
+        "rerank": [RERANK_METHOD, RERANK_K, RERANK_LAMBDA],
+    }
+    return [cache.key(generation, _clean_fts_query(q), top_k, params) for q in queries]
+
+
+async def _cached_retrieval(key: str | None) -> Dict[str, Any] | None:
+    cache = get_retrieval_cache()
+    if key is None or cache is None:
+        return None
+    return await cache.get(key)
+
+
+async def _cache_retrieval(key: str | None, reranked: list, results: list) -> None:
+    cache = get_retrieval_cache()
+    if key is not None and cache is not None:
+        await cache.put(key, {"matches": reranked, "candidates": [_source(c) for c in results]})
+
+
 @app.post("/query_hybrid")
-def query_hybrid(req: HybridQueryReq):
+async def query_hybrid(req: HybridQueryReq):
     top_k = req.top_k or FUSION_TOPK
+    timings: Dict[str, float] = {}
+    t_start = time.perf_counter()
+    key = await _retrieval_cache_key(req.query, top_k)
+    cached = await _cached_retrieval(key)
+    if cached is not None:
+        timings["total_ms"] = (time.perf_counter() - t_start) * 1000
+        return {
+            "matches": cached["matches"],
+            "method": "hybrid-rrf+mmr",
+            "debug": {"timings_ms": _round_timings(timings), "cache": "hit"},
+        }
 
-    # dense side
-    qvec = embed_texts([req.query])[0]
-    vhits = safe_search_vector(qvec, top_k=TOPK_VEC)
-    khits = fts_search(req.query.strip().rstrip("?"), limit=TOPK_BM25)
+    results, ranked, out_dense, qvec = await _retrieve(req.query, top_k, timings)
 
-    # keyword side
-    clean = _clean_fts_query(req.query)
-    khits = fts_search(clean, limit=TOPK_BM25)
+    # NEW: MMR rerank to final K
+    t_rerank = time.perf_counter()
+    reranked = await asyncio.to_thread(
+        _rerank_stage, req.query, ranked, results, out_dense, qvec, top_k
+    )
+    t_end = time.perf_counter()
+    timings["rerank_ms"] = (t_end - t_rerank) * 1000
+    timings["total_ms"] = (t_end - t_start) * 1000
+    await _cache_retrieval(key, reranked, results)
+    return {
+        "matches": reranked,
+        "method": "hybrid-rrf+mmr",
+        "debug": {"timings_ms": _round_timings(timings), "cache": "miss"},
+    }
 
-    # map to ranks
-    v_rank: Dict[str, int] = {}
-    out_dense: Dict[str, Dict[str, Any]] = {}
-    for rank, h in enumerate(sorted(vhits, key=lambda x: -x.score), start=1):
-        cid = (
-            h.id
-            if hasattr(h, "id")
-            else str(h.payload.get("doc_id")) + ":" + str(h.payload.get("chunk_index"))
-        )
-        v_rank[str(cid)] = rank
-        out_dense[str(cid)] = {
-            "score": h.score,
-            "payload": h.payload or {},
-        }
 
-    k_rank: Dict[str, int] = {}
-    out_kw: Dict[str, Dict[str, Any]] = {}
-    for rank, h in enumerate(khits, start=1):
-        cid = h["chunk_id"]
-        k_rank[cid] = rank
-        out_kw[cid] = h
-
-    # RRF fuse
-    fused: Dict[str, float] = {}
-    for cid, r in v_rank.items():
-        fused[cid] = fused.get(cid, 0.0) + 1.0 / (FUSION_K + r)
-    for cid, r in k_rank.items():
-        fused[cid] = fused.get(cid, 0.0) + 1.0 / (FUSION_K + r)
+def _round_timings(timings: Dict[str, float]) -> Dict[str, float]:
+    return {k: round(v, 2) for k, v in timings.items()}
 
-    # materialize payloads
-    def materialize(cid: str) -> Dict[str, Any]:
-        if cid in out_dense:
-            pl = out_dense[cid]["payload"]
-            return {
-                "chunk_id": cid,
-                "doc_id": pl.get("doc_id"),
-                "kind": pl.get("kind"),
-                "chunk_index": pl.get("chunk_index"),
-                "source_path": pl.get("source_path"),
-                "text": pl.get("text"),
-            }
-        if cid in out_kw:
-            h = out_kw[cid]
-            return {
-                "chunk_id": cid,
-                "doc_id": h.get("doc_id"),
-                "kind": h.get("kind"),
-                "chunk_index": h.get("chunk_index"),
-                "source_path": h.get("source_path"),
-                "text": h.get("text"),
-            }
-        return {"chunk_id": cid}
 
-    ranked = sorted(fused.items(), key=lambda kv: -kv[1])[
-        : top_k * 3
-    ]  # take a wider pool for rerank
-    results = [materialize(cid) for cid, _ in ranked]
+class BatchQueryReq(BaseModel):
+    queries: list[str]
+    top_k: int | None = None
+
+
+def _check_batch(queries: list[str]) -> list[int]:
+    # indices of the queries worth running; empty ones get a per-query error
+    if len(queries) > settings.QUERY_BATCH_MAX:
+        raise HTTPException(413, f"at most {settings.QUERY_BATCH_MAX} queries per batch")
+    return [i for i, q in enumerate(queries) if q and q.strip()]
+
+
+def _batch_results(queries: list[str], done: Dict[int, Any]) -> list[Dict[str, Any]]:
+    # input order; a slot holds its matches dict, or the error that hit that query alone
+    out = []
+    for i, q in enumerate(queries):
+        r = done.get(i, ValueError("empty query"))
+        if isinstance(r, Exception):
+            out.append({"query": q, "error": f"{type(r).__name__}: {r}"})
+        else:
+            out.append({"query": q, **r})
+    return out
 
-    # NEW: MMR rerank to final K
-    reranked = _apply_rerank(req.query, results, final_k=top_k)
-    return {"matches": reranked, "method": "hybrid-rrf+mmr"}
+
+def _point_match(h: Any) -> Dict[str, Any]:
+    pl = h.payload or {}
+    return {
+        "score": getattr(h, "score", None),
+        "doc_id": pl.get("doc_id"),
+        "kind": pl.get("kind"),
+        "chunk_index": pl.get("chunk_index"),
+        "source_path": pl.get("source_path"),
+        "text": pl.get("text"),
+    }
+
+
+async def _embed_batch(texts: list[str]) -> list[Any]:
+    """
+    One embeddings call for the batch. If it fails, each text is retried on its own so a
+    single bad input fails only its own slot (the exception takes its place).
+    """
+    embedder = get_embedder()
+    try:
+        return await embedder.embed(texts)
+    except Exception:
+        # embed([t]) goes out as its own request; embed_query would coalesce these calls
+        # back into one batch that fails as a whole
+        out = await asyncio.gather(*(embedder.embed([t]) for t in texts), return_exceptions=True)
+        return [r if isinstance(r, Exception) else r[0] for r in out]
+
+
+async def _search_batch(vecs: list[Any], limit: int, with_vectors: bool = False) -> list[Any]:
+    # async_search_batch over the slots that have a vector; failed slots keep their error
+    ok = [n for n, v in enumerate(vecs) if not isinstance(v, Exception)]
+    out = list(vecs)
+    if ok:
+        for n, h in zip(ok, await async_search_batch([vecs[n] for n in ok], limit, with_vectors)):
+            out[n] = h
+    return out
+
+
+@app.post("/query_batch")
+async def query_batch(req: BatchQueryReq):
+    """Dense-only /query for many queries: one embeddings call, one Qdrant batch search."""
+    todo = _check_batch(req.queries)
+    done: Dict[int, Any] = {}
+    if todo:
+        vecs = await _embed_batch([req.queries[i] for i in todo])
+        try:
+            hits = await _search_batch(vecs, req.top_k or 5)
+        except Exception as e:
+            hits = [e] * len(todo)  # the shared search failed: every query in it fails
+        for i, h in zip(todo, hits):
+            done[i] = h if isinstance(h, Exception) else {"matches": [_point_match(x) for x in h]}
+    return {"results": _batch_results(req.queries, done)}
+
+
+def _rerank_batch(
+    pools: list[tuple],
+    qvecs: list[list[float]],
+    top_k: int,
+) -> list[list[dict[str, Any]]]:
+    """
+    _rerank_stage for a whole batch: FTS-only candidates of every query are fetched in one
+    retrieve, anything still without a vector is embedded in one call, and MMR runs over
+    all queries through rerank.mmr_batch.
+    """
+    k = top_k or RERANK_K
+    if RERANK_METHOD == "none":
+        return [results[:k] for results, _, _ in pools]
+
+    cand_sets = [
+        [out_dense[cid]["vector"] if cid in out_dense else None for cid in ranked]
+        for _, ranked, out_dense in pools
+    ]
+    kw_only = {
+        point_id(cid) for _, ranked, out_dense in pools for cid in ranked if cid not in out_dense
+    }
+    stored = retrieve_vectors(list(kw_only)) if kw_only else {}
+    missing = []
+    for (results, ranked, _), vecs in zip(pools, cand_sets):
+        for j, cid in enumerate(ranked):
+            if vecs[j] is None:
+                vecs[j] = stored.get(point_id(cid))
+            if vecs[j] is None:
+                missing.append((vecs, j, results[j].get("text") or ""))
+    if missing:
+        for (vecs, j, _), v in zip(missing, embed_texts([t for _, _, t in missing])):
+            vecs[j] = v
+
+    orders = mmr_batch(qvecs, cand_sets, k=k, lambd=RERANK_LAMBDA)
+    return [[results[i] for i in order] for (results, _, _), order in zip(pools, orders)]
+
+
+@app.post("/query_hybrid_batch")
+async def query_hybrid_batch(req: BatchQueryReq):
+    """
+    /query_hybrid for many queries. Cached queries are answered from the retrieval cache;
+    the rest share one embeddings call, one Qdrant batch search, one FTS connection and
+    one batched MMR. Results come back in input order; a query that fails carries its own
+    error and does not fail the others.
+    """
+    top_k = req.top_k or FUSION_TOPK
+    timings: Dict[str, float] = {}
+    t_start = time.perf_counter()
+    queries = req.queries
+    todo = _check_batch(queries)
+    done: Dict[int, Any] = {}
+
+    keys = await _retrieval_cache_keys(queries, top_k)
+    hits = await asyncio.gather(*(_cached_retrieval(keys[i]) for i in todo))
+    for i, cached in zip(todo, hits):
+        if cached is not None:
+            done[i] = {"matches": cached["matches"], "cache": "hit"}
+    todo = [i for i in todo if i not in done]
+
+    if todo:
+
+        async def dense():
+            t0 = time.perf_counter()
+            vecs = await _embed_batch([queries[i] for i in todo])
+            t1 = time.perf_counter()
+            hits = await _search_batch(vecs, TOPK_VEC, True)
+            timings["embed_ms"] = (t1 - t0) * 1000
+            timings["vector_search_ms"] = (time.perf_counter() - t1) * 1000
+            return vecs, hits
+
+        async def keyword():
+            t0 = time.perf_counter()
+            hits = await asyncio.to_thread(
+                fts_search_batch, [_clean_fts_query(queries[i]) for i in todo], TOPK_BM25
+            )
+            timings["keyword_ms"] = (time.perf_counter() - t0) * 1000
+            return hits
+
+        dense_out, khits = await asyncio.gather(dense(), keyword(), return_exceptions=True)
+        for side in (dense_out, khits):
+            if isinstance(side, Exception):
+                # the shared embeddings call or search failed: every query in it fails
+                done.update((i, side) for i in todo)
+                todo = []
+        qvecs, vhits = dense_out if todo else ([], [])
+
+        t0 = time.perf_counter()
+        fused: Dict[int, tuple] = {}
+        for n, i in enumerate(todo):
+            if isinstance(vhits[n], Exception):
+                done[i] = vhits[n]
+                continue
+            try:
+                fused[i] = _fuse(vhits[n], khits[n], top_k)
+            except Exception as e:
+                done[i] = e
+        timings["fusion_ms"] = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        live = list(fused)
+        vec_of = dict(zip(todo, qvecs))
+        try:
+            reranked = await asyncio.to_thread(
+                _rerank_batch,
+                [fused[i] for i in live],
+                [vec_of[i] for i in live],
+                top_k,
+            )
+        except Exception:
+            # the shared retrieve/embed/MMR failed: rerank each query on its own so only
+            # the queries that actually fail carry the error
+            reranked = await asyncio.gather(
+                *(asyncio.to_thread(_rerank_batch, [fused[i]], [vec_of[i]], top_k) for i in live),
+                return_exceptions=True,
+            )
+            reranked = [r if isinstance(r, Exception) else r[0] for r in reranked]
+        timings["rerank_ms"] = (time.perf_counter() - t0) * 1000
+        for i, matches in zip(live, reranked):
+            if isinstance(matches, Exception):
+                done[i] = matches
+                continue
+            done[i] = {"matches": matches, "cache": "miss"}
+            await _cache_retrieval(keys[i], matches, fused[i][0])
+
+    timings["total_ms"] = (time.perf_counter() - t_start) * 1000
+    return {
+        "results": _batch_results(queries, done),
+        "method": "hybrid-rrf+mmr",
+        "debug": {"timings_ms": _round_timings(timings)},
+    }
 
 
 class GenerateReq(BaseModel):
@@ -330,12 +780,38 @@ class GenerateReq(BaseModel):
     top_k: int | None = None
 
 
+async def _answer_slot(query: str, contexts: list[dict[str, Any]]) -> tuple | None:
+    """
+    (generation, context key, query vector) addressing `query` in the semantic answer
+    cache, or None when the cache is off. The query vector normally comes from the
+    embedding cache, since retrieval just embedded the same text.
+    """
+    if get_answer_cache() is None:
+        return None
+    generation = await corpus_generation()
+    if generation is None:
+        return None
+    ctx_key = SemanticAnswerCache.context_key(
+        settings.CHAT_MODEL, [c.get("chunk_id") for c in contexts]
+    )
+    return generation, ctx_key, await get_embedder().embed_query(query)
+
+
 @app.post("/generate")
-def generate(req: GenerateReq):
+async def generate(req: GenerateReq):
     # use hybrid retrieval first
-    hyb = query_hybrid(HybridQueryReq(query=req.query, top_k=req.top_k))
+    hyb = await query_hybrid(HybridQueryReq(query=req.query, top_k=req.top_k))
     contexts = hyb["matches"]
-    out = generate_answer(req.query, contexts)
+    cache = get_answer_cache()
+    slot = await _answer_slot(req.query, contexts)
+    hit = cache.get(*slot) if cache is not None and slot is not None else None
+    if hit is not None:
+        out = dict(hit[0], cache={"hit": True, "similarity": round(hit[1], 4)})
+    else:
+        out = await asyncio.to_thread(generate_answer, req.query, contexts)
+        if cache is not None and slot is not None:
+            cache.put(*slot, {"answer": out["answer"], "citations": out["citations"]})
+        out["cache"] = {"hit": False}
     # include the contexts for transparency/debug
     out["contexts"] = contexts
     return out
@@ -346,37 +822,153 @@ def collection_info():
     c = QdrantClient(url=QDRANT_URL)
     ci = c.get_collection(COLLECTION)
     cnt = c.count(COLLECTION, exact=True).count
+    quant = ci.config.quantization_config
     return {
         "collection": COLLECTION,
         "dim": ci.config.params.vectors.size,
         "distance": str(ci.config.params.vectors.distance),
         "points_count": cnt,
+        "profile": settings.QDRANT_PROFILE,
+        "quantization": quant.model_dump(exclude_none=True) if quant else None,
+        "on_disk": bool(ci.config.params.vectors.on_disk),
+        "on_disk_payload": bool(ci.config.params.on_disk_payload),
+        "hnsw": {"m": ci.config.hnsw_config.m, "ef_construct": ci.config.hnsw_config.ef_construct},
     }
 
 
 @app.get("/admin/fts_count")
 def fts_count():
-    import sqlite3
-    from pathlib import Path
-
-    DB = Path("/app/data/hybrid.db")
-    if not DB.exists():
-        return {"fts_rows": 0}
-    con = sqlite3.connect(DB)
-    cur = con.execute("SELECT count(*) FROM chunks_fts")
-    n = cur.fetchone()[0]
-    con.close()
-    return {"fts_rows": n}
+    return {"fts_rows": fts_rows()}
+
+
+@app.post("/admin/fts_optimize")
+def fts_optimize():
+    optimize_fts()
+    return {"ok": True, "fts_rows": fts_rows()}
+
+
+@app.get("/admin/retrieval_cache")
+async def retrieval_cache_stats():
+    cache = get_retrieval_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats(), "generation": await cache.generation()}
+
+
+@app.get("/admin/answer_cache")
+def answer_cache_stats():
+    cache = get_answer_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/admin/embed_cache")
+def embed_cache_stats():
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats(), "client": get_embedder().stats()}
+
+
+def _source(c: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ("chunk_id", "doc_id", "kind", "chunk_index", "source_path", "fusion_score")
+    return {k: c.get(k) for k in keys}
+
+
+async def _staged_answer(query: str, top_k: int) -> AsyncGenerator[str, None]:
+    """
+    SSE stages for one answer, each sent as soon as it is ready:
+    start -> retrieval (fused candidates, right after RRF) -> rerank (the packed contexts
+    with their citation numbers) -> token* (heartbeats while the model is silent) ->
+    stats (per-stage timings and time-to-first-token from the request) -> end (citations).
+    If the client disconnects, cancellation stops whichever stage is in flight, including the completion.
+    """
+    timings: Dict[str, float] = {}
+    t_start = time.perf_counter()
+    yield "event: start\ndata: {}\n\n"
+
+    key = await _retrieval_cache_key(query, top_k)
+    cached = await _cached_retrieval(key)
+    if cached is not None:
+        yield sse({"candidates": cached["candidates"], "cache": "hit"}, event="retrieval")
+        t0 = time.perf_counter()
+        reranked = cached["matches"]
+    else:
+        results, ranked, out_dense, qvec = await _retrieve(query, top_k, timings)
+        yield sse({"candidates": [_source(c) for c in results]}, event="retrieval")
+
+        t0 = time.perf_counter()
+        reranked = await asyncio.to_thread(
+            _rerank_stage, query, ranked, results, out_dense, qvec, top_k
+        )
+        await _cache_retrieval(key, reranked, results)
+    packed = await asyncio.to_thread(pack_contexts, reranked)
+    timings["rerank_ms"] = (time.perf_counter() - t0) * 1000
+
+    # a semantically cached answer is replayed as the same token events
+    cache = get_answer_cache()
+    slot = await _answer_slot(query, reranked)
+    hit = cache.get(*slot) if cache is not None and slot is not None else None
+
+    # the completion request goes out while the rerank event is still being written
+    stream: Dict[str, Any] = {}
+    if hit is not None:
+        tokens = replay_tokens(hit[0]["answer"] or "", stream)
+    else:
+        tokens = stream_tokens(build_messages(query, packed), stream)
+    pending = asyncio.ensure_future(tokens.__anext__())
+    answer: list[str] = []
+    failed = False
+    try:
+        yield sse(
+            {"contexts": [dict(_source(c), n=c["n"], text=c["text"]) for c in packed]},
+            event="rerank",
+        )
+        chunk = await pending
+        while True:
+            if chunk is None:
+                yield sse({}, event="heartbeat")
+            else:
+                timings.setdefault("ttft_ms", (time.perf_counter() - t_start) * 1000)
+                answer.append(chunk)
+                yield sse({"type": "token", "content": chunk})
+            chunk = await tokens.__anext__()
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        failed = True
+        yield sse({"message": f"{type(e).__name__}: {e}"}, event="error")
+    finally:
+        if not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await tokens.aclose()
+
+    if hit is None and answer and not failed and cache is not None and slot is not None:
+        cache.put(*slot, {"answer": "".join(answer), "citations": citations(packed)})
+
+    timings["generation_ms"] = stream.get("total_ms") or 0.0
+    timings["total_ms"] = (time.perf_counter() - t_start) * 1000
+    yield sse(
+        {
+            "timings_ms": _round_timings(timings),
+            "chunks": stream.get("chunks", 0),
+            "cache": {"hit": True, "similarity": round(hit[1], 4)} if hit else {"hit": False},
+        },
+        event="stats",
+    )
+    # the web client closes the stream on `end`; it carries the citations for the answer
+    # (a replayed answer keeps the ones its markers were written against)
+    cites = hit[0].get("citations") if hit is not None else None
+    yield sse({"citations": cites or citations(packed)}, event="end")
 
 
 @app.get("/generate_stream")
-def generate_stream(query: str, top_k: int | None = None):
-    # Use hybrid to get contexts, then MMR
-    hyb = query_hybrid(HybridQueryReq(query=query, top_k=top_k))
-    contexts = hyb["matches"]
-
-    async def sse():
-        async for line in stream_answer(query, contexts):
-            yield line
-
-    return StreamingResponse(sse(), media_type="text/event-stream")
+async def generate_stream(query: str, top_k: int | None = None):
+    return StreamingResponse(
+        _staged_answer(query, top_k or FUSION_TOPK),
+        media_type="text/event-stream",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
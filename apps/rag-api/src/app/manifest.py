@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .config import settings
+
+# docs:    one row per distinct upload, keyed by the SHA-256 of its bytes
+# indexes: one row per indexed doc_id (the id chunks are stored under), recording which
+#          text and chunking parameters are currently in Qdrant/FTS
+# chunks:  content hash and start offset of every chunk currently indexed under a doc_id
+# meta:    small counters shared by every process on this DATA_DIR (corpus generation)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+  doc_id TEXT PRIMARY KEY,
+  filename TEXT,
+  kind TEXT,
+  bytes INTEGER,
+  raw_path TEXT NOT NULL,
+  normalized_path TEXT,
+  text_sha TEXT,
+  n_chunks INTEGER,
+  created_at REAL NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS indexes (
+  doc_id TEXT PRIMARY KEY,
+  state TEXT NOT NULL,
+  text_sha TEXT,
+  chunk_tokens INTEGER,
+  overlap INTEGER,
+  n_chunks INTEGER,
+  kind TEXT,
+  source_path TEXT,
+  updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+  doc_id TEXT NOT NULL,
+  chunk_index INTEGER NOT NULL,
+  chunk_sha TEXT NOT NULL,
+  char_start INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (doc_id, chunk_index)
+);
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+"""
+
+
+class Manifest:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.row_factory = sqlite3.Row
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.executescript(_SCHEMA)
+        cols = {r[1] for r in self._con.execute("PRAGMA table_info(chunks)")}
+        if "char_start" not in cols:
+            # hashes only; a document missing them is simply fully re-indexed next time
+            self._con.execute("DROP TABLE chunks")
+            self._con.executescript(_SCHEMA)
+        self._con.commit()
+        self._lock = threading.Lock()
+
+    def _get(self, table: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._con.execute(f"SELECT * FROM {table} WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _upsert(self, table: str, doc_id: str, fields: Dict[str, Any]) -> None:
+        fields = dict(fields, doc_id=doc_id, updated_at=time.time())
+        cols = ", ".join(fields)
+        marks = ", ".join("?" * len(fields))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in fields if c != "doc_id")
+        with self._lock, self._con:
+            self._con.execute(
+                f"INSERT INTO {table} ({cols}) VALUES ({marks}) "
+                f"ON CONFLICT(doc_id) DO UPDATE SET {updates}",
+                list(fields.values()),
+            )
+
+    def get_doc(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._get("docs", doc_id)
+
+    def put_doc(self, doc_id: str, **fields: Any) -> None:
+        # merges into an existing record, so a later stage can add single fields
+        existing = self.get_doc(doc_id)
+        if existing is None:
+            fields.setdefault("created_at", time.time())
+        else:
+            fields = dict(existing, **fields)
+        self._upsert("docs", doc_id, fields)
+
+    def get_index(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._get("indexes", doc_id)
+
+    def set_index(self, doc_id: str, **fields: Any) -> None:
+        self._upsert("indexes", doc_id, fields)
+
+    def get_chunks(self, doc_id: str) -> Dict[int, Tuple[str, int]]:
+        with self._lock:
+            rows = self._con.execute(
+                "SELECT chunk_index, chunk_sha, char_start FROM chunks WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchall()
+        return {int(r[0]): (r[1], int(r[2])) for r in rows}
+
+    def set_chunks(self, doc_id: str, chunks: Dict[int, Tuple[str, int]]) -> None:
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self._con.executemany(
+                "INSERT INTO chunks(doc_id, chunk_index, chunk_sha, char_start) "
+                "VALUES (?, ?, ?, ?)",
+                [(doc_id, i, h, start) for i, (h, start) in chunks.items()],
+            )
+
+    def generation(self) -> int:
+        with self._lock:
+            row = self._con.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def bump_generation(self) -> int:
+        with self._lock, self._con:
+            row = self._con.execute(
+                "INSERT INTO meta(key, value) VALUES ('generation', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value"
+            ).fetchone()
+        return int(row[0])
+
+
+_manifest: Optional[Manifest] = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> Manifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = Manifest(Path(settings.DATA_DIR) / "manifest.db")
+        return _manifest
@@ -1,7 +1,95 @@
 from __future__ import annotations
-from typing import List
+from typing import List, Sequence
 import math
 
+import numpy as np
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    # Row-wise L2 normalization; zero rows stay zero (cosine 0 against everything)
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return np.divide(m, norms, out=np.zeros_like(m), where=norms > 0)
+
+
+def _select(rel: np.ndarray, sim: np.ndarray, k: int, lambd: float) -> List[int]:
+    """
+    Greedy MMR selection over precomputed relevance (n,) and pairwise similarity (n, n).
+    `max_sim` holds, for every candidate, its max similarity to anything selected so far,
+    so each round is one vector update instead of a rescan of the selected set.
+    """
+    n = rel.shape[0]
+    k = min(k, n)
+    selected: List[int] = []
+    taken = np.zeros(n, dtype=bool)
+    max_sim = np.full(n, -np.inf, dtype=np.float64)
+
+    # 1) pick the most relevant first
+    best = int(np.argmax(rel))
+    while True:
+        selected.append(best)
+        taken[best] = True
+        if len(selected) >= k:
+            break
+        # 2) fold the new pick into the running diversity term
+        np.maximum(max_sim, sim[best], out=max_sim)
+        score = lambd * rel - (1.0 - lambd) * max_sim
+        score[taken] = -np.inf
+        best = int(np.argmax(score))  # ties resolve to the lowest index
+    return selected
+
+
+def mmr(
+    query_vec: Sequence[float],
+    cand_vecs: Sequence[Sequence[float]],
+    k: int,
+    lambd: float = 0.7,
+) -> List[int]:
+    """
+    Maximal Marginal Relevance:
+    score(i) = λ * sim(query, i) - (1-λ) * max_{j in selected} sim(i, j)
+    Returns indices of selected items in order.
+    """
+    n = len(cand_vecs)
+    if n == 0 or k <= 0:
+        return []
+
+    c = _normalize(np.asarray(cand_vecs, dtype=np.float64))
+    q = _normalize(np.asarray(query_vec, dtype=np.float64))
+    return _select(c @ q, c @ c.T, k, lambd)
+
+
+def mmr_batch(
+    query_vecs: Sequence[Sequence[float]],
+    cand_sets: Sequence[Sequence[Sequence[float]]] | np.ndarray,
+    k: int,
+    lambd: float = 0.7,
+) -> List[List[int]]:
+    """
+    MMR for several queries at once. `cand_sets` is either one candidate matrix shared by
+    every query (a 2-D array) or one candidate list per query. Shared candidates are
+    normalized and multiplied once for the whole batch.
+    """
+    if k <= 0 or len(query_vecs) == 0:
+        return [[] for _ in query_vecs]
+
+    q = _normalize(np.asarray(query_vecs, dtype=np.float64))
+    if isinstance(cand_sets, np.ndarray) and cand_sets.ndim == 2:
+        if cand_sets.shape[0] == 0:
+            return [[] for _ in query_vecs]
+        c = _normalize(cand_sets.astype(np.float64, copy=False))
+        rel = q @ c.T
+        sim = c @ c.T
+        return [_select(rel[i], sim, k, lambd) for i in range(q.shape[0])]
+
+    out: List[List[int]] = []
+    for i, cands in enumerate(cand_sets):
+        if len(cands) == 0:
+            out.append([])
+            continue
+        c = _normalize(np.asarray(cands, dtype=np.float64))
+        out.append(_select(c @ q[i], c @ c.T, k, lambd))
+    return out
+
 
 # Cosine similarity (vectors already come from the same embedding model)
 def _cos(a: List[float], b: List[float]) -> float:
@@ -13,43 +101,35 @@ def _cos(a: List[float], b: List[float]) -> float:
     return dot / (da * db)
 
 
-def mmr(
+def _mmr_reference(
     query_vec: List[float],
     cand_vecs: List[List[float]],
     k: int,
     lambd: float = 0.7,
 ) -> List[int]:
     """
-    Maximal Marginal Relevance:
-    score(i) = λ * sim(query, i) - (1-λ) * max_{j in selected} sim(i, j)
-    Returns indices of selected items in order.
+    Original pure-Python MMR. Kept as the reference ordering for tests and
+    scripts/bench_mmr.py; not used on the request path.
     """
     n = len(cand_vecs)
     if n == 0 or k <= 0:
         return []
     k = min(k, n)
 
-    # Precompute similarities to query (relevance)
     rel = [_cos(query_vec, v) for v in cand_vecs]
 
     selected: List[int] = []
     remaining: set[int] = set(range(n))
 
-    # 1) pick the most relevant first
     best0 = max(remaining, key=lambda i: rel[i])
     selected.append(best0)
     remaining.remove(best0)
 
-    # 2) iteratively add the item that maximizes MMR
     while len(selected) < k and remaining:
         best_i = None
         best_score = -math.inf
         for i in remaining:
-            # diversity term: most similar to any already selected
-            if selected:
-                div = max(_cos(cand_vecs[i], cand_vecs[j]) for j in selected)
-            else:
-                div = 0.0
+            div = max(_cos(cand_vecs[i], cand_vecs[j]) for j in selected)
             s = lambd * rel[i] - (1.0 - lambd) * div
             if s > best_score:
                 best_score = s
@@ -1,50 +1,148 @@
 import os
+import re
 import json
 import asyncio
-from typing import AsyncGenerator, List, Dict, Any
-from openai import OpenAI
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from .clients import async_openai_client
+from .config import settings
+from .context import pack_contexts, render_snippets
 
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 
+log = logging.getLogger(__name__)
+
+_DONE = object()
 
-def build_messages(query: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+
+def build_messages(query: str, packed: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     system = (
         "You are a concise, accurate assistant. Answer ONLY from the provided context snippets. "
         "If the answer is not in the snippets, say you don't know. "
         "Add citation markers like [1], [2] immediately after claims they support."
     )
-    lines = ["Question:", query, "", "Context snippets:"]
-    for i, c in enumerate(contexts, start=1):
-        src = c.get("source_path")
-        txt = (c.get("text") or "").strip()
-        lines.append(f"[{i}] {txt}\n(Source: {src})")
+    lines = ["Question:", query, "", "Context snippets:", *render_snippets(packed)]
     return [
         {"role": "system", "content": system},
         {"role": "user", "content": "\n".join(lines)},
     ]
 
 
-async def stream_answer(query: str, contexts: List[Dict[str, Any]]) -> AsyncGenerator[str, None]:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    messages = build_messages(query, contexts)
+def sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
 
-    # Start streaming
-    stream = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=messages,
-        temperature=0.1,
-        stream=True,  # <— important
-    )
 
-    # Emit SSE lines: "data: {json}\n\n"
+async def stream_tokens(
+    messages: List[Dict[str, str]],
+    stats: Dict[str, Any],
+    client: Any = None,
+    heartbeat_s: Optional[float] = None,
+    queue_size: Optional[int] = None,
+) -> AsyncGenerator[Optional[str], None]:
+    """
+    Yield content deltas of one chat completion, or None as a heartbeat when nothing has
+    arrived for `heartbeat_s`.
+
+    A reader task pulls the upstream stream into a bounded queue: when the consumer is slow
+    the reader blocks on the queue and stops reading the socket (backpressure). Closing
+    this generator, e.g. because the SSE client went away and the response task was
+    cancelled, cancels the reader and closes the upstream response, which ends the
+    completion. `stats` receives ttft_ms, total_ms, chunks and cancelled.
+    """
+    client = client or async_openai_client()
+    heartbeat_s = settings.STREAM_HEARTBEAT_S if heartbeat_s is None else heartbeat_s
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.STREAM_QUEUE_MAX)
+    t0 = time.perf_counter()
+    stats.update(ttft_ms=None, chunks=0, cancelled=False)
+
+    async def reader() -> None:
+        stream = await client.chat.completions.create(
+            model=CHAT_MODEL, messages=messages, temperature=0.1, stream=True
+        )
+        try:
+            async for event in stream:
+                if not event.choices:
+                    continue
+                chunk = event.choices[0].delta.content
+                if chunk:
+                    await queue.put(chunk)
+        finally:
+            await stream.close()
+
+    async def run_reader() -> None:
+        try:
+            await reader()
+            await queue.put(_DONE)
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(run_reader())
+    finished = False
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), heartbeat_s)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item is _DONE:
+                finished = True
+                break
+            if isinstance(item, Exception):
+                finished = True
+                raise item
+            if stats["ttft_ms"] is None:
+                stats["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            stats["chunks"] += 1
+            yield item
+    finally:
+        stats["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if not finished:
+            stats["cancelled"] = True
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        log.info(
+            "chat stream: ttft=%sms total=%sms chunks=%d cancelled=%s",
+            stats["ttft_ms"],
+            stats["total_ms"],
+            stats["chunks"],
+            stats["cancelled"],
+        )
+
+
+async def replay_tokens(text: str, stats: Dict[str, Any]) -> AsyncGenerator[Optional[str], None]:
+    """A cached answer as a synthetic token stream: word-sized deltas, same stats as live."""
+    t0 = time.perf_counter()
+    pieces = [p for p in re.split(r"(?<=\s)(?=\S)", text) if p]
+    stats.update(ttft_ms=0.0, chunks=0, cancelled=False)
+    for piece in pieces:
+        stats["chunks"] += 1
+        yield piece
+    stats["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+async def stream_answer(
+    query: str, contexts: List[Dict[str, Any]], client: Any = None
+) -> AsyncGenerator[str, None]:
+    """SSE lines for one answer: start, token events, heartbeats, then end with timings."""
+    messages = build_messages(query, pack_contexts(contexts))
+    stats: Dict[str, Any] = {}
+
     yield "event: start\ndata: {}\n\n"
-    for event in stream:
-        delta = event.choices[0].delta
-        chunk = delta.content or ""
-        if chunk:
-            # Stream token chunk
-            payload = json.dumps({"type": "token", "content": chunk})
-            yield f"data: {payload}\n\n"
-        await asyncio.sleep(0)  # be friendly to the loop
-
-    yield "event: end\ndata: {}\n\n"
+    tokens = stream_tokens(messages, stats, client=client)
+    try:
+        async for chunk in tokens:
+            if chunk is None:
+                yield sse({}, event="heartbeat")
+            else:
+                yield sse({"type": "token", "content": chunk})
+    except Exception as e:
+        log.warning("chat stream failed: %s", e)
+        yield sse({"message": f"{type(e).__name__}: {e}"}, event="error")
+    finally:
+        await tokens.aclose()
+
+    yield sse(stats, event="end")
@@ -1,42 +1,186 @@
 import os
+import asyncio
+import logging
+import time
 import uuid
-from typing import Iterable, List, Dict, Any
-from qdrant_client import QdrantClient
+from typing import Iterable, List, Dict, Any, Optional
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models as qm
 from qdrant_client.http.exceptions import UnexpectedResponse, ResponseHandlingException
-import math
+
+from .config import settings
+
+log = logging.getLogger(__name__)
 
 QDRANT_URL = os.getenv("QDRANT_URL", "http://qdrant:6333")
 COLLECTION = os.getenv("QDRANT_COLLECTION", "rag_docs")
 DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
 
+# sync REST client: startup, admin and the sync endpoints
 _client = QdrantClient(url=QDRANT_URL, timeout=30.0)
+# async client for the request and ingest paths, gRPC when QDRANT_PREFER_GRPC; built lazily
+# so it binds to the running event loop
+_aclient: Optional[AsyncQdrantClient] = None
+_upsert_sem: Optional[asyncio.Semaphore] = None
+# "collection exists and has points": once true it stays true; a negative answer is
+# re-checked after READY_RECHECK_S, so searches on an empty store skip the round trip
+_ready = False
+_ready_checked = 0.0
+READY_RECHECK_S = 5.0
+
+
+def point_id(chunk_id: str) -> str:
+    # Qdrant point id must be UUID (idempotent via uuid5 on the human chunk id)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, str(chunk_id)))
 
 
 def _validate_vec(v: list[float], dim: int):
     if not isinstance(v, list) or len(v) != dim:
         raise ValueError(f"Vector length {len(v) if isinstance(v, list) else 'n/a'} != {dim}")
-    if not all((x is not None) and math.isfinite(float(x)) for x in v):
+    try:
+        arr = np.asarray(v, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Vector contains non-numeric values") from None
+    if not np.isfinite(arr).all():
         raise ValueError("Vector contains non-finite values")
 
 
+def _validate_vecs(vectors: List[List[float]], dim: int) -> None:
+    # one (n, dim) array check for a whole batch; the per-vector check only to name the culprit
+    try:
+        arr = np.asarray(vectors, dtype=np.float64)
+        ok = arr.shape == (len(vectors), dim) and bool(np.isfinite(arr).all())
+    except (TypeError, ValueError):
+        ok = False
+    if not ok:
+        for i, v in enumerate(vectors):
+            try:
+                _validate_vec(v, dim)
+            except ValueError as e:
+                raise ValueError(f"vector {i}: {e}") from None
+
+
+def _quantization(profile: str) -> Optional[qm.QuantizationConfig]:
+    always_ram = settings.QDRANT_QUANT_ALWAYS_RAM
+    if profile == "float":
+        return None
+    if profile == "int8":
+        return qm.ScalarQuantization(
+            scalar=qm.ScalarQuantizationConfig(
+                type=qm.ScalarType.INT8, quantile=0.99, always_ram=always_ram
+            )
+        )
+    if profile == "binary":
+        return qm.BinaryQuantization(binary=qm.BinaryQuantizationConfig(always_ram=always_ram))
+    raise ValueError(f"unknown QDRANT_PROFILE {profile!r} (float, int8, binary)")
+
+
+def _quant_signature(q: Any) -> Optional[tuple]:
+    # what the profile decides; server-side defaults in the stored config are ignored
+    if isinstance(q, qm.ScalarQuantization):
+        return ("int8", bool(q.scalar.always_ram))
+    if isinstance(q, qm.BinaryQuantization):
+        return ("binary", bool(q.binary.always_ram))
+    return None
+
+
+def vectors_on_disk() -> bool:
+    # quantized profiles search the in-RAM quantized copy and only rescore from the originals
+    if settings.QDRANT_ON_DISK is not None:
+        return settings.QDRANT_ON_DISK
+    return settings.QDRANT_PROFILE != "float"
+
+
+def search_params() -> Optional[qm.SearchParams]:
+    """hnsw_ef, and for quantized profiles oversampling + full-precision rescoring."""
+    quant = None
+    if settings.QDRANT_PROFILE != "float":
+        quant = qm.QuantizationSearchParams(
+            rescore=settings.QDRANT_QUANT_RESCORE,
+            oversampling=settings.QDRANT_QUANT_OVERSAMPLING,
+        )
+    if quant is None and not settings.QDRANT_HNSW_EF:
+        return None
+    return qm.SearchParams(hnsw_ef=settings.QDRANT_HNSW_EF or None, quantization=quant)
+
+
 def ensure_collection():
     collections = _client.get_collections().collections
     names = {c.name for c in collections}
     if COLLECTION in names:
+        migrate_collection()
         return
-    _client.recreate_collection(
+    _client.create_collection(
         collection_name=COLLECTION,
-        vectors_config=qm.VectorParams(size=DIM, distance=qm.Distance.COSINE),
+        vectors_config=qm.VectorParams(
+            size=DIM, distance=qm.Distance.COSINE, on_disk=vectors_on_disk()
+        ),
+        hnsw_config=qm.HnswConfigDiff(
+            m=settings.QDRANT_HNSW_M, ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT
+        ),
+        quantization_config=_quantization(settings.QDRANT_PROFILE),
+        on_disk_payload=settings.QDRANT_ON_DISK_PAYLOAD,
     )
 
 
-def upsert_vectors(items: Iterable[Dict[str, Any]]):
+def migrate_collection() -> List[str]:
+    """
+    Bring an existing collection to the configured profile in place with update_collection:
+    points stay where they are while Qdrant re-quantizes, re-indexes or moves storage in the
+    background. A size/distance mismatch cannot be migrated; it is logged and left alone
+    (re-index into a new collection instead). Returns the names of the settings changed.
+    """
+    want_quant = _quantization(settings.QDRANT_PROFILE)
+    cfg = _client.get_collection(COLLECTION).config
+    vec = cfg.params.vectors
+    if not isinstance(vec, qm.VectorParams):
+        log.warning("collection %s uses named vectors; profile not applied", COLLECTION)
+        return []
+    if vec.size != DIM or vec.distance != qm.Distance.COSINE:
+        log.error(
+            "collection %s is %s/%s, expected %s/Cosine; profile not applied",
+            COLLECTION,
+            vec.size,
+            vec.distance,
+            DIM,
+        )
+        return []
+
+    diff: Dict[str, Any] = {}
+    if bool(vec.on_disk) != vectors_on_disk():
+        diff["vectors_config"] = {"": qm.VectorParamsDiff(on_disk=vectors_on_disk())}
+    # None = server default; only act on it when we want payloads on disk
+    on_disk_payload = cfg.params.on_disk_payload
+    if (on_disk_payload is None and settings.QDRANT_ON_DISK_PAYLOAD) or (
+        on_disk_payload is not None and on_disk_payload != settings.QDRANT_ON_DISK_PAYLOAD
+    ):
+        diff["collection_params"] = qm.CollectionParamsDiff(
+            on_disk_payload=settings.QDRANT_ON_DISK_PAYLOAD
+        )
+    hnsw = (settings.QDRANT_HNSW_M, settings.QDRANT_HNSW_EF_CONSTRUCT)
+    if (cfg.hnsw_config.m, cfg.hnsw_config.ef_construct) != hnsw:
+        diff["hnsw_config"] = qm.HnswConfigDiff(m=hnsw[0], ef_construct=hnsw[1])
+    if _quant_signature(cfg.quantization_config) != _quant_signature(want_quant):
+        diff["quantization_config"] = want_quant or qm.Disabled.DISABLED
+    if diff:
+        _client.update_collection(collection_name=COLLECTION, **diff)
+        log.info(
+            "collection %s migrated to profile %s: %s",
+            COLLECTION,
+            settings.QDRANT_PROFILE,
+            sorted(diff),
+        )
+    return sorted(diff)
+
+
+def _points(items: Iterable[Dict[str, Any]]) -> List[qm.PointStruct]:
     # items: {"id": <optional>, "vector": list[float], "payload": dict}
+    items = list(items)
+    _validate_vecs([it["vector"] for it in items], DIM)
     points = []
     for it in items:
-        v = it["vector"]
-        _validate_vec(v, DIM)
         pid = it.get("id")
         if not pid:
             pid = str(uuid.uuid4())
@@ -46,7 +190,7 @@ def upsert_vectors(items: Iterable[Dict[str, Any]]):
                 _ = uuid.UUID(str(pid))
                 pid = str(pid)
             except Exception:
-                pid = str(uuid.uuid5(uuid.NAMESPACE_URL, str(pid)))
+                pid = point_id(pid)
         points.append(
             qm.PointStruct(
                 id=pid,
@@ -54,7 +198,13 @@ def upsert_vectors(items: Iterable[Dict[str, Any]]):
                 payload=it["payload"],
             )
         )
-    _client.upsert(collection_name=COLLECTION, points=points)
+    return points
+
+
+def upsert_vectors(items: Iterable[Dict[str, Any]]):
+    global _ready
+    _client.upsert(collection_name=COLLECTION, points=_points(items))
+    _ready = True
 
 
 def search_vector(vector: List[float], top_k: int = 5):
@@ -63,6 +213,7 @@ def search_vector(vector: List[float], top_k: int = 5):
         query_vector=vector,
         limit=top_k,
         with_payload=True,
+        search_params=search_params(),
     )
 
 
@@ -73,17 +224,229 @@ def points_count() -> int:
         return 0
 
 
-def safe_search_vector(vector: List[float], top_k: int = 5):
+def safe_search_vector(vector: List[float], top_k: int = 5, with_vectors: bool = False):
     _validate_vec(vector, DIM)
-    if points_count() == 0:
-        return []  # no data indexed yet
+    # No exact count up front: searching an empty collection is already cheap and
+    # returns nothing; a missing collection surfaces as an error handled below.
     try:
         return _client.search(
             collection_name=COLLECTION,
             query_vector=vector,
             limit=top_k,
             with_payload=True,
+            with_vectors=with_vectors,
+            search_params=search_params(),
         )
     except (UnexpectedResponse, ResponseHandlingException):
         # Return empty instead of exploding the whole request
         return []
+
+
+def retrieve_vectors(ids: List[str]) -> Dict[str, List[float]]:
+    """
+    Bulk-fetch stored vectors by point id. Missing ids are simply absent from the result.
+    """
+    if not ids:
+        return {}
+    try:
+        points = _client.retrieve(
+            collection_name=COLLECTION,
+            ids=list(ids),
+            with_payload=False,
+            with_vectors=True,
+        )
+    except (UnexpectedResponse, ResponseHandlingException):
+        return {}
+    return {str(p.id): p.vector for p in points if isinstance(p.vector, list)}
+
+
+def retrieve_points(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Bulk-fetch stored vectors and payloads by point id: {id: {"vector", "payload"}}.
+    """
+    if not ids:
+        return {}
+    try:
+        points = _client.retrieve(
+            collection_name=COLLECTION,
+            ids=list(ids),
+            with_payload=True,
+            with_vectors=True,
+        )
+    except (UnexpectedResponse, ResponseHandlingException):
+        return {}
+    return {
+        str(p.id): {"vector": p.vector, "payload": p.payload or {}}
+        for p in points
+        if isinstance(p.vector, list)
+    }
+
+
+def delete_points(ids: List[str]) -> None:
+    if not ids:
+        return
+    _client.delete(
+        collection_name=COLLECTION,
+        points_selector=qm.PointIdsList(points=list(ids)),
+    )
+
+
+# --- async layer -------------------------------------------------------------
+
+
+def async_qdrant_client() -> AsyncQdrantClient:
+    global _aclient
+    if _aclient is None:
+        _aclient = AsyncQdrantClient(
+            url=QDRANT_URL,
+            prefer_grpc=settings.QDRANT_PREFER_GRPC,
+            grpc_port=settings.QDRANT_GRPC_PORT,
+            timeout=30,
+        )
+    return _aclient
+
+
+async def close_vectorstore() -> None:
+    global _aclient, _upsert_sem
+    client, _aclient, _upsert_sem = _aclient, None, None
+    if client is not None:
+        await client.close()
+
+
+async def collection_ready() -> bool:
+    global _ready, _ready_checked
+    if _ready or time.monotonic() - _ready_checked < READY_RECHECK_S:
+        return _ready
+    _ready_checked = time.monotonic()
+    try:
+        _ready = (await async_qdrant_client().count(COLLECTION, exact=False)).count > 0
+    except Exception:
+        _ready = False  # missing collection or Qdrant down: searches return nothing
+    return _ready
+
+
+async def async_upsert_vectors(items: Iterable[Dict[str, Any]]) -> None:
+    """
+    Upsert in slices of QDRANT_UPSERT_BATCH points, up to QDRANT_UPSERT_CONCURRENCY in
+    flight process-wide. Slices go out with wait=False, so Qdrant only acknowledges them;
+    the last slice is sent with wait=True once the others are acknowledged, and since the
+    collection's update queue applies operations in order, its completion is the barrier
+    after which every point of the call is searchable.
+    """
+    global _upsert_sem, _ready
+    points = _points(items)
+    if not points:
+        return
+    if _upsert_sem is None:
+        _upsert_sem = asyncio.Semaphore(max(1, settings.QDRANT_UPSERT_CONCURRENCY))
+    client = async_qdrant_client()
+    size = max(1, settings.QDRANT_UPSERT_BATCH)
+    slices = [points[i : i + size] for i in range(0, len(points), size)]
+
+    async def send(part: List[qm.PointStruct], wait: bool) -> None:
+        async with _upsert_sem:  # type: ignore[union-attr]
+            await client.upsert(collection_name=COLLECTION, points=part, wait=wait)
+
+    # every slice settles before an error surfaces, so none is still in flight when the
+    # caller retries; the barrier slice is only sent when all the others were acknowledged
+    results = await asyncio.gather(
+        *(send(part, False) for part in slices[:-1]), return_exceptions=True
+    )
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    await send(slices[-1], True)
+    _ready = True
+
+
+async def async_search_vector(
+    vector: List[float], top_k: int = 5, with_vectors: bool = False
+) -> List[Any]:
+    """safe_search_vector on the async client; nothing is sent while the store is empty."""
+    _validate_vec(vector, DIM)
+    if not await collection_ready():
+        return []
+    try:
+        resp = await async_qdrant_client().query_points(
+            collection_name=COLLECTION,
+            query=vector,
+            limit=top_k,
+            with_payload=True,
+            with_vectors=with_vectors,
+            search_params=search_params(),
+        )
+    except (UnexpectedResponse, ResponseHandlingException):
+        return []
+    return resp.points
+
+
+async def async_search_batch(
+    vectors: List[List[float]], top_k: int = 5, with_vectors: bool = False
+) -> List[List[Any] | Exception]:
+    """
+    Many searches in one Qdrant request. Results line up with `vectors`; a vector that
+    fails validation gets its ValueError in its slot instead of failing the batch.
+    """
+    out: List[List[Any] | Exception] = [[] for _ in vectors]
+    requests, slots = [], []
+    params = search_params()
+    for i, v in enumerate(vectors):
+        try:
+            _validate_vec(v, DIM)
+        except ValueError as e:
+            out[i] = e
+            continue
+        slots.append(i)
+        requests.append(
+            qm.QueryRequest(
+                query=v, limit=top_k, with_payload=True, with_vector=with_vectors, params=params
+            )
+        )
+    if not requests or not await collection_ready():
+        return out
+    try:
+        responses = await async_qdrant_client().query_batch_points(
+            collection_name=COLLECTION, requests=requests
+        )
+    except (UnexpectedResponse, ResponseHandlingException):
+        # same as safe_search_vector: empty results rather than a failed request
+        return out
+    for i, resp in zip(slots, responses):
+        out[i] = resp.points
+    return out
+
+
+async def async_retrieve_points(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    if not ids:
+        return {}
+    try:
+        points = await async_qdrant_client().retrieve(
+            collection_name=COLLECTION, ids=list(ids), with_payload=True, with_vectors=True
+        )
+    except (UnexpectedResponse, ResponseHandlingException):
+        return {}
+    return {
+        str(p.id): {"vector": p.vector, "payload": p.payload or {}}
+        for p in points
+        if isinstance(p.vector, list)
+    }
+
+
+async def async_delete_points(ids: List[str]) -> None:
+    if not ids:
+        return
+    await async_qdrant_client().delete(
+        collection_name=COLLECTION, points_selector=qm.PointIdsList(points=list(ids))
+    )
+
+
+async def async_delete_doc_points(doc_id: str) -> None:
+    # every point of a document, by payload filter, for when its chunk ids are not known
+    await async_qdrant_client().delete(
+        collection_name=COLLECTION,
+        points_selector=qm.FilterSelector(
+            filter=qm.Filter(
+                must=[qm.FieldCondition(key="doc_id", match=qm.MatchValue(value=doc_id))]
+            )
+        ),
+    )
@@ -0,0 +1,48 @@
+import asyncio
+
+from app.caching import SemanticAnswerCache
+from app.streaming import replay_tokens
+
+
+def test_similar_query_same_contexts_hits():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_s=60)
+    ctx = cache.context_key("chat", ["d:2", "d:1"])
+    cache.put(3, ctx, [1.0, 0.0, 0.0], {"answer": "30 days [1]"})
+
+    answer, sim = cache.get(3, cache.context_key("chat", ["d:2", "d:1"]), [0.99, 0.05, 0.0])
+    assert answer == {"answer": "30 days [1]"} and sim > 0.95
+    # same chunks ranked the other way round: [1] would now cite d:1, so no hit
+    assert cache.get(3, cache.context_key("chat", ["d:1", "d:2"]), [1.0, 0.0, 0.0]) is None
+    assert cache.get(3, ctx, [0.0, 1.0, 0.0]) is None  # different question
+    assert cache.get(3, cache.context_key("chat", ["d:1"]), [1.0, 0.0, 0.0]) is None
+    assert cache.get(4, ctx, [1.0, 0.0, 0.0]) is None  # corpus changed
+    assert cache.stats()["items"] == 0
+    assert cache.stats()["hit_rate"] == 0.2
+
+
+def test_ttl_expiry():
+    cache = SemanticAnswerCache(ttl_s=0)
+    ctx = cache.context_key("chat", ["d:1"])
+    cache.put(1, ctx, [1.0, 0.0], {"answer": "x"})
+    assert cache.get(1, ctx, [1.0, 0.0]) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_replay_reassembles_answer():
+    async def run():
+        stats = {}
+        pieces = [p async for p in replay_tokens("Notice is  30 days [1].\nDone", stats)]
+        return pieces, stats
+
+    pieces, stats = asyncio.run(run())
+    assert "".join(pieces) == "Notice is  30 days [1].\nDone"
+    assert stats["chunks"] == len(pieces) == 6
+
+
+def test_expired_buckets_are_dropped():
+    cache = SemanticAnswerCache(ttl_s=0)
+    for n in range(3):
+        cache.put(1, cache.context_key("chat", [f"d:{n}"]), [1.0, 0.0], {"answer": "x"})
+    assert cache.stats()["context_sets"] == 1  # each put swept the expired ones before it
+    assert cache.get(1, cache.context_key("chat", ["d:2"]), [1.0, 0.0]) is None
+    assert cache.stats()["context_sets"] == 0 and cache.stats()["items"] == 0
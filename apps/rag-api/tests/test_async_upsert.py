@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import app.vectorstore as vs
+from app.config import settings
+
+
+@pytest.fixture
+def client(monkeypatch):
+    c = mock.AsyncMock()
+    monkeypatch.setattr(vs, "_aclient", c)
+    monkeypatch.setattr(vs, "_upsert_sem", None)
+    monkeypatch.setattr(vs, "_ready", False)
+    monkeypatch.setattr(vs, "_ready_checked", 0.0)
+    monkeypatch.setattr(settings, "QDRANT_UPSERT_BATCH", 2)
+    return c
+
+
+def _items(n):
+    return [{"id": f"d:{i}", "vector": [0.1] * vs.DIM, "payload": {"i": i}} for i in range(n)]
+
+
+def test_validate_vecs_names_the_bad_vector():
+    vs._validate_vecs([[0.0, 1.0], [1.0, 0.0]], 2)
+    with pytest.raises(ValueError, match="vector 1: Vector length 3"):
+        vs._validate_vecs([[0.0, 1.0], [1.0, 0.0, 0.0]], 2)
+    with pytest.raises(ValueError, match="vector 0: .*non-finite"):
+        vs._validate_vecs([[float("nan"), 1.0]], 2)
+
+
+def test_slices_then_barrier(client):
+    asyncio.run(vs.async_upsert_vectors(_items(5)))
+    calls = client.upsert.call_args_list
+    assert [len(c.kwargs["points"]) for c in calls] == [2, 2, 1]
+    assert [c.kwargs["wait"] for c in calls] == [False, False, True]
+    assert vs._ready is True
+
+
+def test_failed_slice_settles_others_and_skips_barrier(client):
+    sent = []
+
+    async def upsert(collection_name, points, wait):
+        await asyncio.sleep(0.05 if points[0].payload["i"] == 2 else 0)
+        if points[0].payload["i"] == 0:
+            raise RuntimeError("slice failed")
+        sent.append(points[0].payload["i"])
+
+    client.upsert.side_effect = upsert
+    with pytest.raises(RuntimeError, match="slice failed"):
+        asyncio.run(vs.async_upsert_vectors(_items(5)))
+    assert sent == [2]  # the slow sibling finished before the error surfaced; no barrier
+    assert vs._ready is False
+
+
+def test_collection_ready_is_sticky(client):
+    client.count.return_value = SimpleNamespace(count=0)
+    assert asyncio.run(vs.collection_ready()) is False
+    assert asyncio.run(vs.collection_ready()) is False  # within the recheck interval
+    assert client.count.await_count == 1
+
+    vs._ready_checked = 0.0
+    client.count.return_value = SimpleNamespace(count=3)
+    assert asyncio.run(vs.collection_ready()) is True
+    vs._ready_checked = 0.0
+    assert asyncio.run(vs.collection_ready()) is True  # once ready, never asked again
+    assert client.count.await_count == 2
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import main
+from app.config import settings
+from app.rerank import mmr_batch
+
+
+def _vec(text):
+    if text == "boom":
+        raise ValueError("bad input")
+    return [9.0 if text == "rerank fails" else 1.0, float(len(text))]
+
+
+class FakeEmbedder:
+    async def embed(self, texts):
+        return [_vec(t) for t in texts]
+
+    async def embed_query(self, text):
+        return _vec(text)
+
+
+async def fake_search_batch(vecs, limit, with_vectors=False):
+    # one hit per query whose doc_id encodes the query, so results can be matched to inputs
+    return [
+        [SimpleNamespace(score=1.0, vector=v, payload={"doc_id": f"d{v[1]:.0f}", "chunk_index": 0})]
+        for v in vecs
+    ]
+
+
+def fake_mmr_batch(qvecs, cand_sets, k, lambd):
+    if any(q[0] == 9.0 for q in qvecs):
+        raise RuntimeError("mmr failed")
+    return mmr_batch(qvecs, cand_sets, k=k, lambd=lambd)
+
+
+@pytest.fixture(autouse=True)
+def fakes(monkeypatch):
+    monkeypatch.setattr(main, "get_embedder", lambda: FakeEmbedder())
+    monkeypatch.setattr(main, "async_search_batch", fake_search_batch)
+    monkeypatch.setattr(main, "fts_search_batch", lambda queries, limit: [[] for _ in queries])
+    monkeypatch.setattr(main, "get_retrieval_cache", lambda: None)
+    monkeypatch.setattr(main, "mmr_batch", fake_mmr_batch)
+
+
+def _run(endpoint, queries):
+    return asyncio.run(endpoint(main.BatchQueryReq(queries=queries, top_k=3)))["results"]
+
+
+@pytest.mark.parametrize("endpoint", [main.query_batch, main.query_hybrid_batch])
+def test_failures_stay_in_their_slot(endpoint):
+    queries = ["a", "", "boom", "abc", "  "]
+    out = _run(endpoint, queries)
+    assert [r["query"] for r in out] == queries
+    assert out[0]["matches"][0]["doc_id"] == "d1"
+    assert out[3]["matches"][0]["doc_id"] == "d3"
+    assert out[1]["error"] == out[4]["error"] == "ValueError: empty query"
+    assert out[2]["error"] == "ValueError: bad input"
+
+
+def test_rerank_failure_is_retried_per_query():
+    out = _run(main.query_hybrid_batch, ["ab", "rerank fails", "abcd"])
+    assert out[1]["error"] == "RuntimeError: mmr failed"
+    assert out[0]["matches"][0]["doc_id"] == "d2"
+    assert out[2]["matches"][0]["doc_id"] == "d4"
+
+
+def test_batch_size_cap(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_BATCH_MAX", 2)
+    with pytest.raises(HTTPException) as e:
+        _run(main.query_batch, ["a", "b", "c"])
+    assert e.value.status_code == 413
+
+
+class RejectingClient:
+    """AsyncOpenAI stand-in whose embeddings call rejects any batch containing "boom"."""
+
+    def __init__(self):
+        self.requests = []
+        self.embeddings = self
+
+    async def create(self, model, input, **kwargs):
+        self.requests.append(list(input))
+        if "boom" in input:
+            raise ValueError("bad input")
+        data = [
+            SimpleNamespace(index=i, embedding=[1.0, float(len(t))]) for i, t in enumerate(input)
+        ]
+        return SimpleNamespace(data=data)
+
+
+def test_embed_fallback_with_real_embedder(monkeypatch):
+    from app.embeddings import AsyncEmbedder
+
+    client = RejectingClient()
+    monkeypatch.setattr(
+        main, "get_embedder", lambda: AsyncEmbedder(client=client, model="fake", dim=2)
+    )
+    out = asyncio.run(main._embed_batch(["a", "boom", "abc"]))
+    assert out[0] == [1.0, 1.0] and out[2] == [1.0, 3.0]
+    assert isinstance(out[1], ValueError)
+    assert sorted(client.requests[1:]) == [["a"], ["abc"], ["boom"]]
@@ -0,0 +1,54 @@
+import math
+
+import pytest
+
+from app.chunking import _segments, iter_chunks, tokenize
+from app.config import settings
+
+PARAS = [
+    "Employees accrue 1.5 vacation days per month (18 per year).",
+    "Unused days carry over up to 5 days; the rest expire on 31 March.",
+    "Résumé reviews happen in Zürich — 漢字 and emoji 🙂 included.",
+    "Sick leave is separate and requires a note after 3 consecutive days.",
+]
+TEXT = "\n\n".join(PARAS * 12)
+
+
+def _assert_round_trip(text, chunks):
+    for c in chunks:
+        assert text[c.char_start : c.char_end] == c.text
+    assert chunks[0].char_start == 0 and chunks[-1].char_end == len(text)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev.char_start < nxt.char_start < prev.char_end  # windows overlap
+
+
+def test_offsets_round_trip_single_segment():
+    chunks = list(iter_chunks(TEXT, chunk_tokens=50, overlap=10))
+    _assert_round_trip(TEXT, chunks)
+    assert all(c.n_tokens == 50 for c in chunks[:-1]) and 0 < chunks[-1].n_tokens <= 50
+
+
+@pytest.mark.parametrize("seg_chars", [64, 250])
+def test_offsets_round_trip_across_segment_seams(monkeypatch, seg_chars):
+    monkeypatch.setattr(settings, "CHUNK_SEGMENT_CHARS", seg_chars)
+    segs = list(_segments(TEXT, seg_chars))
+    assert "".join(segs) == TEXT and len(segs) > 1
+    chunks = list(iter_chunks(TEXT, chunk_tokens=50, overlap=10))
+    _assert_round_trip(TEXT, chunks)
+    # a stream of pieces chunks the same as the whole string
+    pieces = (TEXT[i : i + 97] for i in range(0, len(TEXT), 97))
+    assert list(iter_chunks(pieces, chunk_tokens=50, overlap=10)) == chunks
+
+
+def test_segments_cut_at_paragraph_breaks():
+    for seg in list(_segments(TEXT, 250))[:-1]:
+        assert seg.endswith("\n\n")
+
+
+def test_no_trailing_window_inside_the_overlap():
+    n = len(tokenize(TEXT))
+    assert len(list(iter_chunks(TEXT, chunk_tokens=n, overlap=10))) == 1
+    chunk, overlap = 40, 10
+    chunks = list(iter_chunks(TEXT, chunk_tokens=chunk, overlap=overlap))
+    assert len(chunks) == 1 + math.ceil((n - chunk) / (chunk - overlap))
+    assert chunks[-1].char_end == len(TEXT) and chunks[-2].char_end < len(TEXT)
@@ -0,0 +1,51 @@
+from unittest import mock
+
+from qdrant_client.http import models as qm
+
+import app.vectorstore as vs
+from app.config import settings
+
+
+def _plain_collection():
+    # what Qdrant reports for a collection created with only size and distance
+    return qm.CollectionConfig(
+        params=qm.CollectionParams(
+            vectors=qm.VectorParams(size=vs.DIM, distance=qm.Distance.COSINE)
+        ),
+        hnsw_config=qm.HnswConfig(m=16, ef_construct=100, full_scan_threshold=10000),
+        optimizer_config=qm.OptimizersConfig(
+            deleted_threshold=0.2,
+            vacuum_min_vector_number=1000,
+            default_segment_number=0,
+            flush_interval_sec=5,
+        ),
+        wal_config=qm.WalConfig(wal_capacity_mb=32, wal_segments_ahead=0),
+    )
+
+
+def test_profile_migrates_in_place(monkeypatch):
+    cfg = _plain_collection()
+    client = mock.MagicMock()
+    client.get_collection.return_value = mock.MagicMock(config=cfg)
+    monkeypatch.setattr(vs, "_client", client)
+
+    assert vs.migrate_collection() == []  # default profile matches a plain collection
+
+    monkeypatch.setattr(settings, "QDRANT_PROFILE", "int8")  # originals move to disk
+    assert vs.migrate_collection() == ["quantization_config", "vectors_config"]
+    kwargs = client.update_collection.call_args.kwargs
+    assert kwargs["quantization_config"].scalar.type == qm.ScalarType.INT8
+    assert kwargs["vectors_config"][""].on_disk is True
+    client.recreate_collection.assert_not_called()
+    client.delete_collection.assert_not_called()
+
+    assert vs.search_params().quantization.rescore is True
+
+    monkeypatch.setattr(settings, "QDRANT_ON_DISK", False)  # explicit override wins
+    assert vs.migrate_collection() == ["quantization_config"]
+
+    # incompatible vectors are never touched
+    cfg.params.vectors.size = vs.DIM + 1
+    client.update_collection.reset_mock()
+    assert vs.migrate_collection() == []
+    client.update_collection.assert_not_called()
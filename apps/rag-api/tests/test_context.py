@@ -0,0 +1,45 @@
+from app.chunking import iter_chunks
+from app.context import citations, pack_contexts, render_snippets
+
+TEXT = " ".join(f"Clause {i} covers item {i * 7} of the lease." for i in range(400))
+
+
+def _hits(chunks, order, with_offsets=True):
+    out = []
+    for i in order:
+        c = chunks[i]
+        hit = {"doc_id": "d1", "chunk_index": c.index, "text": c.text, "source_path": "d1.txt"}
+        if with_offsets:
+            hit.update(char_start=c.char_start, char_end=c.char_end)
+        out.append(hit)
+    return out
+
+
+def test_adjacent_chunks_merge_without_overlap():
+    chunks = list(iter_chunks(TEXT, chunk_tokens=80, overlap=20))
+    for with_offsets in (True, False):
+        packed = pack_contexts(_hits(chunks, [3, 2, 7], with_offsets), budget_tokens=10_000)
+        assert [c.get("chunk_indices", [c["chunk_index"]]) for c in packed] == [[2, 3], [7]]
+        merged = packed[0]["text"]
+        assert merged == TEXT[chunks[2].char_start : chunks[3].char_end].strip()
+        assert [c["n"] for c in packed] == [1, 2]
+
+
+def test_near_duplicates_dropped_and_numbering_stable():
+    a = {"doc_id": "a", "chunk_index": 0, "text": "The notice period is thirty days in writing."}
+    b = {"doc_id": "b", "chunk_index": 5, "text": "The notice period is thirty days in writing!"}
+    c = {"doc_id": "c", "chunk_index": 1, "text": "Rent is due on the first business day."}
+    packed = pack_contexts([a, b, c], budget_tokens=1000)
+    assert [p["doc_id"] for p in packed] == ["a", "c"]
+    assert [x["n"] for x in citations(packed)] == [1, 2]
+    assert render_snippets(packed)[1].startswith("[2] Rent is due")
+    assert pack_contexts([a, b, c], budget_tokens=1000) == packed
+
+
+def test_budget_is_respected():
+    chunks = list(iter_chunks(TEXT, chunk_tokens=100, overlap=0))
+    hits = _hits(chunks, [0, 5, 10, 15])
+    packed = pack_contexts(hits, budget_tokens=280)
+    assert sum(p["n_tokens"] for p in packed) <= 280
+    assert [p["chunk_index"] for p in packed] == [0, 5, 10]
+    assert packed[-1]["truncated"]
@@ -0,0 +1,39 @@
+from app.caching import EmbeddingCache
+
+
+def test_roundtrip_and_counters(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.db", mem_items=10)
+    assert cache.get_many("m", 3, ["a", "b"]) == [None, None]
+
+    cache.put_many("m", 3, ["a", "b"], [[1.0, 2.0, 3.0], [0.5, 0.0, -1.0]])
+    assert cache.get_many("m", 3, ["b", "a", "c"]) == [[0.5, 0.0, -1.0], [1.0, 2.0, 3.0], None]
+    # model and dimension are part of the key
+    assert cache.get_many("other", 3, ["a"]) == [None]
+    assert cache.get_many("m", 4, ["a"]) == [None]
+
+    st = cache.stats()
+    assert st["hits_mem"] == 2
+    assert st["misses"] == 5
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "emb.db"
+    EmbeddingCache(path).put_many("m", 2, ["x"], [[1.0, 1.0]])
+
+    fresh = EmbeddingCache(path)
+    assert fresh.get_many("m", 2, ["x"]) == [[1.0, 1.0]]
+    assert fresh.stats()["hits_disk"] == 1
+
+
+def test_size_based_eviction(tmp_path):
+    dim = 256  # 1 KiB per float32 vector
+    cache = EmbeddingCache(tmp_path / "emb.db", mem_items=0, disk_bytes=10 * 1024)
+    for i in range(30):
+        cache.put_many("m", dim, [f"t{i}"], [[float(i)] * dim])
+
+    st = cache.stats()
+    assert st["disk_bytes"] <= 10 * 1024
+    assert st["evicted"] >= 20
+    # most recent entries are kept, oldest are gone
+    assert cache.get_many("m", dim, ["t29"])[0] is not None
+    assert cache.get_many("m", dim, ["t0"])[0] is None
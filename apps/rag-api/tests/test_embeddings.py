@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import AsyncOpenAI
+
+from app.embeddings import AsyncEmbedder
+
+
+class _FakeEmbeddings(BaseHTTPRequestHandler):
+    """Minimal stand-in for POST /v1/embeddings; vector = [len(text), position]."""
+
+    calls: list = []
+    bodies: list = []
+    fail_next: list = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).calls.append(body["input"])
+        type(self).bodies.append(body)
+        if type(self).fail_next:
+            status = type(self).fail_next.pop(0)
+            self._send(status, {"error": {"message": "try again", "type": "rate_limit"}})
+            return
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(len(t)), float(i)]}
+            for i, t in enumerate(body["input"])
+        ]
+        self._send(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": body["model"],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    def _send(self, status, payload):
+        raw = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    _FakeEmbeddings.calls = []
+    _FakeEmbeddings.bodies = []
+    _FakeEmbeddings.fail_next = []
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _FakeEmbeddings)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    srv.shutdown()
+
+
+def _embedder(base_url, **kw):
+    client = AsyncOpenAI(api_key="test", base_url=base_url, max_retries=0)
+    return AsyncEmbedder(client=client, model="fake", dim=2, **kw)
+
+
+async def test_concurrent_queries_coalesce_into_one_request(fake_server):
+    emb = _embedder(fake_server, window_ms=50)
+    texts = [f"q{i}" * (i + 1) for i in range(20)] + ["q0"]
+    vecs = await asyncio.gather(*(emb.embed_query(t) for t in texts))
+    await emb.aclose()
+
+    assert len(_FakeEmbeddings.calls) == 1
+    assert len(_FakeEmbeddings.calls[0]) == 20  # duplicate "q0" sent once
+    assert [v[0] for v in vecs] == [float(len(t)) for t in texts]
+
+
+async def test_retries_on_429_and_5xx(fake_server):
+    _FakeEmbeddings.fail_next = [429, 503]
+    emb = _embedder(fake_server, max_retries=3)
+    assert await emb.embed(["abc", "de"]) == [[3.0, 0.0], [2.0, 1.0]]
+    assert emb.stats()["retries"] == 2
+    assert len(_FakeEmbeddings.calls) == 3
+
+
+async def test_gives_up_after_max_retries(fake_server):
+    from openai import RateLimitError
+
+    _FakeEmbeddings.fail_next = [429, 429]
+    emb = _embedder(fake_server, max_retries=1, window_ms=1)
+    with pytest.raises(RateLimitError):
+        await emb.embed_query("x")
+
+
+async def test_dimensions_sent_only_when_shortening(fake_server):
+    client = AsyncOpenAI(api_key="test", base_url=fake_server, max_retries=0)
+    for dim in (1536, 512):
+        emb = AsyncEmbedder(client=client, model="text-embedding-3-small", dim=dim)
+        await emb.embed([f"text {dim}"])
+    assert "dimensions" not in _FakeEmbeddings.bodies[0]
+    assert _FakeEmbeddings.bodies[1]["dimensions"] == 512
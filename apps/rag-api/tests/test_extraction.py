@@ -0,0 +1,60 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+import app.extraction as ex
+
+
+@pytest.fixture
+def two_thread_slots(monkeypatch):
+    # jobs on the loop's thread pool, but only two at a time, like a 2-worker process pool
+    monkeypatch.setattr(ex.settings, "EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(ex, "_executor", lambda: None)
+    monkeypatch.setattr(ex, "_slots", None)
+
+
+def test_timeout_counts_from_job_start(two_thread_slots, monkeypatch):
+    monkeypatch.setattr(ex.settings, "EXTRACT_TIMEOUT_S", 0.5)
+
+    async def run():
+        # 6 x 0.3 s on 2 slots: the last jobs wait ~0.6 s for a slot but must not time out
+        return await ex._gather([ex._run(time.sleep, 0.3) for _ in range(6)])
+
+    assert asyncio.run(run()) == [None] * 6
+
+
+def test_failure_cancels_queued_siblings(two_thread_slots, monkeypatch):
+    monkeypatch.setattr(ex.settings, "EXTRACT_TIMEOUT_S", 0.2)
+    started = []
+
+    def job(i):
+        started.append(i)
+        time.sleep(0.5 if i == 0 else 0.05)
+
+    async def run():
+        with pytest.raises(ex.ExtractionTimeout):
+            await ex._gather([ex._run(job, i) for i in range(20)])
+        await asyncio.sleep(0.6)
+
+    asyncio.run(run())
+    assert len(started) < 20
+
+
+def test_only_scanned_pages_fan_out_to_ocr(two_thread_slots, monkeypatch):
+    pages = ["a text layer with plenty of words", "", "  p. 3  ", "another real page of text"]
+    ocr_calls = []
+
+    def ocr_page(path, i):
+        ocr_calls.append(i)
+        return f"ocr {i}" if i == 1 else ""  # an empty OCR result keeps the page's own text
+
+    monkeypatch.setattr(ex, "page_count", lambda path, kind: len(pages))
+    monkeypatch.setitem(ex._PAGED, "pdf", lambda path, start, stop: pages[start:stop])
+    monkeypatch.setattr(ex, "ocr_pdf_page", ocr_page)
+    monkeypatch.setattr(ex.settings, "EXTRACT_PAGES_PER_JOB", 3)
+
+    text = asyncio.run(ex.extract_async(Path("doc.pdf"), "pdf"))
+    assert sorted(ocr_calls) == [1, 2]
+    assert text.split("\n") == [pages[0], "ocr 1", pages[2], pages[3]]
@@ -0,0 +1,117 @@
+import datetime as dt
+
+import pytest
+from openpyxl import Workbook
+
+from app.config import settings
+from app.extractors import iter_table_text
+
+
+@pytest.fixture
+def small_groups(monkeypatch):
+    monkeypatch.setattr(settings, "TABLE_GROUP_CHARS", 80)
+    monkeypatch.setattr(settings, "TABLE_BATCH_ROWS", 7)  # groups also span batch edges
+
+
+def _blocks(path, kind):
+    return list(iter_table_text(path, kind))
+
+
+def test_csv_row_groups_repeat_the_header(tmp_path, small_groups):
+    path = tmp_path / "t.csv"
+    path.write_text("name,days\n" + "".join(f"row {i},{i}\n" for i in range(30)) + ",\n")
+    blocks = _blocks(path, "csv")
+    assert len(blocks) > 2
+    rows = []
+    for b in blocks:
+        head, *lines = b.rstrip("\n").split("\n")
+        assert head == "name | days" and b.endswith("\n\n")
+        # the budget: a group is only over it when a single row does not fit
+        assert len(b) <= settings.TABLE_GROUP_CHARS + len(lines[-1]) + 2
+        rows += lines
+    assert rows == [f"row {i} | {i}" for i in range(30)]  # the blank row is dropped
+
+
+def test_xlsx_sheets_are_separate_and_keep_cell_types(tmp_path, small_groups):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sales"
+    ws.append(["date", "amount", "note"])
+    ws.append([dt.datetime(2024, 4, 1), 1641000, "a"])
+    ws.append([dt.datetime(2024, 4, 2), None, "b"])  # a blank must not turn ints into floats
+    ws.append([dt.datetime(2024, 4, 3), 12, None])
+    other = wb.create_sheet("Staff")
+    other.append([None, None])
+    other.append(["name", "size"])
+    other.append(["Ann", 1.5])
+    wb.create_sheet("Empty")
+    path = tmp_path / "t.xlsx"
+    wb.save(path)
+
+    blocks = _blocks(path, "xlsx")
+    sales = [b for b in blocks if b.startswith("Sheet: Sales\ndate | amount | note\n")]
+    staff = [b for b in blocks if b.startswith("Sheet: Staff\nname | size\n")]
+    assert len(sales) + len(staff) == len(blocks) and staff
+    lines = [line for b in sales for line in b.rstrip("\n").split("\n")[2:]]
+    assert lines == ["2024-04-01 | 1641000 | a", "2024-04-02 | | b", "2024-04-03 | 12"]
+    assert staff[0].endswith("Ann | 1.5\n\n")
+
+
+@pytest.fixture
+def scanned_pdf(tmp_path):
+    from PIL import Image
+
+    path = tmp_path / "scan.pdf"
+    Image.new("RGB", (120, 60), "white").save(path)  # an image-only page, like a scan
+    return path
+
+
+@pytest.fixture
+def fake_tesseract(monkeypatch, tmp_path):
+    import app.caching as caching
+    import app.extractors as extractors
+
+    calls = []
+
+    def ocr_array(img):
+        calls.append(img.shape)
+        return "scanned words"
+
+    monkeypatch.setattr(extractors, "_ocr_array", ocr_array)
+    monkeypatch.setattr(caching, "_ocr_cache", caching.OcrCache(tmp_path / "ocr_cache.db"))
+    return calls
+
+
+def test_scan_detection_threshold(monkeypatch):
+    from app.extractors import needs_ocr
+
+    monkeypatch.setattr(settings, "PDF_OCR_MIN_CHARS", 16)
+    assert needs_ocr("") and needs_ocr(" \n 3 \n") and needs_ocr("fifteen chars..")
+    assert not needs_ocr("sixteen-chars...")  # 16 non-space chars
+    assert not needs_ocr("  sixteen \n chars in all ")  # whitespace does not count
+    monkeypatch.setattr(settings, "PDF_OCR_FALLBACK", False)
+    assert not needs_ocr("")
+
+
+def test_scanned_page_is_ocrd_once(scanned_pdf, fake_tesseract):
+    from app.extractors import extract_pdf_pages
+
+    assert extract_pdf_pages(scanned_pdf) == ["scanned words"]
+    assert extract_pdf_pages(scanned_pdf) == ["scanned words"]
+    assert len(fake_tesseract) == 1  # the repeat came from ocr_cache.db
+    assert extract_pdf_pages(scanned_pdf, ocr=False) == [""]
+
+
+def test_ocr_failure_is_reraised_as_plain_error(scanned_pdf, fake_tesseract, monkeypatch):
+    import app.extractors as extractors
+
+    class TesseractError(Exception):
+        def __init__(self, status, message):  # not picklable from its args, like pytesseract's
+            super().__init__(status, message)
+
+    def broken(img):
+        raise TesseractError(1, "no language data")
+
+    monkeypatch.setattr(extractors, "_ocr_array", broken)
+    with pytest.raises(RuntimeError, match="OCR of page 0 failed: TesseractError"):
+        extractors.ocr_pdf_page(scanned_pdf, 0)
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+import app.hybrid as hy
+
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    p = hy._ConnPool(tmp_path / "hybrid.db")
+    monkeypatch.setattr(hy, "_pool", p)
+    yield p
+    p.close()
+
+
+def _rows(doc_id, n, word="alpha"):
+    return [
+        {"chunk_id": f"{doc_id}:{i}", "text": f"{word} chunk {i}", "chunk_index": i}
+        for i in range(n)
+    ]
+
+
+def test_deletes_by_rowid_map(pool):
+    hy.ensure_fts()
+    hy.index_chunks("a", _rows("a", 3))
+    hy.index_chunks("b", _rows("b", 2))
+    hy.upsert_chunks("a", [{"chunk_id": "a:1", "text": "omega", "chunk_index": 1}])
+    assert [h["chunk_id"] for h in hy.fts_search("omega")] == ["a:1"]
+    assert hy.delete_chunks("a", ["a:0", "b:0"]) == 1  # another doc's chunk is not touched
+    assert hy.delete_doc("b") == 2
+    assert sorted(h["chunk_id"] for h in hy.fts_search("chunk")) == ["a:2"]
+    with pool.writer() as con:
+        assert con.execute("SELECT doc_id, chunk_id FROM chunk_rows ORDER BY id").fetchall() == [
+            ("a", "a:2"),
+            ("a", "a:1"),
+        ]
+
+
+def test_existing_table_is_mapped_on_startup(pool):
+    con = sqlite3.connect(pool.path)
+    con.execute(
+        "CREATE VIRTUAL TABLE chunks_fts USING fts5(text, doc_id UNINDEXED, kind UNINDEXED,"
+        " source_path UNINDEXED, chunk_index UNINDEXED, chunk_id UNINDEXED)"
+    )
+    con.executemany(
+        "INSERT INTO chunks_fts(text, doc_id, chunk_index, chunk_id) VALUES (?, ?, ?, ?)",
+        [("old text", "a", 0, "a:0"), ("old text", "b", 0, "b:0")],
+    )
+    con.commit()
+    con.close()
+
+    hy.ensure_fts()
+    assert hy.delete_doc("a") == 1
+    assert [h["chunk_id"] for h in hy.fts_search("old")] == ["b:0"]
@@ -0,0 +1,57 @@
+import random
+
+from app.fusion import chunk_key, hit_key, weighted_rrf
+
+
+class _Point:
+    def __init__(self, payload):
+        self.id = "3f1c0d52-0000-0000-0000-000000000000"
+        self.payload = payload
+
+
+def _full_rrf(rankings, weights, ks):
+    scores = {}
+    for name, keys in rankings.items():
+        for rank, key in enumerate(dict.fromkeys(keys), start=1):
+            scores[key] = scores.get(key, 0.0) + weights[name] / (ks[name] + rank)
+    return scores
+
+
+def test_dense_and_keyword_hits_share_one_key():
+    dense = _Point({"doc_id": "d1", "chunk_index": 3, "chunk_id": "d1:3"})
+    legacy = _Point({"doc_id": "d1", "chunk_index": 3})
+    kw = {"chunk_id": "d1:3", "text": "..."}
+    assert hit_key(dense) == hit_key(legacy) == hit_key(kw) == chunk_key("d1", "3")
+
+    fused = weighted_rrf({"dense": ["d1:3", "d1:4"], "keyword": ["d1:3"]}, top_n=5)
+    assert [k for k, _ in fused] == ["d1:3", "d1:4"]
+    assert fused[0][1] == 2 / 61
+
+
+def test_weights_and_k_per_retriever():
+    fused = weighted_rrf(
+        {"dense": ["a", "b"], "keyword": ["b", "a"]},
+        top_n=2,
+        weights={"dense": 2.0, "keyword": 1.0},
+        ks={"dense": 10, "keyword": 60},
+    )
+    assert [k for k, _ in fused] == ["a", "b"]
+    assert weighted_rrf({"dense": ["a"], "keyword": ["b"]}, 2, weights={"dense": 0.0}) == [
+        ("b", 1 / 61)
+    ]
+
+
+def test_early_cutoff_matches_full_fusion():
+    rng = random.Random(5)
+    weights = {"dense": 1.0, "keyword": 0.6, "title": 0.3}
+    ks = {"dense": 5, "keyword": 60, "title": 20}
+    for _ in range(200):
+        pool = [f"c{i}" for i in range(rng.randint(1, 80))]
+        rankings = {n: rng.sample(pool, rng.randint(0, len(pool))) for n in weights}
+        top_n = rng.randint(1, 12)
+        full = _full_rrf(rankings, weights, ks)
+        fused = weighted_rrf(rankings, top_n, weights=weights, ks=ks)
+        expected = sorted(full.values(), reverse=True)[:top_n]
+        assert [round(s, 12) for _, s in fused] == [round(s, 12) for s in expected]
+        for key, s in fused:
+            assert abs(full[key] - s) < 1e-12
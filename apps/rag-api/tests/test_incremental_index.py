@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import app.indexing as ix
+from app.manifest import Manifest
+
+PARAS = [
+    f"Paragraph {n} of the handbook covers policy number {n} in some detail." for n in range(40)
+]
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    async def embed(self, texts):
+        self.texts += texts
+        return [[0.0] for _ in texts]
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    # point id -> chunk index in "Qdrant", chunk id -> row in "FTS"
+    points, rows = {}, {}
+    manifest = Manifest(tmp_path / "manifest.db")
+    embedder = FakeEmbedder()
+
+    async def upsert(items):
+        points.update((p["id"], p["payload"]["chunk_index"]) for p in items)
+
+    async def delete_points(ids):
+        for pid in ids:
+            points.pop(pid, None)
+
+    async def delete_doc_points(doc_id):
+        points.clear()
+
+    async def nothing(*args, **kwargs):
+        return {}
+
+    def put_rows(doc_id, new_rows, replace=False):
+        if replace:
+            rows.clear()
+        rows.update((r["chunk_id"], r["chunk_index"]) for r in new_rows)
+
+    monkeypatch.setattr(ix, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(ix, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(ix, "async_upsert_vectors", upsert)
+    monkeypatch.setattr(ix, "async_delete_points", delete_points)
+    monkeypatch.setattr(ix, "async_delete_doc_points", delete_doc_points)
+    monkeypatch.setattr(ix, "async_retrieve_points", nothing)
+    monkeypatch.setattr(ix, "bump_corpus_generation", nothing)
+    monkeypatch.setattr(ix, "index_chunks", put_rows)
+    monkeypatch.setattr(ix, "upsert_chunks", put_rows)
+    monkeypatch.setattr(ix, "delete_chunks", lambda doc_id, ids: [rows.pop(c, None) for c in ids])
+    return points, rows, manifest, embedder
+
+
+def _index(text):
+    return asyncio.run(ix.index_text("d1", text, chunk_tokens=40, overlap=0))
+
+
+def test_unchanged_changed_and_shrunk(store):
+    points, rows, manifest, embedder = store
+    text = "\n\n".join(PARAS)
+    first = _index(text)
+    n = first["chunks"]
+    assert n > 4 and len(points) == len(rows) == n
+
+    again = _index(text)
+    assert again["skipped"] and again["unchanged"] == n
+
+    embedder.texts.clear()
+    changed = _index(text.replace("policy number 39", "policy number 390"))
+    assert changed["written"] == 1 and changed["unchanged"] == n - 1
+    assert len(embedder.texts) == 1
+
+    shrunk = _index("\n\n".join(PARAS[:10]))
+    assert shrunk["deleted"] == n - shrunk["chunks"] > 0
+    assert sorted(points.values()) == sorted(rows.values()) == list(range(shrunk["chunks"]))
+
+
+def test_missing_chunk_rows_fall_back_to_full_delete(store):
+    points, rows, manifest, _ = store
+    _index("\n\n".join(PARAS))
+    manifest.set_chunks("d1", {})  # indexed before chunk hashes were recorded
+
+    out = _index("\n\n".join(PARAS[:10]))
+    assert not out["skipped"] and out["written"] == out["chunks"]
+    assert sorted(points.values()) == sorted(rows.values()) == list(range(out["chunks"]))
+
+
+def test_fts_rows_written_once_after_all_batches(store, monkeypatch):
+    points, rows, manifest, _ = store
+    writes = []
+    monkeypatch.setattr(ix.settings, "EMBED_BATCH_ITEMS", 2)
+    monkeypatch.setattr(
+        ix,
+        "index_chunks",
+        lambda doc_id, new_rows, replace: writes.append((len(new_rows), replace)),
+    )
+    out = _index("\n\n".join(PARAS))
+    assert out["batches"] > 1 and writes == [(out["chunks"], True)]
@@ -0,0 +1,54 @@
+from app.jobs import SQLiteJobQueue, new_job
+
+
+def test_lapsed_lease_is_requeued(tmp_path):
+    queue = SQLiteJobQueue(tmp_path / "jobs.sqlite")
+    job = queue.enqueue(new_job("d1", "/raw/d1", "text", "d1.txt"))
+    claimed = queue.claim(timeout=0.1)
+    assert claimed["job_id"] == job["job_id"] and claimed["state"] == "running"
+
+    assert queue.recover() == 0  # lease still live: the worker owns it
+    assert queue.enqueue(new_job("d1", "/raw/d1", "text", "d1.txt"))["state"] == "running"
+
+    queue.update(job["job_id"], lease_until=0.0)  # worker died, lease lapsed
+    assert queue.enqueue(new_job("d1", "/raw/d1", "text", "d1.txt"))["state"] == "queued"
+    assert queue.claim(timeout=0.1)["job_id"] == job["job_id"]
+    queue.update(job["job_id"], lease_until=0.0)
+    assert queue.recover() == 1
+    assert queue.get(job["job_id"])["state"] == "queued"
+
+
+def test_reupload_reuses_existing_extraction(tmp_path, monkeypatch):
+    import asyncio
+
+    import app.jobs as jobs
+    from app.manifest import Manifest
+
+    manifest = Manifest(tmp_path / "manifest.db")
+    norm = tmp_path / "normalized.txt"
+    norm.write_text("already extracted")
+    manifest.put_doc(
+        "d1", filename="a.txt", kind="txt", raw_path="/raw/a", normalized_path=str(norm)
+    )
+    extracted, indexed = [], []
+
+    async def extract_to_file(*args):
+        extracted.append(args)
+
+    async def index_text(doc_id, path, **kw):
+        indexed.append(path)
+        return {"chunks": 1}
+
+    monkeypatch.setattr(jobs, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(jobs, "extract_to_file", extract_to_file)
+    monkeypatch.setattr(jobs, "index_text", index_text)
+    queue = SQLiteJobQueue(tmp_path / "jobs.sqlite")
+    job = queue.enqueue(new_job("d1", "/raw/a2", "txt", "a.txt"))
+
+    async def run():
+        return await jobs.JobRunner(queue, workers=0).process(job)
+
+    assert asyncio.run(run()) == {"chunks": 1}
+    assert extracted == [] and indexed == [norm]
+    assert queue.get(job["job_id"])["stage"] == "index"
+    assert manifest.get_doc("d1")["n_chunks"] == 1
@@ -0,0 +1,36 @@
+import random
+
+import numpy as np
+
+from app.rerank import _mmr_reference, mmr, mmr_batch
+
+
+def _vecs(n, dim, seed):
+    rng = random.Random(seed)
+    return [[rng.gauss(0.0, 1.0) for _ in range(dim)] for _ in range(n)]
+
+
+def test_mmr_matches_reference_ordering():
+    for seed, n in [(1, 1), (2, 5), (3, 18), (4, 60)]:
+        q = _vecs(1, 32, seed + 100)[0]
+        cands = _vecs(n, 32, seed)
+        for k in (1, 3, 6, n + 2):
+            for lambd in (0.0, 0.5, 0.7, 1.0):
+                assert mmr(q, cands, k, lambd) == _mmr_reference(q, cands, k, lambd)
+
+
+def test_mmr_handles_duplicates_and_zero_vectors():
+    q = [1.0, 0.0]
+    cands = [[1.0, 0.0], [1.0, 0.0], [0.0, 0.0], [0.0, 1.0]]
+    assert mmr(q, cands, 4) == _mmr_reference(q, cands, 4)
+    assert mmr(q, [], 3) == []
+    assert mmr(q, cands, 0) == []
+
+
+def test_mmr_batch_shared_and_per_query_candidates():
+    qs = _vecs(3, 16, 7)
+    cands = _vecs(20, 16, 8)
+    shared = mmr_batch(qs, np.asarray(cands), k=5)
+    per_query = mmr_batch(qs, [cands, cands, []], k=5)
+    assert shared == [mmr(q, cands, 5) for q in qs]
+    assert per_query == [shared[0], shared[1], []]
@@ -0,0 +1,39 @@
+import asyncio
+
+from app.caching import RetrievalCache
+from app.manifest import Manifest
+
+
+def test_lru_roundtrip_is_copy_safe():
+    async def run():
+        cache = RetrievalCache(mem_items=2)
+        keys = [cache.key(0, f"q{i}", 6, {"rerank": "mmr"}) for i in range(3)]
+        assert await cache.get(keys[0]) is None
+
+        await cache.put(keys[0], {"matches": [{"doc_id": "a"}]})
+        hit = await cache.get(keys[0])
+        hit["matches"].clear()
+        assert await cache.get(keys[0]) == {"matches": [{"doc_id": "a"}]}
+
+        await cache.put(keys[1], {"matches": []})
+        await cache.put(keys[2], {"matches": []})
+        assert await cache.get(keys[0]) is None  # least recently used, evicted
+        return cache.stats()
+
+    st = asyncio.run(run())
+    assert (st["hits_mem"], st["misses"], st["mem_items"]) == (2, 2, 2)
+
+
+def test_generation_is_part_of_the_key(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.db")
+    g0 = manifest.generation()
+    assert manifest.bump_generation() == g0 + 1
+    assert Manifest(tmp_path / "manifest.db").generation() == g0 + 1
+
+    params = {"rerank": ["mmr", 6, 0.7]}
+    assert RetrievalCache.key(g0, "pto policy", 6, params) != RetrievalCache.key(
+        g0 + 1, "pto policy", 6, params
+    )
+    assert RetrievalCache.key(g0, "pto policy", 6, params) != RetrievalCache.key(
+        g0, "pto policy", 5, params
+    )
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import AsyncOpenAI
+
+from app.streaming import stream_answer, stream_tokens
+
+
+class _FakeChat(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions with stream=True: one SSE chunk per word, `delay` apart."""
+
+    protocol_version = "HTTP/1.1"
+    words = ["Hello", " world", "!"]
+    delay = 0.0
+    first_delay = 0.0
+    state: dict = {}
+
+    def do_POST(self):
+        json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        cls = type(self)
+        time.sleep(cls.first_delay)
+        try:
+            for i, w in enumerate(cls.words):
+                chunk = {
+                    "id": "c1",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": "fake",
+                    "choices": [{"index": 0, "delta": {"content": w}, "finish_reason": None}],
+                }
+                self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                cls.state["sent"] = i + 1
+                time.sleep(cls.delay)
+            self._chunk("data: [DONE]\n\n")
+            self._chunk("")
+        except (BrokenPipeError, ConnectionResetError):
+            cls.state["disconnected"] = True
+
+    def _chunk(self, text):
+        raw = text.encode()
+        self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chat_server():
+    _FakeChat.words = ["Hello", " world", "!"]
+    _FakeChat.delay = 0.0
+    _FakeChat.first_delay = 0.0
+    _FakeChat.state = {}
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _FakeChat)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    client = AsyncOpenAI(api_key="test", base_url=f"http://127.0.0.1:{srv.server_address[1]}/v1")
+    yield client
+    srv.shutdown()
+
+
+async def test_tokens_then_end_with_ttft(chat_server):
+    lines = [line async for line in stream_answer("q", [], client=chat_server)]
+    tokens = [json.loads(x[6:])["content"] for x in lines if x.startswith('data: {"type"')]
+    assert tokens == ["Hello", " world", "!"]
+    assert lines[0].startswith("event: start")
+    end = json.loads(lines[-1].split("data: ", 1)[1])
+    assert end["chunks"] == 3 and end["ttft_ms"] is not None and not end["cancelled"]
+
+
+async def test_heartbeats_while_upstream_is_silent(chat_server):
+    _FakeChat.first_delay = 0.3
+    stats: dict = {}
+    out = [t async for t in stream_tokens([], stats, client=chat_server, heartbeat_s=0.05)]
+    assert out[0] is None and out.count(None) >= 3
+    assert [t for t in out if t] == ["Hello", " world", "!"]
+    assert stats["ttft_ms"] >= 300
+
+
+async def test_closing_the_stream_cancels_upstream(chat_server):
+    _FakeChat.words = [f"w{i} " for i in range(200)]
+    _FakeChat.delay = 0.01
+    stats: dict = {}
+    gen = stream_tokens([], stats, client=chat_server, queue_size=2)
+    assert await gen.__anext__() == "w0 "
+    await gen.aclose()
+    assert stats["cancelled"]
+    for _ in range(100):
+        if _FakeChat.state.get("disconnected"):
+            break
+        await asyncio.sleep(0.02)
+    assert _FakeChat.state.get("disconnected")
+    assert _FakeChat.state["sent"] < 200
+
+
+async def test_many_concurrent_streams(chat_server):
+    _FakeChat.delay = 0.01
+
+    async def one():
+        return [t async for t in stream_tokens([], {}, client=chat_server)]
+
+    outs = await asyncio.gather(*(one() for _ in range(100)))
+    assert all(o == ["Hello", " world", "!"] for o in outs)
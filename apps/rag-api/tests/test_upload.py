@@ -0,0 +1,32 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+from app import main
+from app.config import settings
+
+
+def test_declared_oversize_upload_is_refused_up_front(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_MB", 0)
+    body = b"x" * (main.UPLOAD_OVERHEAD_BYTES + 1024)
+    resp = TestClient(main.app).post("/ingest", files={"file": ("a.txt", body, "text/plain")})
+    assert resp.status_code == 413
+
+
+def test_save_upload_streams_and_caps(monkeypatch, tmp_path):
+    data = b"hello upload" * 1000
+    dest, doc_id, size = asyncio.run(
+        main._save_upload(UploadFile(io.BytesIO(data), filename="a.TXT"), tmp_path)
+    )
+    assert doc_id == hashlib.sha256(data).hexdigest() and size == len(data)
+    assert dest == tmp_path / f"{doc_id}.txt" and dest.read_bytes() == data
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_MB", 0)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(main._save_upload(UploadFile(io.BytesIO(data), filename="b.txt"), tmp_path))
+    assert e.value.status_code == 413
+    assert sorted(p.name for p in tmp_path.iterdir()) == [dest.name]  # no partial file left
@@ -45,19 +45,26 @@ export default function Chat() {
       }
     };
 
-    es.addEventListener("end", async () => {
+    es.addEventListener("end", async (ev) => {
       es.close();
       controller.current = null;
-      // Optional: fetch citations via non-stream endpoint (uses same retrieval)
       try {
-        const resp = await fetch("http://localhost:8000/generate", {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ query: q, top_k: 6 })
-        });
-        if (resp.ok) {
-          const json = await resp.json();
-          const cites = (json.citations || []) as { n: number; source_path?: string }[];
+        // the end event carries the citations; older servers need the non-stream endpoint
+        let cites: { n: number; source_path?: string }[] | undefined;
+        try {
+          cites = JSON.parse((ev as MessageEvent).data).citations;
+        } catch {
+          cites = undefined;
+        }
+        if (!cites) {
+          const resp = await fetch("http://localhost:8000/generate", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ query: q, top_k: 6 })
+          });
+          cites = resp.ok ? (((await resp.json()).citations || []) as typeof cites) : undefined;
+        }
+        if (cites) {
           setMsgs((m) => {
             const last = m[m.length - 1];
             const updated = [...m];
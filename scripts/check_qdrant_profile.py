@@ -0,0 +1,75 @@
+# type: ignore
+"""
+Recall and memory check for a Qdrant collection profile (QDRANT_PROFILE).
+
+Samples stored points, uses their vectors as queries and compares the top-k returned with
+the collection's search settings (quantized search, oversampling, rescoring) against an
+exact full-precision scan. Prints recall@k and the approximate vector memory footprint.
+
+    QDRANT_URL=http://localhost:6333 QDRANT_COLLECTION=rag_docs \
+        QDRANT_QUANT_OVERSAMPLING=2.0 python scripts/check_qdrant_profile.py
+"""
+import os
+import random
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qm
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+COLLECTION = os.getenv("QDRANT_COLLECTION", "rag_docs")
+SAMPLES = int(os.getenv("SAMPLES", "200"))
+TOP_K = int(os.getenv("TOP_K", "10"))
+OVERSAMPLING = float(os.getenv("QDRANT_QUANT_OVERSAMPLING", "2.0"))
+RESCORE = os.getenv("QDRANT_QUANT_RESCORE", "true").lower() in ("1", "true", "yes")
+HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "0")) or None
+
+
+def sample_vectors(client, n):
+    points, _ = client.scroll(COLLECTION, limit=max(n * 5, 1000), with_vectors=True)
+    random.shuffle(points)
+    return [p.vector for p in points[:n]]
+
+
+def top_ids(client, vec, params):
+    res = client.query_points(COLLECTION, query=vec, limit=TOP_K, search_params=params)
+    return {p.id for p in res.points}
+
+
+def vector_memory(info):
+    # bytes of float32 originals and of the quantized copy
+    vec = info.config.params.vectors
+    n = info.points_count or 0
+    original = n * vec.size * 4
+    quant = info.config.quantization_config
+    if isinstance(quant, qm.ScalarQuantization):
+        quantized = n * vec.size
+    elif isinstance(quant, qm.BinaryQuantization):
+        quantized = n * vec.size // 8
+    else:
+        quantized = 0
+    return original, bool(vec.on_disk), quantized
+
+
+if __name__ == "__main__":
+    client = QdrantClient(url=QDRANT_URL)
+    info = client.get_collection(COLLECTION)
+    exact = qm.SearchParams(exact=True, quantization=qm.QuantizationSearchParams(ignore=True))
+    configured = qm.SearchParams(
+        hnsw_ef=HNSW_EF,
+        quantization=qm.QuantizationSearchParams(rescore=RESCORE, oversampling=OVERSAMPLING),
+    )
+
+    queries = sample_vectors(client, SAMPLES)
+    found = total = 0
+    for vec in queries:
+        truth = top_ids(client, vec, exact)
+        found += len(truth & top_ids(client, vec, configured))
+        total += len(truth)
+    print(f"recall@{TOP_K} over {len(queries)} queries: {found / max(total, 1):.4f}")
+
+    original, on_disk, quantized = vector_memory(info)
+    mb = 1024 * 1024
+    where = "disk (mmap)" if on_disk else "RAM"
+    print(f"original vectors: {original / mb:.1f} MiB in {where}")
+    if quantized:
+        print(f"quantized vectors: {quantized / mb:.1f} MiB")